@@ -0,0 +1,287 @@
+"""
+ホットパスのベンチマーク
+
+太陽計算・可視性判定・レスポンスのJSON化・/api/today-forecast をプロセス内で計測し、JSONで保存する。
+上流（OpenWeatherMap）はモックに差し替えるので、APIキーもネットワークも不要。
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.hot_paths --out bench.json
+    python -m benchmarks.hot_paths --baseline bench.json --threshold 0.15
+
+--baseline を指定すると中央値を比較し、threshold（割合）を超えて遅くなった項目が
+あれば終了コード 1 で終わる。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+# 主要都市（サンセット時のアクセスはほぼこの周辺に集中する）
+CITIES = [
+    (43.0618, 141.3545),  # 札幌
+    (38.2682, 140.8694),  # 仙台
+    (35.6762, 139.6503),  # 東京
+    (35.4437, 139.6380),  # 横浜
+    (35.1815, 136.9066),  # 名古屋
+    (35.0116, 135.7681),  # 京都
+    (34.6937, 135.5023),  # 大阪
+    (34.6901, 135.1955),  # 神戸
+    (34.3853, 132.4553),  # 広島
+    (33.5904, 130.4017),  # 福岡
+    (31.5966, 130.5571),  # 鹿児島
+    (26.2124, 127.6809),  # 那覇
+]
+
+CONDITIONS = [
+    ("Clear", "晴天"),
+    ("Clouds", "薄い雲"),
+    ("Clouds", "曇りがち"),
+    ("Rain", "小雨"),
+    ("Mist", "霧"),
+]
+
+
+def make_locations(count: int, seed: int = 0) -> List[tuple]:
+    """都市中心から数km以内に散らばった地点を作る"""
+    rng = random.Random(seed)
+    return [
+        (lat + rng.gauss(0, 0.03), lng + rng.gauss(0, 0.03))
+        for lat, lng in (rng.choice(CITIES) for _ in range(count))
+    ]
+
+
+def make_weather(latitude: float, longitude: float, rng: random.Random) -> Dict[str, Any]:
+    """OpenWeatherMap /data/2.5/weather と同じ形のデータを作る"""
+    main, description = rng.choice(CONDITIONS)
+    return {
+        "coord": {"lon": longitude, "lat": latitude},
+        "weather": [{"id": 800, "main": main, "description": description, "icon": "01d"}],
+        "main": {
+            "temp": round(rng.uniform(5, 30), 1),
+            "feels_like": round(rng.uniform(5, 30), 1),
+            "humidity": rng.randint(20, 100),
+            "pressure": rng.randint(995, 1030)
+        },
+        "visibility": rng.choice([10000, 10000, 8000, 6000, 3000]),
+        "wind": {"speed": round(rng.uniform(0, 10), 1), "deg": rng.randint(0, 359)},
+        "clouds": {"all": rng.randint(0, 100)},
+        "dt": int(time.time()),
+        "sys": {"country": "JP", "sunrise": int(time.time()) - 30000, "sunset": int(time.time()) + 10000},
+        "name": "Skyle"
+    }
+
+
+def mock_upstream_transport(latency: float = 0.0) -> httpx.MockTransport:
+    """OpenWeatherMap のモック。latency 秒待ってから応答する"""
+    rng = random.Random(1)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if latency:
+            await asyncio.sleep(latency)
+        lat = float(request.url.params.get("lat", 35.0))
+        lon = float(request.url.params.get("lon", 135.0))
+        return httpx.Response(200, json=make_weather(lat, lon, rng))
+
+    return httpx.MockTransport(handler)
+
+
+def time_per_call(func: Callable[[Any], Any], inputs: List[Any], repeat: int = 5) -> Dict[str, float]:
+    """inputs を順に処理する時間を repeat 回計り、1回あたりのマイクロ秒を返す"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            func(item)
+        samples.append((time.perf_counter() - start) / len(inputs) * 1e6)
+    median = statistics.median(samples)
+    return {
+        "unit": "us/op",
+        "median": median,
+        "min": min(samples),
+        "ops_per_sec": 1e6 / median if median else 0.0
+    }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def measure_endpoint(
+    app,
+    path: str,
+    locations: List[tuple],
+    concurrency: int
+) -> Dict[str, float]:
+    """ASGIアプリを直接叩いてレイテンシの分布とスループットを測る"""
+    latencies: List[float] = []
+    queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+    for location in locations:
+        queue.put_nowait(location)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                lat, lng = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path, params={"lat": lat, "lng": lng})
+                latencies.append((time.perf_counter() - start) * 1e6)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} returned {response.status_code}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "unit": "us/op",
+        "median": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "ops_per_sec": len(latencies) / elapsed
+    }
+
+
+def run_benchmarks(size: int = 2000) -> Dict[str, Dict[str, float]]:
+    import main
+    app = main.create_app()
+    # 上流はモックなので、呼び出し上限のスケジューラーは通さない
+    main.weather_service.scheduler = None
+    from services.http_client import open_http_client, close_http_client
+    from utils.visibility import calculate_visibility_score, calculate_halo_visibility
+
+    rng = random.Random(0)
+    locations = make_locations(size)
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    solar_inputs = [(lat, lng, base + timedelta(days=rng.randrange(365))) for lat, lng in locations]
+    weather_inputs = [make_weather(lat, lng, rng) for lat, lng in locations]
+    today = datetime.now(timezone(timedelta(hours=9))).date()
+
+    results = {}
+    results["solar_service.calculate_solar_times"] = time_per_call(
+        lambda args: main.get_solar_service()._calculate_solar_times(*args), solar_inputs
+    )
+    results["solar_service.calculate_solar_times_batch[%d]" % size] = time_per_call(
+        lambda args: main.get_solar_service().calculate_solar_times_batch(*zip(*args)), [solar_inputs]
+    )
+    results["%s.sun" % main.solar_backend.name] = time_per_call(
+        lambda args: main._compute_sun(args[0], args[1], today), locations
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.solar_cache.clear()
+        results["get_solar_times"] = time_per_call(
+            lambda args: main.get_solar_times(*args, if_none_match=None), locations
+        )
+    results["calculate_visibility_score"] = time_per_call(calculate_visibility_score, weather_inputs)
+    results["calculate_halo_visibility"] = time_per_call(calculate_halo_visibility, weather_inputs)
+
+    # レスポンスのJSON化：FastAPI の既定の経路（jsonable_encoder + json.dumps）と FastJSONResponse
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from services.weather_cache import WeatherTile
+    from utils.json_response import FastJSONResponse
+
+    now = time.time()
+    forecast_inputs = []
+    for index, ((lat, lng), weather) in enumerate(zip(locations, weather_inputs)):
+        tile = WeatherTile("bench%d" % index, lat, lng, weather, now)
+        forecast_inputs.append(main.build_today_forecast(tile, lat, lng))
+    legacy_forecasts = [forecast.model_dump(mode="json") for forecast in forecast_inputs]
+    results["serialize.today_forecast.jsonable_encoder"] = time_per_call(
+        lambda payload: JSONResponse(jsonable_encoder(payload)), legacy_forecasts
+    )
+    results["serialize.today_forecast.fast"] = time_per_call(FastJSONResponse, forecast_inputs)
+
+    batch = main.get_solar_service().calculate_solar_times_batch(*zip(*solar_inputs))
+    results["serialize.solar_batch[%d].response_model" % size] = time_per_call(
+        lambda payload: JSONResponse(jsonable_encoder(main.SolarBatchResponse(count=len(payload), results=payload))),
+        [batch], repeat=3
+    )
+    results["serialize.solar_batch[%d].fast" % size] = time_per_call(
+        lambda payload: FastJSONResponse({"count": len(payload), "results": payload}), [batch], repeat=3
+    )
+
+    async def endpoint_benchmarks():
+        main.weather_service.api_key = main.weather_service.api_key or "benchmark"
+        await open_http_client(transport=mock_upstream_transport())
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.weather_cache.clear()
+                main.solar_cache.clear()
+                results["today_forecast.cold"] = await measure_endpoint(
+                    app, "/api/today-forecast", locations[:500], concurrency=16
+                )
+                results["today_forecast.warm"] = await measure_endpoint(
+                    app, "/api/today-forecast", locations, concurrency=16
+                )
+        finally:
+            await close_http_client()
+
+    asyncio.run(endpoint_benchmarks())
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """中央値が baseline より threshold 以上遅くなった項目を返す"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None or not previous.get("median"):
+            continue
+        ratio = current["median"] / previous["median"]
+        marker = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            marker = "  <-- regression"
+        print(f"{name:55s} {previous['median']:12.2f} -> {current['median']:12.2f} us  ({ratio:5.2f}x){marker}")
+    return regressions
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="Skyle バックエンドのホットパスを計測する")
+    parser.add_argument("--size", type=int, default=2000, help="入力セットの件数")
+    parser.add_argument("--out", help="結果を書き出すJSONファイル")
+    parser.add_argument("--baseline", help="比較するJSONファイル")
+    parser.add_argument("--threshold", type=float, default=0.15, help="許容する悪化の割合（0.15 = 15%%）")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.size)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "size": args.size
+        },
+        "results": results
+    }
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)}件の項目が{args.threshold:.0%}以上遅くなりました: {', '.join(regressions)}")
+            return 1
+    else:
+        for name, result in results.items():
+            print(f"{name:55s} {result['median']:12.2f} us/op  {result['ops_per_sec']:12.1f} ops/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,132 @@
+"""
+起動時間の予算チェック
+
+新しいプロセスで次の3つを計り（repeat 回の中央値）、予算を超えたら終了コード 1 で終わる。
+
+    fastapi      import fastapi だけ（フレームワーク自体の下限）
+    import       import main
+    create_app   main.create_app()（.env・ログ・キャッシュとサービスの生成）
+
+import main の予算は fastapi との差で見るので、マシンの速さにあまり左右されない。
+あわせて、import main の時点で NumPy・astral・dotenv が、create_app() の後に NumPy が
+読み込まれていないこと（遅延 import が崩れていないこと）を確かめる。
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.import_time
+    python -m pytest -q -m slow tests/test_import_time.py   # 同じ確認を既定の予算で
+    python -m benchmarks.import_time --import-budget 200 --create-budget 100 --out import_time.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# import main の時点で読み込まれていてはいけないモジュール
+LAZY_ON_IMPORT = ("numpy", "astral", "dotenv")
+# create_app() の後でも読み込まれていてはいけないモジュール（既定の SOLAR_BACKEND=astral）
+LAZY_ON_CREATE = ("numpy",)
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import fastapi
+fastapi_ms = (time.perf_counter() - start) * 1000
+if sys.argv[1] == "fastapi":
+    print(json.dumps({"fastapi": fastapi_ms}))
+    raise SystemExit
+start = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - start) * 1000
+after_import = sorted(m for m in sys.argv[2].split(",") if m in sys.modules)
+start = time.perf_counter()
+main.create_app()
+create_ms = (time.perf_counter() - start) * 1000
+after_create = sorted(m for m in sys.argv[2].split(",") if m in sys.modules)
+print(json.dumps({
+    "fastapi": fastapi_ms, "import": import_ms, "create_app": create_ms,
+    "after_import": after_import, "after_create": after_create
+}))
+"""
+
+
+def probe(stage: str) -> Dict[str, Any]:
+    """新しいインタプリタで計測する（モジュールのキャッシュを引き継がない）"""
+    env = dict(os.environ)
+    # 計測中にDBやファイルを作らない
+    env.setdefault("OBSERVATION_STORE", "off")
+    env.setdefault("SOLAR_BACKEND", "astral")
+    modules = ",".join(sorted(set(LAZY_ON_IMPORT + LAZY_ON_CREATE)))
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE, stage, modules],
+        capture_output=True, text=True, env=env, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(repeat: int) -> Dict[str, Any]:
+    # fastapi だけのプロセスと main まで読むプロセスを交互に起動する
+    baseline: List[float] = []
+    samples: List[Dict[str, Any]] = []
+    for _ in range(repeat):
+        baseline.append(probe("fastapi")["fastapi"])
+        samples.append(probe("main"))
+
+    fastapi_ms = statistics.median(baseline)
+    # import main は fastapi の import を含むので、fastapi だけのプロセスとの差を予算と比べる
+    import_ms = statistics.median(sample["fastapi"] + sample["import"] for sample in samples)
+    return {
+        "fastapi_ms": fastapi_ms,
+        "import_ms": import_ms,
+        "import_overhead_ms": import_ms - fastapi_ms,
+        "create_app_ms": statistics.median(sample["create_app"] for sample in samples),
+        "loaded_after_import": samples[-1]["after_import"],
+        "loaded_after_create_app": samples[-1]["after_create"]
+    }
+
+
+def check(report: Dict[str, Any], import_budget: float, create_budget: float) -> List[str]:
+    """予算超過と、読み込まれていてはいけないモジュールを文字列のリストで返す（空なら合格）"""
+    failures = []
+    if report["import_overhead_ms"] > import_budget:
+        failures.append(f"import main が予算を超えました（+{report['import_overhead_ms']:.1f} ms > {import_budget:g} ms）")
+    if report["create_app_ms"] > create_budget:
+        failures.append(f"create_app() が予算を超えました（{report['create_app_ms']:.1f} ms > {create_budget:g} ms）")
+    eager = [m for m in report["loaded_after_import"] if m in LAZY_ON_IMPORT]
+    if eager:
+        failures.append(f"import main で読み込まれています: {', '.join(eager)}")
+    eager = [m for m in report["loaded_after_create_app"] if m in LAZY_ON_CREATE]
+    if eager:
+        failures.append(f"create_app() の後に読み込まれています: {', '.join(eager)}")
+    return failures
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="import main と create_app() にかかる時間を計る")
+    parser.add_argument("--repeat", type=int, default=5, help="計測するプロセス数")
+    parser.add_argument("--import-budget", type=float, default=200, help="import main が fastapi より余計にかかってよい時間（ms）")
+    parser.add_argument("--create-budget", type=float, default=100, help="create_app() にかかってよい時間（ms）")
+    parser.add_argument("--out", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    print(f"import fastapi                {report['fastapi_ms']:8.1f} ms")
+    print(f"import main                   {report['import_ms']:8.1f} ms  (+{report['import_overhead_ms']:.1f} ms)")
+    print(f"create_app()                  {report['create_app_ms']:8.1f} ms")
+
+    failures = check(report, args.import_budget, args.create_budget)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({**report, "failures": failures}, f, indent=2, ensure_ascii=False)
+
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
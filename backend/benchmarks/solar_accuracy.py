@@ -0,0 +1,197 @@
+"""
+太陽時刻の計算方式（services/solar_backends.py）の精度と速度の比較
+
+各方式の結果を、高精度の太陽位置（Meeus『天文計算』25章の高精度式: 章動・光行差・
+真の黄道傾斜、12章の恒星時、ΔT補正）から求めた高度が目標値になる時刻と比べる。
+目標高度は一般的な定義（日の出・日の入 -0.833°、市民薄明 -6°、南中は時角0）。
+基準は各方式の値を初期値にニュートン法で解くので、日付の解釈の違いに左右されない。
+基準自体の誤差は数秒程度。
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.solar_accuracy
+    python -m benchmarks.solar_accuracy --lat-min 20 --lat-max 46 --lng-min 122 --lng-max 154 --step 1
+    python -m benchmarks.solar_accuracy --ephemeris solar_ephemeris.bin --budget 60 --out accuracy.json
+
+--budget（秒）を指定すると、全イベントの p99 誤差が予算内の方式のうち最も速いものを示す。
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.ephemeris import load_ephemeris
+from services.solar_backends import SolarBackend, create_solar_backend
+from services.solar_service import SolarService
+
+_UNIX_EPOCH_JD = 2440587.5
+# 2026年ごろの ΔT（TT - UT, 秒）
+DELTA_T = 69.2
+# 目標高度（度）。noon は南中（時角0）
+EVENT_ALTITUDES = {"dawn": -6.0, "sunrise": -0.833, "noon": None, "sunset": -0.833, "dusk": -6.0}
+
+
+def sun_equatorial(julian_day: np.ndarray):
+    """視赤経・視赤緯（ラジアン）"""
+    t = (julian_day + DELTA_T / 86400 - 2451545.0) / 36525
+    l0 = 280.46646 + 36000.76983 * t + 0.0003032 * t ** 2
+    m = np.radians(357.52911 + 35999.05029 * t - 0.0001537 * t ** 2)
+    c = ((1.914602 - 0.004817 * t - 0.000014 * t ** 2) * np.sin(m)
+         + (0.019993 - 0.000101 * t) * np.sin(2 * m)
+         + 0.000289 * np.sin(3 * m))
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_longitude = np.radians(l0 + c - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliquity = 23 + (26 + (21.448 - t * (46.8150 + t * (0.00059 - t * 0.001813))) / 60) / 60
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+    right_ascension = np.arctan2(np.cos(obliquity) * np.sin(apparent_longitude), np.cos(apparent_longitude))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_longitude))
+    return right_ascension, declination
+
+
+def hour_angle_and_altitude(julian_day: np.ndarray, lat: np.ndarray, lon: np.ndarray):
+    """時角（-180〜180度）と高度（度）"""
+    right_ascension, declination = sun_equatorial(julian_day)
+    t = (julian_day - 2451545.0) / 36525
+    gmst = 280.46061837 + 360.98564736629 * (julian_day - 2451545.0) + 0.000387933 * t ** 2 - t ** 3 / 38710000
+    hour_angle = (gmst + lon - np.degrees(right_ascension) + 180) % 360 - 180
+    lat_rad = np.radians(lat)
+    altitude = np.degrees(np.arcsin(
+        np.sin(lat_rad) * np.sin(declination)
+        + np.cos(lat_rad) * np.cos(declination) * np.cos(np.radians(hour_angle))
+    ))
+    return hour_angle, altitude, declination
+
+
+def reference_event(guess: np.ndarray, lat: np.ndarray, lon: np.ndarray, target: Optional[float]):
+    """guess（ユリウス日）から基準時刻を解く。収束しなかった要素は NaN"""
+    julian_day = guess.copy()
+    lat_rad = np.radians(lat)
+    for _ in range(8):
+        hour_angle, altitude, declination = hour_angle_and_altitude(julian_day, lat, lon)
+        if target is None:
+            step = -hour_angle / 360.985647
+        else:
+            rate = 360.985647 * np.cos(declination) * np.cos(lat_rad) * np.sin(np.radians(hour_angle))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                step = (altitude - target) / rate
+        step = np.clip(np.nan_to_num(step, nan=0.0), -0.1, 0.1)
+        julian_day = julian_day + step
+    hour_angle, altitude, _ = hour_angle_and_altitude(julian_day, lat, lon)
+    residual = np.abs(hour_angle) if target is None else np.abs(altitude - target)
+    return np.where(residual < 1e-4, julian_day, np.nan)
+
+
+def make_inputs(args) -> List[tuple]:
+    lats = np.arange(args.lat_min, args.lat_max + args.step / 2, args.step)
+    lngs = np.arange(args.lng_min, args.lng_max + args.step / 2, args.lng_step or args.step)
+    days = [args.start + timedelta(days=i) for i in range(0, args.days, args.day_step)]
+    return [(float(lat), float(lng), day) for day in days for lat in lats for lng in lngs]
+
+
+def evaluate(backend: SolarBackend, inputs: List[tuple]) -> Dict[str, object]:
+    computed = {key: np.full(len(inputs), np.nan) for key in EVENT_ALTITUDES}
+    unavailable = 0
+    start = time.perf_counter()
+    for i, (lat, lng, day) in enumerate(inputs):
+        try:
+            s = backend.sun(lat, lng, day)
+        except ValueError:
+            unavailable += 1
+            continue
+        for key in EVENT_ALTITUDES:
+            computed[key][i] = s[key].timestamp() / 86400 + _UNIX_EPOCH_JD
+    elapsed = time.perf_counter() - start
+
+    lat = np.array([item[0] for item in inputs])
+    lng = np.array([item[1] for item in inputs])
+    events = {}
+    for key, target in EVENT_ALTITUDES.items():
+        values = computed[key]
+        valid = ~np.isnan(values)
+        reference = reference_event(values[valid], lat[valid], lng[valid], target)
+        error = (values[valid] - reference) * 86400
+        error = error[~np.isnan(error)]
+        if not len(error):
+            continue
+        magnitude = np.abs(error)
+        events[key] = {
+            "samples": int(len(error)),
+            "bias": float(error.mean()),
+            "p50": float(np.percentile(magnitude, 50)),
+            "p95": float(np.percentile(magnitude, 95)),
+            "p99": float(np.percentile(magnitude, 99)),
+            "max": float(magnitude.max()),
+        }
+
+    return {
+        "us_per_call": elapsed / len(inputs) * 1e6,
+        "calls_per_sec": len(inputs) / elapsed,
+        "unavailable": unavailable,
+        "error_seconds": events,
+    }
+
+
+def choose_backend(report: Dict[str, Dict[str, object]], budget: float) -> Optional[str]:
+    """全イベントの p99 が budget 秒以内の方式のうち最速のもの"""
+    candidates = [
+        (result["us_per_call"], name) for name, result in report.items()
+        if result["error_seconds"] and all(e["p99"] <= budget for e in result["error_seconds"].values())
+    ]
+    return min(candidates)[1] if candidates else None
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="太陽時刻の計算方式の精度と速度を比べる")
+    parser.add_argument("--backends", default="astral,formula,ephemeris")
+    parser.add_argument("--ephemeris", help="ephemeris 方式で使うテーブル（未指定なら ephemeris は省略）")
+    parser.add_argument("--lat-min", type=float, default=-60)
+    parser.add_argument("--lat-max", type=float, default=60)
+    parser.add_argument("--lng-min", type=float, default=-180)
+    parser.add_argument("--lng-max", type=float, default=150)
+    parser.add_argument("--step", type=float, default=10, help="緯度の刻み（度）")
+    parser.add_argument("--lng-step", type=float, default=30, help="経度の刻み（度）")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2026, 1, 1))
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--day-step", type=int, default=1)
+    parser.add_argument("--budget", type=float, help="許容する p99 誤差（秒）")
+    parser.add_argument("--out", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    service = SolarService(ephemeris=load_ephemeris(args.ephemeris))
+    inputs = make_inputs(args)
+    report = {}
+    for name in args.backends.split(","):
+        if name == "ephemeris" and service.ephemeris is None:
+            continue
+        # 比較はUTCで行う（方式ごとの日付の解釈の違いは基準の解き方で吸収する）
+        report[name] = evaluate(create_solar_backend(name, lambda: service, tz_name="UTC"), inputs)
+
+    print(f"{len(inputs)}件（地点×日）")
+    for name, result in report.items():
+        print(f"\n{name}: {result['us_per_call']:.1f} us/call, {result['calls_per_sec']:.0f} calls/s, "
+              f"イベントなし {result['unavailable']}件")
+        for key, e in result["error_seconds"].items():
+            print(f"  {key:8s} bias {e['bias']:+8.1f}s  p50 {e['p50']:7.1f}s  p95 {e['p95']:7.1f}s  "
+                  f"p99 {e['p99']:7.1f}s  max {e['max']:7.1f}s")
+
+    chosen = None
+    if args.budget is not None:
+        chosen = choose_backend(report, args.budget)
+        print(f"\np99 {args.budget:g}秒以内で最速: {chosen or 'なし'}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "inputs": len(inputs),
+                "budget": args.budget,
+                "chosen": chosen,
+                "results": report
+            }, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
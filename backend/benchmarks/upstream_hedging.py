@@ -0,0 +1,97 @@
+"""
+ヘッジによる上流呼び出しのテールレイテンシの確認
+
+WeatherService を、ときどき極端に遅くなるモックの上流（対数正規分布 + tail_probability の確率で
+tail_ms の遅延）に向け、ヘッジなし・ありで同じ数の呼び出しを流して p50 / p99 / p999 を比べる。
+ヘッジありの p99 がヘッジなしより短くならなければ終了コード 1 で終わる。
+追加で出した呼び出しの割合（ヘッジ率）もあわせて表示する。
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.upstream_hedging
+    python -m benchmarks.upstream_hedging --calls 4000 --tail-probability 0.02 --tail-ms 800
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.hot_paths import make_weather, percentile
+
+
+def make_transport(latency_ms: float, sigma: float, tail_probability: float, tail_ms: float, seed: int) -> httpx.MockTransport:
+    rng = random.Random(seed)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        delay = latency_ms * math.exp(rng.gauss(0, sigma))
+        if rng.random() < tail_probability:
+            delay += tail_ms
+        await asyncio.sleep(delay / 1000)
+        lat = float(request.url.params["lat"])
+        lon = float(request.url.params["lon"])
+        return httpx.Response(200, json=make_weather(lat, lon, rng))
+
+    return httpx.MockTransport(handler)
+
+
+async def run(args: argparse.Namespace, hedge: bool) -> Dict[str, Any]:
+    from services import http_client
+    from services.weather_service import WeatherService
+
+    os.environ["OPENWEATHER_API_KEY"] = "bench"
+    os.environ["UPSTREAM_HEDGE_PERCENTILE"] = str(args.percentile if hedge else 0)
+    await http_client.open_http_client(make_transport(args.latency_ms, args.sigma, args.tail_probability, args.tail_ms, 0))
+    # 呼び出し上限とブレーカーは通さず、ヘッジの効果だけを見る
+    service = WeatherService()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+
+    async def call(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await service.fetch_current_weather(35 + i % 100 * 0.01, 139)
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(call(i) for i in range(args.calls)))
+    finally:
+        await http_client.close_http_client()
+    return {
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "hedge_rate": service.hedges / args.calls
+    }
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="ヘッジなし・ありで上流呼び出しのテールレイテンシを比べる")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--tail-probability", type=float, default=0.02)
+    parser.add_argument("--tail-ms", type=float, default=500)
+    parser.add_argument("--percentile", type=float, default=0.95, help="ヘッジを出すまでの待ち時間に使うパーセンタイル")
+    args = parser.parse_args()
+
+    results = {"no_hedge": asyncio.run(run(args, False)), "hedge": asyncio.run(run(args, True))}
+    for name, report in results.items():
+        print(
+            f"{name:10s} p50 {report['p50_ms']:7.1f} ms  p99 {report['p99_ms']:7.1f} ms  "
+            f"p999 {report['p999_ms']:7.1f} ms  hedge rate {report['hedge_rate']:.1%}"
+        )
+
+    if results["hedge"]["p99_ms"] >= results["no_hedge"]["p99_ms"]:
+        print("ヘッジで p99 が短くなっていません")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
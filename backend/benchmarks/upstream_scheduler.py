@@ -0,0 +1,102 @@
+"""
+上流スケジューラーの確認
+
+UpstreamScheduler に、呼び出し上限を超える BATCH の呼び出しと、少数の INTERACTIVE の
+呼び出しを同時に流し込む（上流は呼ばない）。次を満たさなければ終了コード 1 で終わる。
+
+    - 許可した呼び出しの数が上限（rate × 時間 + burst）を超えない
+    - 上限の 95% 以上を使い切っている（トークンを余らせていない）
+    - INTERACTIVE は1件も断られず、待ち時間の p95 がトークン数個分に収まる
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.upstream_scheduler
+    python -m benchmarks.upstream_scheduler --rate 1200 --duration 10 --batch-rate 60 --interactive-rate 5
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.hot_paths import percentile
+from services.upstream_scheduler import Priority, UpstreamRejected, UpstreamScheduler, upstream_priority
+
+
+async def simulate(rate: float, burst: int, duration: float, batch_rate: float, interactive_rate: float) -> Dict[str, Any]:
+    scheduler = UpstreamScheduler(rate_per_minute=rate, burst=burst, queue_limit=100000)
+    rng = random.Random(0)
+    waits: Dict[Priority, List[float]] = {Priority.INTERACTIVE: [], Priority.BATCH: []}
+    rejected = {Priority.INTERACTIVE: 0, Priority.BATCH: 0}
+    granted_at: List[float] = []
+    started = time.monotonic()
+
+    async def call(priority: Priority) -> None:
+        issued = time.monotonic()
+        with upstream_priority(priority):
+            try:
+                await scheduler.acquire()
+            except UpstreamRejected:
+                rejected[priority] += 1
+                return
+        now = time.monotonic()
+        granted_at.append(now - started)
+        waits[priority].append(now - issued)
+
+    async def generate(priority: Priority, per_second: float) -> None:
+        # ポアソン到着（オープンループ。許可を待たずに次を出す）
+        tasks = []
+        while time.monotonic() - started < duration:
+            tasks.append(asyncio.ensure_future(call(priority)))
+            await asyncio.sleep(rng.expovariate(per_second))
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(
+        generate(Priority.BATCH, batch_rate),
+        generate(Priority.INTERACTIVE, interactive_rate)
+    )
+    in_window = sum(1 for t in granted_at if t <= duration)
+    return {
+        "allowed": rate / 60 * duration + burst,
+        "granted_in_window": in_window,
+        "utilization": in_window / (rate / 60 * duration + burst),
+        "interactive_calls": len(waits[Priority.INTERACTIVE]) + rejected[Priority.INTERACTIVE],
+        "interactive_rejected": rejected[Priority.INTERACTIVE],
+        "interactive_wait_p95_ms": percentile(waits[Priority.INTERACTIVE], 0.95) * 1000 if waits[Priority.INTERACTIVE] else 0.0,
+        "batch_granted": len(waits[Priority.BATCH]),
+        "batch_rejected": rejected[Priority.BATCH],
+        "batch_wait_p95_ms": percentile(waits[Priority.BATCH], 0.95) * 1000 if waits[Priority.BATCH] else 0.0
+    }
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="クォータ内でのスループットと INTERACTIVE の待ち時間を確かめる")
+    parser.add_argument("--rate", type=float, default=600, help="1分あたりの上限")
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=6, help="流し込む秒数")
+    parser.add_argument("--batch-rate", type=float, default=30, help="BATCH の到着（1秒あたり）")
+    parser.add_argument("--interactive-rate", type=float, default=3, help="INTERACTIVE の到着（1秒あたり）")
+    args = parser.parse_args()
+
+    report = asyncio.run(simulate(args.rate, args.burst, args.duration, args.batch_rate, args.interactive_rate))
+    for name, value in report.items():
+        print(f"{name:26s} {value:10.2f}" if isinstance(value, float) else f"{name:26s} {value:10d}")
+
+    failures = []
+    if report["granted_in_window"] > report["allowed"]:
+        failures.append("呼び出し上限を超えて許可しました")
+    if report["utilization"] < 0.95:
+        failures.append(f"上限を使い切れていません（{report['utilization']:.0%}）")
+    if report["interactive_rejected"]:
+        failures.append(f"INTERACTIVE が断られました（{report['interactive_rejected']} 件）")
+    # 自分より前に並ぶのは INTERACTIVE だけなので、トークン数個分で許可が出るはず
+    budget_ms = 3 * 60 / args.rate * 1000
+    if report["interactive_wait_p95_ms"] > budget_ms:
+        failures.append(f"INTERACTIVE の待ち時間が長すぎます（p95 {report['interactive_wait_p95_ms']:.0f} ms > {budget_ms:.0f} ms）")
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,142 @@
+"""
+Skyle API の負荷生成ツール
+
+目標のリクエストレートでオープンループに（応答を待たずに）リクエストを送り、
+レイテンシのパーセンタイルを集計する。地点は主要都市にZipf分布で偏らせ、
+都市中心から数kmの範囲に散らす（サンセット時のアクセスの偏りを再現）。
+
+使い方（backend ディレクトリで実行）:
+    python -m loadtest.loadgen --url http://127.0.0.1:3001 --rate 200 --duration 60
+    python -m loadtest.loadgen --url http://127.0.0.1:3001 --rate 500 --ramp 30 --out result.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.hot_paths import CITIES, percentile
+
+
+def make_location_sampler(skew: float, jitter_km: float, seed: int):
+    """都市を Zipf(skew) で選び、中心から jitter_km 程度ずらした地点を返す関数を作る"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** skew for rank in range(len(CITIES))]
+    jitter_deg = jitter_km / 111
+
+    def sample() -> Tuple[float, float]:
+        lat, lng = rng.choices(CITIES, weights)[0]
+        return lat + rng.gauss(0, jitter_deg), lng + rng.gauss(0, jitter_deg)
+
+    return sample
+
+
+async def run_load(
+    url: str,
+    path: str,
+    rate: float,
+    duration: float,
+    ramp: float,
+    skew: float,
+    jitter_km: float,
+    max_inflight: int,
+    timeout: float,
+    seed: int
+) -> Dict[str, object]:
+    sample = make_location_sampler(skew, jitter_km, seed)
+    rng = random.Random(seed + 1)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    dropped = 0
+    inflight = set()
+
+    limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def one_request():
+            lat, lng = sample()
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, params={"lat": round(lat, 5), "lng": round(lng, 5)})
+                key = str(response.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[key] = statuses.get(key, 0) + 1
+
+        started = time.perf_counter()
+        next_at = started
+        while True:
+            elapsed = time.perf_counter() - started
+            if elapsed >= duration:
+                break
+            # ramp 秒かけて目標レートまで上げる。到着間隔はポアソン過程
+            current_rate = rate * min(1.0, (elapsed + 1e-9) / ramp) if ramp else rate
+            next_at += rng.expovariate(max(current_rate, 1e-3))
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if len(inflight) >= max_inflight:
+                # 相手が詰まっている間は送らずに数える（クライアント側で待ち行列を作らない）
+                dropped += 1
+                continue
+            task = asyncio.ensure_future(one_request())
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+
+        if inflight:
+            await asyncio.gather(*inflight)
+        total_time = time.perf_counter() - started
+
+    report = {
+        "target_rate": rate,
+        "duration": duration,
+        "requests": len(latencies),
+        "achieved_rate": len(latencies) / total_time if total_time else 0.0,
+        "dropped": dropped,
+        "statuses": statuses,
+    }
+    if latencies:
+        report["latency_ms"] = {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "p999": percentile(latencies, 0.999),
+            "max": max(latencies),
+        }
+    return report
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="Skyle API に一定レートで負荷をかける")
+    parser.add_argument("--url", default="http://127.0.0.1:3001")
+    parser.add_argument("--path", default="/api/today-forecast")
+    parser.add_argument("--rate", type=float, default=100, help="目標リクエスト数/秒")
+    parser.add_argument("--duration", type=float, default=30, help="秒")
+    parser.add_argument("--ramp", type=float, default=0, help="目標レートまで上げる秒数")
+    parser.add_argument("--skew", type=float, default=1.1, help="都市の偏り（Zipfの指数）")
+    parser.add_argument("--jitter-km", type=float, default=5, help="都市中心からのばらつき（km）")
+    parser.add_argument("--max-inflight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(
+        args.url, args.path, args.rate, args.duration, args.ramp,
+        args.skew, args.jitter_km, args.max_inflight, args.timeout, args.seed
+    ))
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
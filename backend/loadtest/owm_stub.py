@@ -0,0 +1,162 @@
+"""
+OpenWeatherMap のローカル代替サーバー（負荷試験用）
+
+/data/2.5/weather と /data/2.5/forecast を本物と同じ形で返す。
+レイテンシの分布・エラー率・レート制限を設定でき、本物のクォータを使わずに
+サンセット時のスパイクを再現できる。
+
+使い方（backend ディレクトリで実行）:
+    python -m loadtest.owm_stub --port 8090 --latency-ms 120 --latency-sigma 0.5 --error-rate 0.01 --rate-limit 600
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8090/data/2.5 OPENWEATHER_API_KEY=stub UPSTREAM_RATE_PER_MINUTE=600 uvicorn main:app --port 3001
+
+API側の UPSTREAM_RATE_PER_MINUTE（既定 60）をスタブの --rate-limit に合わせると、
+クォータ内での優先度付けと劣化運転を確かめられる。
+
+設定は OWM_STUB_* 環境変数でも指定できる（uvicorn loadtest.owm_stub:app で起動する場合）。
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from benchmarks.hot_paths import make_weather
+
+
+class StubConfig:
+    def __init__(self):
+        # レイテンシは対数正規分布（sigma=0 なら固定）。tail_probability の確率で tail_ms の遅延を足す
+        self.latency_ms = float(os.getenv("OWM_STUB_LATENCY_MS", "80"))
+        self.latency_sigma = float(os.getenv("OWM_STUB_LATENCY_SIGMA", "0.4"))
+        self.tail_probability = float(os.getenv("OWM_STUB_TAIL_PROBABILITY", "0.0"))
+        self.tail_ms = float(os.getenv("OWM_STUB_TAIL_MS", "2000"))
+        # 500 を返す確率
+        self.error_rate = float(os.getenv("OWM_STUB_ERROR_RATE", "0.0"))
+        # 1分あたりの呼び出し上限（0 なら無制限）。超えたら 429
+        self.rate_limit = float(os.getenv("OWM_STUB_RATE_LIMIT", "0"))
+
+
+config = StubConfig()
+app = FastAPI(title="OpenWeatherMap stub")
+_rng = random.Random()
+
+
+class _TokenBucket:
+    def __init__(self):
+        self.tokens = None
+        self.updated = time.monotonic()
+
+    def take(self, per_minute: float) -> bool:
+        now = time.monotonic()
+        if self.tokens is None:
+            self.tokens = per_minute
+        self.tokens = min(per_minute, self.tokens + (now - self.updated) * per_minute / 60)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+_bucket = _TokenBucket()
+stats = {"requests": 0, "rate_limited": 0, "errors": 0}
+
+
+async def _simulate() -> Optional[JSONResponse]:
+    """レイテンシを挟み、エラー・レート制限に当たった場合はそのレスポンスを返す"""
+    stats["requests"] += 1
+    if config.rate_limit and not _bucket.take(config.rate_limit):
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"cod": 429, "message": "Your account is temporary blocked due to exceeding of requests limitation of your subscription type."}
+        )
+
+    delay = config.latency_ms * math.exp(_rng.gauss(0, config.latency_sigma)) if config.latency_sigma else config.latency_ms
+    if config.tail_probability and _rng.random() < config.tail_probability:
+        delay += config.tail_ms
+    await asyncio.sleep(delay / 1000)
+
+    if config.error_rate and _rng.random() < config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"cod": 500, "message": "Internal error"})
+    return None
+
+
+def make_forecast(latitude: float, longitude: float, count: int) -> Dict[str, Any]:
+    """OpenWeatherMap /data/2.5/forecast と同じ形のデータを作る"""
+    start = int(time.time()) // 10800 * 10800 + 10800
+    slots = []
+    for i in range(count):
+        item = make_weather(latitude, longitude, _rng)
+        slot = {
+            "dt": start + i * 10800,
+            "main": item["main"],
+            "weather": item["weather"],
+            "clouds": item["clouds"],
+            "wind": item["wind"],
+            "visibility": item["visibility"],
+            "pop": round(_rng.random(), 2)
+        }
+        if item["weather"][0]["main"] == "Rain":
+            slot["rain"] = {"3h": round(_rng.uniform(0.1, 5), 2)}
+        slots.append(slot)
+    return {
+        "cod": "200",
+        "cnt": count,
+        "list": slots,
+        "city": {"name": "Skyle", "country": "JP", "coord": {"lat": latitude, "lon": longitude}}
+    }
+
+
+@app.get("/data/2.5/weather")
+async def weather(lat: float, lon: float, appid: str = "", units: str = "metric", lang: str = "en"):
+    failure = await _simulate()
+    if failure is not None:
+        return failure
+    return make_weather(lat, lon, _rng)
+
+
+@app.get("/data/2.5/forecast")
+async def forecast(lat: float, lon: float, appid: str = "", units: str = "metric", lang: str = "en", cnt: int = 40):
+    failure = await _simulate()
+    if failure is not None:
+        return failure
+    return make_forecast(lat, lon, min(cnt, 40))
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def _main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenWeatherMap のスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=config.latency_sigma)
+    parser.add_argument("--tail-probability", type=float, default=config.tail_probability)
+    parser.add_argument("--tail-ms", type=float, default=config.tail_ms)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--rate-limit", type=float, default=config.rate_limit, help="1分あたりの上限（0で無制限）")
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.latency_sigma = args.latency_sigma
+    config.tail_probability = args.tail_probability
+    config.tail_ms = args.tail_ms
+    config.error_rate = args.error_rate
+    config.rate_limit = args.rate_limit
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,164 @@
+"""
+ワーカー間の共有キャッシュの確認
+
+OpenWeatherMap のスタブと、uvicorn --workers N の Skyle API を起動し、
+K 個のタイルに同時にリクエストを送る。共有キャッシュ（SHARED_CACHE_PATH）が効いていれば、
+どのワーカーに振り分けられても上流への取得はタイルごとに1回になる。
+スタブの呼び出し回数が K でなければ終了コード 1 で終わる。
+
+--no-shared を付けると共有キャッシュなしで同じことをして、比較用の回数を表示する（判定はしない）。
+
+使い方（backend ディレクトリで実行）:
+    python -m loadtest.shared_cache_check
+    python -m loadtest.shared_cache_check --workers 4 --tiles 20 --requests-per-tile 16
+    python -m loadtest.shared_cache_check --no-shared
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} が起動しませんでした")
+        await asyncio.sleep(0.2)
+
+
+async def run_check(workers: int, tiles: int, requests_per_tile: int, latency_ms: float, shared: bool) -> Dict[str, Any]:
+    stub_port = free_port()
+    api_port = free_port()
+    cache_dir = tempfile.mkdtemp(prefix="skyle-shared-")
+    env = dict(os.environ)
+    env.update({
+        "OPENWEATHER_BASE_URL": f"http://127.0.0.1:{stub_port}/data/2.5",
+        "OPENWEATHER_API_KEY": "stub",
+        "OBSERVATION_STORE": "off",
+        "WARMUP_LOCATIONS": "",
+        # 呼び出し上限で断られないように（ここで見たいのはワーカー間の重複だけ）
+        "UPSTREAM_RATE_PER_MINUTE": "6000",
+        "UPSTREAM_BURST": "100",
+        "LOG_LEVEL": "WARNING"
+    })
+    env.pop("SHARED_CACHE_PATH", None)
+    if shared:
+        env["SHARED_CACHE_PATH"] = os.path.join(cache_dir, "weather.cache")
+
+    stub = start(
+        ["-m", "loadtest.owm_stub", "--port", str(stub_port), "--latency-ms", str(latency_ms), "--latency-sigma", "0"],
+        env
+    )
+    api = start(
+        ["-m", "uvicorn", "main:create_app", "--factory", "--workers", str(workers),
+         "--port", str(api_port), "--log-level", "warning"],
+        env
+    )
+    base = f"http://127.0.0.1:{api_port}"
+    try:
+        limits = httpx.Limits(max_connections=tiles * requests_per_tile)
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            await wait_ready(client, f"http://127.0.0.1:{stub_port}/stats")
+            await wait_ready(client, f"{base}/api/health")
+
+            # タイルは互いに十分離す（同じジオハッシュに入らないように）
+            locations = [(30 + (i % 10) * 0.7, 130 + (i // 10) * 0.7) for i in range(tiles)]
+            responses = await asyncio.gather(*(
+                client.get(f"{base}/api/today-forecast", params={"lat": lat, "lng": lng})
+                for lat, lng in locations
+                for _ in range(requests_per_tile)
+            ))
+            errors = sum(1 for response in responses if response.status_code != 200)
+
+            # 別々の接続で /api/health を叩き、応答したワーカーの統計を集める
+            caches: Dict[int, Dict[str, Any]] = {}
+            for _ in range(workers * 8):
+                async with httpx.AsyncClient(timeout=10) as probe:
+                    weather = (await probe.get(f"{base}/api/health")).json()["caches"]["weather"]
+                shared_stats = weather.get("shared")
+                if shared_stats is not None:
+                    caches[shared_stats["pid"]] = weather
+
+            upstream = (await client.get(f"http://127.0.0.1:{stub_port}/stats")).json()["requests"]
+    finally:
+        stop(api)
+        stop(stub)
+        for name in os.listdir(cache_dir):
+            os.remove(os.path.join(cache_dir, name))
+        os.rmdir(cache_dir)
+
+    return {
+        "workers": workers,
+        "tiles": tiles,
+        "requests": tiles * requests_per_tile,
+        "errors": errors,
+        "upstream_requests": upstream,
+        "workers_seen": len(caches),
+        "shared_hits": sum(weather["shared_hits"] for weather in caches.values()),
+        "shared_waits": sum(weather["shared_waits"] for weather in caches.values())
+    }
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="ワーカー間で上流への取得がタイルごとに1回になるか確かめる")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tiles", type=int, default=12)
+    parser.add_argument("--requests-per-tile", type=int, default=12)
+    parser.add_argument("--latency-ms", type=float, default=300, help="スタブの応答時間（リクエストが重なるように長めに）")
+    parser.add_argument("--no-shared", action="store_true", help="共有キャッシュなしで比較用に計る")
+    args = parser.parse_args()
+
+    shared = not args.no_shared
+    report = asyncio.run(run_check(args.workers, args.tiles, args.requests_per_tile, args.latency_ms, shared))
+    for name, value in report.items():
+        print(f"{name:20s} {value}")
+
+    failures: List[str] = []
+    if report["errors"]:
+        failures.append(f"エラーのレスポンスがありました（{report['errors']} 件）")
+    if shared and report["upstream_requests"] != args.tiles:
+        failures.append(f"上流への取得がタイル数と一致しません（{report['upstream_requests']} 回 / {args.tiles} タイル）")
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
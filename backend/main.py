@@ -1,44 +1,274 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+"""
+Skyle API
+
+起動（ワーカーごとに create_app() でアプリを組み立てる）:
+    uvicorn main:create_app --factory --port 3001
+
+import main だけでは .env の読み込みやキャッシュ・サービスの生成は行わない。
+NumPy（バッチ計算・ヒートマップ・予報ランキング）と astral は使う処理から読み込むので、
+既定の設定（SOLAR_BACKEND=astral）では today-forecast を返すまで NumPy を読み込まない。
+起動時間の予算は benchmarks/import_time.py で確認する。
+"""
+import asyncio
+import importlib.util
+import math
 import os
-import requests
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from typing import Optional
+
+# pytz は create_app() で必ず使い（太陽時刻の方式・キャッシュ）、services からも読み込まれるので遅延させない
 import pytz
-from astral import LocationInfo
-from astral.sun import sun
+from fastapi import APIRouter, FastAPI, Header, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
 
-# 可視性判定モジュールをインポート
+from models.types import (
+    ConditionScore,
+    ForecastBatchRequest,
+    SolarBatchRequest,
+    SolarBatchResponse,
+    SolarTimesResponse,
+    TodayForecastResponse,
+    TodaySolarTimes,
+    TodayWeather
+)
+from services.broadcast import TileBroadcastHub
+from services.outlook import build_windows, rank_moments
+from services.http_client import open_http_client, close_http_client
+from services.observation_store import create_observation_store
+from services.shared_tile_store import create_shared_tile_store
+from services.metrics import COMPUTE_DURATION, CallbackMetric, MetricsMiddleware, registry
+from services.solar_backends import create_solar_backend
+from services.solar_cache import SolarTimesCache
+from services.spot_index import SpotEntry, SpotIndex
+from services.upstream_resilience import CircuitBreaker
+from services.upstream_scheduler import Priority, UpstreamScheduler, set_upstream_priority, upstream_priority
+from services.warmup import parse_locations, warm_up
+from services.weather_cache import WeatherTileCache
+from services.weather_service import UpstreamBusyError, UpstreamUnavailableError, WeatherService, WeatherAPIError
+
+# 可視性判定モジュールをインポート（標準ライブラリだけで軽く、services.outlook からも読み込まれる）
+from utils import log
+from utils.compression import ExcludePathsCompression
+from utils.http_cache import conditional_json, make_etag
+from utils.json_response import FastJSONResponse, dumps
+from utils.log import RequestIdMiddleware, configure_logging, get_logger
 from utils.visibility import get_simple_visibility_message, get_detailed_visibility
 from utils.visibility import (
     calculate_visibility_score,
     calculate_halo_visibility  # この行を追加
 )
-# 環境変数読み込み
-load_dotenv()
 
-app = FastAPI(
-    title="Skyle API",
-    description="太陽時刻と天気予報による可視性予測API",
-    version="2.0.0"
-)
+logger = get_logger("api")
 
-# CORS設定
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://localhost:5174",
-        "http://localhost:3000",
-        "http://127.0.0.1:5173",
-        "http://127.0.0.1:5174",
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
+
+# 接続が長く続くストリーミングのルート（SSE・NDJSON）
+STREAMING_ROUTES = ("/api/live", "/api/today-forecast/batch")
+
+def load_settings():
+    """環境変数から設定を読む（create_app() で .env を読み込んだ後に呼ぶ）"""
+    global SOLAR_BATCH_MAX_POINTS, FORECAST_BATCH_MAX_LOCATIONS, HEATMAP_MAX_SIZE, HEATMAP_MAX_TILES
+    global SPOT_SEARCH_MAX_RADIUS, UPSTREAM_FANOUT_LIMIT, COMPRESSION_MIN_SIZE, LIVE_HEARTBEAT_INTERVAL
+    global WARMUP_LOCATIONS
+    
+    # バッチ計算で1リクエストに受け付ける最大地点数
+    SOLAR_BATCH_MAX_POINTS = int(os.getenv("SOLAR_BATCH_MAX_POINTS", "10000"))
+    # まとめ取得で受け付ける最大地点数と、同時に投げる上流リクエスト数
+    FORECAST_BATCH_MAX_LOCATIONS = int(os.getenv("FORECAST_BATCH_MAX_LOCATIONS", "100"))
+    # /api/heatmap の一辺の点数と、1リクエストで取得するタイル数の上限
+    HEATMAP_MAX_SIZE = int(os.getenv("HEATMAP_MAX_SIZE", "64"))
+    HEATMAP_MAX_TILES = int(os.getenv("HEATMAP_MAX_TILES", "400"))
+    # /api/best-spots の検索半径の上限（km）
+    SPOT_SEARCH_MAX_RADIUS = float(os.getenv("SPOT_SEARCH_MAX_RADIUS", "300"))
+    UPSTREAM_FANOUT_LIMIT = int(os.getenv("UPSTREAM_FANOUT_LIMIT", "8"))
+    # これより小さいレスポンスは圧縮しない（バイト）
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+    # ライブ配信で何も送るものがないときに接続維持のコメントを送る間隔（秒）
+    LIVE_HEARTBEAT_INTERVAL = float(os.getenv("LIVE_HEARTBEAT_INTERVAL", "15"))
+    # 起動時に太陽時刻と天気を温めておく地点（"緯度,経度;緯度,経度"）
+    WARMUP_LOCATIONS = parse_locations(os.getenv("WARMUP_LOCATIONS"))
+
+_solar_service = None
+
+def get_solar_service():
+    """SolarService（NumPy を使う）を初めて必要になったときに作る"""
+    global _solar_service
+    if _solar_service is None:
+        from services.ephemeris import load_ephemeris
+        from services.solar_service import SolarService
+        
+        # SOLAR_EPHEMERIS_PATH があれば事前計算テーブルをメモリマップして補間に使う
+        _solar_service = SolarService(ephemeris=load_ephemeris(os.getenv("SOLAR_EPHEMERIS_PATH")))
+    return _solar_service
+
+def create_services():
+    """キャッシュとサービスを作る（create_app() から呼ぶ）"""
+    global _solar_service, solar_backend, solar_cache, upstream_scheduler, weather_service, observation_store, spot_index
+    global shared_tile_store, weather_cache, forecast_cache, live_hub, warmup_stats
+    
+    _solar_service = None
+    # 太陽時刻の計算方式（astral / formula / ephemeris）
+    solar_backend = create_solar_backend(os.getenv("SOLAR_BACKEND", "astral"), get_solar_service)
+    solar_cache = SolarTimesCache()
+    # OpenWeatherMap の呼び出し上限に合わせ、画面表示のリクエストを優先して上流を呼ぶ
+    upstream_scheduler = UpstreamScheduler()
+    # 遅い応答にはヘッジを重ね、失敗が続いたらブレーカーで上流を呼ぶのをやめる（最後のタイルで劣化運転）
+    weather_service = WeatherService(scheduler=upstream_scheduler, breaker=CircuitBreaker())
+    # 上流から取得した天気とスコアの記録（設定したときだけ。保存しないなら None）
+    observation_store = create_observation_store()
+    # スコア済みタイルの空間インデックス（/api/best-spots）
+    spot_index = SpotIndex()
+    
+    # SHARED_CACHE_PATH があれば、現在の天気タイルをワーカープロセス間で共有する
+    shared_tile_store = create_shared_tile_store()
+    
+    # 近い地点はジオハッシュのタイル単位で天気を共有する
+    weather_cache = WeatherTileCache(
+        lambda lat, lng: weather_service.fetch_current_weather(lat, lng, lang="ja"),
+        on_fetch=record_weather_tile,
+        shared=shared_tile_store,
+        on_shared_load=index_weather_tile
+    )
+    # 5日間予報は3時間ごとの更新なのでTTLも長め
+    forecast_cache = WeatherTileCache(
+        lambda lat, lng: weather_service.fetch_forecast(lat, lng, lang="ja"),
+        ttl=float(os.getenv("FORECAST_CACHE_TTL", "3600")),
+        on_fetch=record_forecast_tile
+    )
+    live_hub = TileBroadcastHub(load_live_payload, precision=weather_cache.precision)
+    # 起動時のウォームアップの結果（WARMUP_LOCATIONS がなければ None）
+    warmup_stats = None
 
-@app.get("/")
+def record_weather_tile(tile):
+    """新しい天気タイルが届いたらスコアを計算し、観測データと空間インデックスに反映する"""
+    if observation_store is not None:
+        observation_store.record("current", tile, score_weather_tile(tile))
+    index_weather_tile(tile)
+
+def index_weather_tile(tile):
+    """タイルのスコアと今後のゴールデンアワーを空間インデックスに登録する
+    
+    他のワーカーが取得したタイル（共有キャッシュ）もこちらだけ通す（観測データは取得したワーカーが記録する）
+    """
+    scores = score_weather_tile(tile)
+    today = datetime.now(pytz.timezone('Asia/Tokyo')).date()
+    windows = build_windows(
+        [today, today + timedelta(days=1)],
+        lambda day: get_sun_times(tile.latitude, tile.longitude, day)
+    )
+    golden_hours = sorted(
+        (window for window in windows if window[0].startswith("golden_hour")),
+        key=lambda window: window[1]
+    )
+    spot_index.update(SpotEntry(
+        tile.key, tile.latitude, tile.longitude, scores[0], scores[1], golden_hours, tile.fetched_at
+    ))
+
+def record_forecast_tile(tile):
+    if observation_store is not None:
+        observation_store.record("forecast", tile)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global warmup_stats
+    
+    # 上流API用のコネクションプールをワーカーの寿命に合わせて管理
+    await open_http_client()
+    if observation_store is not None:
+        observation_store.start()
+    # よく使われる地点を温めてから受け付ける（終わるまでヘルスチェックも応答しない）
+    if WARMUP_LOCATIONS:
+        warmup_stats = await warm_up(
+            WARMUP_LOCATIONS,
+            get_sun_times,
+            (lambda locations: fetch_tiles(locations, Priority.PREFETCH)) if weather_service.api_key else None
+        )
+    yield
+    await live_hub.close()
+    await close_http_client()
+    if shared_tile_store is not None:
+        shared_tile_store.close()
+    if observation_store is not None:
+        # 残りの書き込みを待つ（ブロックするのでスレッドで）
+        await asyncio.to_thread(observation_store.close)
+
+def create_app() -> FastAPI:
+    """
+    アプリを組み立てる（uvicorn main:create_app --factory）
+    
+    .env の読み込み・ログの設定・設定値とサービスの生成はここで行う。
+    """
+    from dotenv import load_dotenv
+    
+    # 環境変数読み込み
+    load_dotenv()
+    # ログはキュー経由で別スレッドから書き出す
+    configure_logging()
+    load_settings()
+    create_services()
+    
+    app = FastAPI(
+        title="Skyle API",
+        description="太陽時刻と天気予報による可視性予測API",
+        version="2.0.0",
+        lifespan=lifespan,
+        # dict を返すエンドポイントも orjson で書き出す
+        default_response_class=FastJSONResponse
+    )
+    
+    # CORS設定
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:5173",
+            "http://localhost:5174",
+            "http://localhost:3000",
+            "http://127.0.0.1:5173",
+            "http://127.0.0.1:5174",
+        ],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag"],
+    )
+    
+    # レスポンスの圧縮（brotli-asgi があれば br を優先し、なければ gzip）
+    # メトリクスより内側に置いて、圧縮にかかった時間もレイテンシに含める
+    # ストリーミング（SSE・NDJSON）は圧縮器に溜まって1件ずつ届かなくなるので圧縮しない
+    if importlib.util.find_spec("brotli_asgi") is not None:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(
+            BrotliMiddleware,
+            minimum_size=COMPRESSION_MIN_SIZE,
+            gzip_fallback=True,
+            excluded_handlers=[f"^{path}$" for path in STREAMING_ROUTES]
+        )
+    else:
+        app.add_middleware(
+            ExcludePathsCompression,
+            compressor=GZipMiddleware,
+            exclude=STREAMING_ROUTES,
+            minimum_size=COMPRESSION_MIN_SIZE
+        )
+    
+    # ルートごとのレイテンシ（ストリーミングは接続時間になるので除外）
+    app.add_middleware(MetricsMiddleware, exclude=STREAMING_ROUTES + ("/api/metrics",))
+    app.add_middleware(RequestIdMiddleware)
+    
+    app.include_router(router)
+    return app
+
+def __getattr__(name):
+    # uvicorn main:app や main.app との互換。初めて参照されたときに組み立てる
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@router.get("/")
 def read_root():
     return {
         "message": "Skyle API v2.0 - Real-time weather integration! 🌅",
@@ -46,154 +276,477 @@ def read_root():
         "data_sources": ["OpenWeatherMap", "太陽計算アルゴリズム"]
     }
 
-@app.get("/api/solar/times")
-def get_solar_times(lat: float = 35.6762, lng: float = 139.6503):
+def _compute_sun(lat: float, lng: float, day):
+    """設定された方式（SOLAR_BACKEND）で1地点・1日分の太陽時刻を計算"""
+    with COMPUTE_DURATION.time(solar_backend.name):
+        return solar_backend.sun(lat, lng, day)
+
+def get_sun_times(lat: float, lng: float, day=None):
+    """指定日（省略時は今日, JST）の太陽時刻をキャッシュ経由で取得"""
+    return solar_cache.get_or_compute(lat, lng, _compute_sun, day=day)
+
+def score_weather_tile(tile):
+    """タイルの可視性・ハロ判定（タイルごとに一度だけ計算して使い回す）"""
+    scores = tile.derived.get("scores")
+    if scores is None:
+        with COMPUTE_DURATION.time("visibility"):
+            scores = (calculate_visibility_score(tile.data), calculate_halo_visibility(tile.data))
+        tile.derived["scores"] = scores
+    return scores
+
+def solar_version(lat: float, lng: float):
+    """太陽時刻の版（丸めた座標・JSTの日付・計算方式）と、日付が変わるまでの秒数"""
+    now = datetime.now(solar_cache.tz)
+    max_age = (solar_cache.next_midnight(now) - now).total_seconds()
+    return (solar_cache.quantize(lat, lng), now.date().isoformat(), solar_backend.name), max_age
+
+def weather_max_age(tile) -> float:
+    """タイルがTTL切れになるまでの秒数（古いタイルを返すときは 0）"""
+    return max(0.0, weather_cache.ttl - tile.age())
+
+@router.get("/api/solar/times", response_model=SolarTimesResponse)
+def get_solar_times(
+    lat: float = 35.6762,
+    lng: float = 139.6503,
+    if_none_match: Optional[str] = Header(None)
+):
     """実際の太陽時刻を計算"""
     try:
-        # 日本時間のタイムゾーン
-        jst = pytz.timezone('Asia/Tokyo')
-        
-        # 位置情報を作成
-        location = LocationInfo(latitude=lat, longitude=lng, timezone="Asia/Tokyo")
-        
-        # 今日の日付（JST）
-        today = datetime.now(jst).date()
-        
-        # 太陽時刻を計算
-        s = sun(location.observer, date=today, tzinfo=jst)
-        
-        print(f"計算された日の出: {s['sunrise']}")
-        print(f"計算された日の入: {s['sunset']}")
-        
-        return {
-            "sunrise": s['sunrise'].isoformat(),
-            "sunset": s['sunset'].isoformat(),
-            "solar_noon": s['noon'].isoformat(),
-            "golden_hour_morning_start": (s['sunrise'] - timedelta(minutes=30)).isoformat(),
-            "golden_hour_morning_end": s['sunrise'].isoformat(),
-            "golden_hour_evening_start": s['sunset'].isoformat(),
-            "golden_hour_evening_end": (s['sunset'] + timedelta(minutes=30)).isoformat(),
-            "blue_hour_morning_start": (s['dawn'] - timedelta(minutes=20)).isoformat(),
-            "blue_hour_morning_end": s['dawn'].isoformat(),
-            "blue_hour_evening_start": s['dusk'].isoformat(),
-            "blue_hour_evening_end": (s['dusk'] + timedelta(minutes=20)).isoformat()
-        }
+        version, max_age = solar_version(lat, lng)
+        return conditional_json(if_none_match, make_etag("solar-times", version), max_age, lambda: build_solar_times(lat, lng))
     except Exception as e:
-        print(f"エラー: {str(e)}")
+        logger.exception("太陽時刻の計算に失敗しました", extra={"fields": {"lat": lat, "lng": lng}})
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/today-forecast")
-def get_today_forecast(lat: float = 35.6762, lng: float = 139.6503):
+def build_solar_times(lat: float, lng: float):
+    """/api/solar/times のレスポンスを組み立てる"""
+    # 太陽時刻を計算（同じ地点・同じ日はキャッシュから）
+    s = get_sun_times(lat, lng)
+    
+    logger.debug("太陽時刻を計算しました", extra={"fields": {
+        "lat": lat, "lng": lng, "sunrise": s['sunrise'], "sunset": s['sunset']
+    }})
+    
+    return SolarTimesResponse(
+        sunrise=s['sunrise'],
+        sunset=s['sunset'],
+        solar_noon=s['noon'],
+        golden_hour_morning_start=s['sunrise'] - timedelta(minutes=30),
+        golden_hour_morning_end=s['sunrise'],
+        golden_hour_evening_start=s['sunset'],
+        golden_hour_evening_end=s['sunset'] + timedelta(minutes=30),
+        blue_hour_morning_start=s['dawn'] - timedelta(minutes=20),
+        blue_hour_morning_end=s['dawn'],
+        blue_hour_evening_start=s['dusk'],
+        blue_hour_evening_end=s['dusk'] + timedelta(minutes=20)
+    )
+
+@router.post("/api/solar/batch", response_model=SolarBatchResponse)
+def get_solar_times_batch(request: SolarBatchRequest):
+    """複数地点・複数日の太陽時刻を一括計算"""
+    count = len(request.latitudes)
+    if count != len(request.longitudes):
+        raise HTTPException(status_code=422, detail="latitudes と longitudes の長さが一致しません")
+    if count > SOLAR_BATCH_MAX_POINTS:
+        raise HTTPException(status_code=413, detail=f"一度に計算できるのは{SOLAR_BATCH_MAX_POINTS}地点までです")
+    
+    dates = request.dates or [datetime.now(pytz.timezone('Asia/Tokyo')).date()]
+    if len(dates) not in (1, count):
+        raise HTTPException(status_code=422, detail="dates は1件または地点数と同じ長さにしてください")
+    
+    with COMPUTE_DURATION.time("solar_batch"):
+        results = get_solar_service().calculate_solar_times_batch(request.latitudes, request.longitudes, dates)
+    # results は SolarData と同じ形の dict なので、モデルでの検証を通さずそのまま書き出す
+    return FastJSONResponse({"count": len(results), "results": results})
+
+def build_today_forecast(tile, lat: float, lng: float):
+    """天気タイルと太陽時刻から today-forecast のレスポンスを組み立てる"""
+    weather_data = tile.data
+    
+    # 可視性判定（マジックアワー・ブルーモーメント用）とハロ可視性判定
+    visibility_result, halo_visibility = score_weather_tile(tile)
+    
+    # 天気データを抽出
+    weather = TodayWeather(
+        description=weather_data["weather"][0]["description"],
+        clouds=weather_data["clouds"]["all"],
+        humidity=weather_data["main"]["humidity"],
+        temperature=weather_data["main"]["temp"],
+        visibility=visibility_result["message"]  # メッセージを使用
+    )
+    
+    # 型付きのスコアもタイルごとに一度だけ作る
+    typed_scores = tile.derived.get("typed_scores")
+    if typed_scores is None:
+        typed_scores = tile.derived["typed_scores"] = (
+            ConditionScore(**visibility_result), ConditionScore(**halo_visibility)
+        )
+    
+    # 太陽時刻を計算
+    s = get_sun_times(lat, lng)
+    
+    solar_times = TodaySolarTimes(
+        sunrise=s['sunrise'],
+        sunset=s['sunset'],
+        goldenHour=s['sunset'] + timedelta(minutes=30),
+        blueHour=s['dusk']
+    )
+    
+    return TodayForecastResponse(
+        weather=weather,
+        solarTimes=solar_times,
+        visibility=typed_scores[0],      # 詳細な可視性情報を追加
+        haloVisibility=typed_scores[1],  # ハロ可視性情報を追加
+        location={"lat": lat, "lng": lng},
+        # 同じタイル・同じ日なら同じ本文になるよう、タイルの取得時刻を入れる（ETag の前提）
+        timestamp=datetime.fromtimestamp(tile.fetched_at),
+        degraded=weather_cache.is_degraded(tile)
+    )
+
+@router.get("/api/today-forecast", response_model=TodayForecastResponse)
+async def get_today_forecast(
+    lat: float = 35.6762,
+    lng: float = 139.6503,
+    if_none_match: Optional[str] = Header(None)
+):
     """統合エンドポイント：太陽時刻 + 天気予報"""
     try:
-        # APIキー取得
-        api_key = os.getenv("OPENWEATHER_API_KEY")
-        
-        if not api_key:
-            return get_test_forecast_for_menu(lat, lng)
-        
-        # OpenWeatherMap API呼び出し
-        weather_url = "https://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "lat": lat,
-            "lon": lng,
-            "appid": api_key,
-            "units": "metric",
-            "lang": "ja"
-        }
-        
-        response = requests.get(weather_url, params=params)
-        
-        if response.status_code != 200:
-            print(f"❌ Weather API Error: {response.status_code}")
+        if not weather_service.api_key:
             return get_test_forecast_for_menu(lat, lng)
         
-        weather_data = response.json()
+        # OpenWeatherMap API呼び出し（タイルキャッシュ経由）
+        # 少し古いタイルはそのまま返し、裏で更新する
+        tile = await weather_cache.get(lat, lng)
+        # 版はタイルの取得時刻と太陽時刻の日付。一致すれば本文を組み立てずに 304
+        version, solar_max_age = solar_version(lat, lng)
+        etag = make_etag("today-forecast", tile.key, tile.fetched_at, lat, lng, version, weather_cache.is_degraded(tile))
+        max_age = min(weather_max_age(tile), solar_max_age)
+        return conditional_json(if_none_match, etag, max_age, lambda: build_today_forecast(tile, lat, lng))
         
-        # 可視性判定（マジックアワー・ブルーモーメント用）
-        visibility_result = calculate_visibility_score(weather_data)
-        
-        # ハロ可視性判定を追加
-        halo_visibility = calculate_halo_visibility(weather_data)
-        
-        # 天気データを抽出
-        weather = {
-            "description": weather_data["weather"][0]["description"],
-            "clouds": weather_data["clouds"]["all"],
-            "humidity": weather_data["main"]["humidity"],
-            "temperature": weather_data["main"]["temp"],
-            "visibility": visibility_result["message"]  # メッセージを使用
-        }
-        
-        # 太陽時刻を計算
-        jst = pytz.timezone('Asia/Tokyo')
-        location = LocationInfo(latitude=lat, longitude=lng, timezone="Asia/Tokyo")
-        today = datetime.now(jst).date()
-        s = sun(location.observer, date=today, tzinfo=jst)
-        
-        solar_times = {
-            "sunrise": s['sunrise'].isoformat(),
-            "sunset": s['sunset'].isoformat(),
-            "goldenHour": (s['sunset'] + timedelta(minutes=30)).isoformat(),
-            "blueHour": s['dusk'].isoformat()
-        }
-        
-        return {
-            "weather": weather,
-            "solarTimes": solar_times,
-            "visibility": visibility_result,      # 詳細な可視性情報を追加
-            "haloVisibility": halo_visibility,    # ハロ可視性情報を追加
-            "location": {"lat": lat, "lng": lng},
-            "timestamp": datetime.now().isoformat()
-        }
-        
-    except requests.RequestException as e:
-        print(f"🌐 ネットワークエラー: {str(e)}")
-        return get_test_forecast_for_menu(lat, lng)
+    except UpstreamBusyError as e:
+        # 呼び出し上限・ブレーカーで呼べなかった（手元にタイルがあれば degraded で返している）
+        raise upstream_busy(e, lat, lng)
+    except WeatherAPIError as e:
+        # 最後に取れたタイルもない。テストデータは返さない
+        logger.warning("天気APIエラーのため応答できません", extra={"fields": {
+            "error": str(e), "status": e.status_code, "lat": lat, "lng": lng
+        }})
+        raise HTTPException(status_code=502, detail="天気APIエラー")
     except Exception as e:
-        print(f"💥 エラー: {str(e)}")
+        logger.exception("today-forecast の組み立てに失敗しました", extra={"fields": {"lat": lat, "lng": lng}})
         raise HTTPException(status_code=500, detail=str(e))
-@app.get("/api/visibility-detail")
-def get_visibility_detail(lat: float = 35.6762, lng: float = 139.6503):
-    """詳細な可視性情報（デバッグ用）"""
+
+def upstream_busy(e: UpstreamBusyError, lat: float, lng: float) -> HTTPException:
+    """呼び出し上限・ブレーカーで上流を呼べず、手元にタイルもないときの 503（Retry-After 付き）"""
+    logger.warning("天気APIを呼べないため応答できません", extra={"fields": {
+        "error": str(e), "retry_after": round(e.retry_after, 1), "lat": lat, "lng": lng
+    }})
+    return HTTPException(
+        status_code=503,
+        detail=(
+            "天気APIが応答しないため一時的に呼び出しを止めています"
+            if isinstance(e, UpstreamUnavailableError) else "天気APIの呼び出し上限に達しています"
+        ),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+    )
+
+async def load_live_payload(lat: float, lng: float):
+    """ライブ配信用：タイル中心の today-forecast を組み立てる"""
+    # 定期的な更新なので、画面を待っているリクエストより後に回す
+    with upstream_priority(Priority.PREFETCH):
+        tile = await weather_cache.get(lat, lng)
+    return build_today_forecast(tile, lat, lng).model_dump()
+
+@router.get("/api/live")
+async def get_live_conditions(lat: float = 35.6762, lng: float = 139.6503):
+    """タイルを購読し、天気・可視性・太陽時刻が変わるたびに Server-Sent Events で受け取る"""
+    if not weather_service.api_key:
+        raise HTTPException(status_code=500, detail="APIキーが設定されていません")
+    
+    async def stream():
+        subscription = live_hub.subscribe(lat, lng)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), timeout=LIVE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            live_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def fetch_tiles(locations, priority=Priority.BATCH):
+    """
+    地点をタイル単位にまとめ、未取得のタイルを同時実行数を絞って取得する
+    
+    タイルが届いた順に (タイル or 例外, そのタイルに含まれる地点のインデックス) を返す。
+    上流は priority（既定 BATCH）で呼ぶので、1地点ずつのリクエストより後に回る
+    """
+    groups = {}
+    for index, (lat, lng) in enumerate(locations):
+        groups.setdefault(weather_cache.tile_key(lat, lng), []).append(index)
+    
+    semaphore = asyncio.Semaphore(UPSTREAM_FANOUT_LIMIT)
+    
+    async def load(indices):
+        lat, lng = locations[indices[0]]
+        # タスクごとのコンテキストなので、呼び出し元の優先度は変わらない
+        set_upstream_priority(priority)
+        async with semaphore:
+            try:
+                return await weather_cache.get(lat, lng), indices
+            except WeatherAPIError as e:
+                return e, indices
+    
+    tasks = [asyncio.ensure_future(load(indices)) for indices in groups.values()]
     try:
-        api_key = os.getenv("OPENWEATHER_API_KEY")
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def prefetch_tiles(locations):
+    """
+    呼び出し上限で取れなかったタイルを PREFETCH の締め切りまでに取れる分だけ裏で取得する
+    
+    (取得を始めたタイル数, 取り直すまでの目安の秒数 or None) を返す
+    """
+    scheduler = weather_service.scheduler
+    if scheduler is not None:
+        locations = locations[:scheduler.capacity(Priority.PREFETCH)]
+    started = 0
+    with upstream_priority(Priority.PREFETCH):
+        for lat, lng in locations:
+            started += weather_cache.prefetch(lat, lng)
+    if not started:
+        return 0, None
+    wait = scheduler.estimated_wait(Priority.PREFETCH, started) if scheduler is not None else 0.0
+    return started, max(1, math.ceil(wait))
+
+@router.post("/api/today-forecast/batch")
+async def get_today_forecast_batch(request: ForecastBatchRequest):
+    """複数地点の today-forecast をまとめて計算し、できた順に NDJSON で返す"""
+    if len(request.locations) > FORECAST_BATCH_MAX_LOCATIONS:
+        raise HTTPException(status_code=413, detail=f"一度に取得できるのは{FORECAST_BATCH_MAX_LOCATIONS}地点までです")
+    
+    locations = [(loc.lat, loc.lng) for loc in request.locations]
+    
+    async def stream():
+        if not weather_service.api_key:
+            for index, (lat, lng) in enumerate(locations):
+                yield dumps({"index": index, **get_test_forecast_for_menu(lat, lng)}) + b"\n"
+            return
         
-        if not api_key:
+        async for tile, indices in fetch_tiles(locations):
+            for index in indices:
+                lat, lng = locations[index]
+                if isinstance(tile, Exception):
+                    result = {"index": index, "error": "天気APIエラー", "location": {"lat": lat, "lng": lng}}
+                else:
+                    try:
+                        result = {"index": index, **build_today_forecast(tile, lat, lng).model_dump()}
+                    except Exception as e:
+                        # 極地で日の出がない場合など、1地点の失敗で全体を止めない
+                        result = {"index": index, "error": str(e), "location": {"lat": lat, "lng": lng}}
+                yield dumps(result) + b"\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/api/outlook")
+async def get_outlook(lat: float = 35.6762, lng: float = 139.6503, limit: int = 10):
+    """数日先までのマジックアワー・ブルーモーメントを見やすい順に返す"""
+    if not weather_service.api_key:
+        raise HTTPException(status_code=500, detail="APIキーが設定されていません")
+    
+    try:
+        tile = await forecast_cache.get(lat, lng)
+    except UpstreamBusyError as e:
+        raise upstream_busy(e, lat, lng)
+    except WeatherAPIError as e:
+        raise HTTPException(status_code=e.status_code or 502, detail="天気APIエラー")
+    
+    jst = pytz.timezone('Asia/Tokyo')
+    now = datetime.now(jst)
+    days = [now.date() + timedelta(days=i) for i in range(6)]
+    windows = build_windows(days, lambda day: get_sun_times(lat, lng, day))
+    with COMPUTE_DURATION.time("outlook"):
+        moments = rank_moments(tile.data, windows, now, limit)
+    
+    return {
+        "moments": moments,
+        "location": {"lat": lat, "lng": lng},
+        "timestamp": datetime.now().isoformat(),
+        "degraded": forecast_cache.is_degraded(tile)
+    }
+
+@router.get("/api/heatmap")
+async def get_heatmap(lat: float = 35.6762, lng: float = 139.6503, size: int = 16, radius: float = 20):
+    """
+    中心から半径 radius km の範囲を size×size 点に分けた可視性・ハロ・日の入のグリッド
+    
+    配列は北西の点から行優先。タイルが取得できなかった点のスコアは null。
+    sunset は UNIXエポック秒（白夜・極夜は null）。/api/today-forecast と同じ方式（SOLAR_BACKEND）の値。
+    
+    未取得のタイルは BATCH の締め切り（UPSTREAM_DEADLINE_BATCH）までに呼び出し上限の
+    範囲で取れる分だけ取る。既定（毎分60件・バースト10・締め切り15秒）では1リクエストで
+    約25タイルまでで、残りは skippedTiles / skippedCells に数え、PREFETCH の締め切りまでに
+    取れる分を裏で取得しておく（prefetchingTiles）。retryAfter 秒後に取り直すと埋まる。
+    最後に取れたタイルで劣化運転した点は degradedCells に数える。
+    """
+    import numpy as np
+    
+    from services.heatmap import HeatmapGrid, calibrate_sunsets
+    
+    if not weather_service.api_key:
+        raise HTTPException(status_code=500, detail="APIキーが設定されていません")
+    if size < 2 or size > HEATMAP_MAX_SIZE:
+        raise HTTPException(status_code=422, detail=f"size は2〜{HEATMAP_MAX_SIZE}にしてください")
+    if radius <= 0:
+        raise HTTPException(status_code=422, detail="radius は0より大きくしてください")
+    
+    grid = HeatmapGrid(lat, lng, size, radius, weather_cache.precision)
+    if grid.tile_count > HEATMAP_MAX_TILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"範囲が広すぎます（{grid.tile_count}タイル, 上限{HEATMAP_MAX_TILES}）。radius を小さくしてください"
+        )
+    
+    # タイルごとに1回だけ取得し、スコアはタイルのメモを使う
+    visibility = np.full(grid.tile_count, -1, dtype=np.int64)
+    halo = np.full(grid.tile_count, -1, dtype=np.int64)
+    degraded = np.zeros(grid.tile_count, dtype=bool)
+    # 呼び出し上限で取れなかったタイル（ブレーカーが開いているときは裏で取っても無駄なので除く）
+    busy = []
+    async for tile, indices in fetch_tiles(grid.tile_centers):
+        if isinstance(tile, Exception):
+            if isinstance(tile, UpstreamBusyError) and not isinstance(tile, UpstreamUnavailableError):
+                busy.append(indices[0])
+            continue
+        visibility_result, halo_result = score_weather_tile(tile)
+        visibility[indices] = visibility_result["score"]
+        halo[indices] = halo_result["score"]
+        degraded[indices] = weather_cache.is_degraded(tile)
+    
+    prefetching, retry_after = prefetch_tiles([grid.tile_centers[i] for i in busy])
+    
+    # 日の入は全点を近似式でまとめて計算し、代表点で設定された方式（SOLAR_BACKEND）に合わせる
+    today = datetime.now(pytz.timezone('Asia/Tokyo')).date()
+    day_seconds = np.full(grid.point_latitudes.shape, (today - datetime(1970, 1, 1).date()).days * 86400.0)
+    with COMPUTE_DURATION.time("heatmap_solar"):
+        sunset = get_solar_service().lookup_event_julian_days(
+            grid.point_latitudes, grid.point_longitudes, day_seconds
+        )["sunset"]
+        sunset = np.floor(calibrate_sunsets(grid, (sunset - 2440587.5) * 86400, _compute_sun, today))
+    
+    def scores(values):
+        return [None if v < 0 else v for v in values[grid.tile_index].tolist()]
+    
+    return {
+        "size": size,
+        "latitudes": grid.latitudes.tolist(),
+        "longitudes": grid.longitudes.tolist(),
+        "tiles": grid.tile_count,
+        "visibility": scores(visibility),
+        "halo": scores(halo),
+        "sunset": [None if s != s else int(s) for s in sunset.tolist()],
+        "skippedTiles": int((visibility < 0).sum()),
+        "skippedCells": int((visibility[grid.tile_index] < 0).sum()),
+        "degradedCells": int(degraded[grid.tile_index].sum()),
+        "prefetchingTiles": prefetching,
+        "retryAfter": retry_after,
+        "location": {"lat": lat, "lng": lng},
+        "radiusKm": radius,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@router.get("/api/best-spots")
+async def get_best_spots(
+    lat: float = 35.6762,
+    lng: float = 139.6503,
+    radius: float = 30,
+    k: int = 10,
+    rank_by: str = "visibility"
+):
+    """近くで空がきれいに見えそうなタイルを返す（取得・計算済みのタイルだけを検索）"""
+    if radius <= 0 or radius > SPOT_SEARCH_MAX_RADIUS:
+        raise HTTPException(status_code=422, detail=f"radius は0より大きく{SPOT_SEARCH_MAX_RADIUS:g}km以下にしてください")
+    if rank_by not in ("visibility", "halo"):
+        raise HTTPException(status_code=422, detail="rank_by は visibility か halo を指定してください")
+    k = max(1, min(k, 100))
+    
+    now = datetime.now(pytz.timezone('Asia/Tokyo'))
+    spots = []
+    for entry, distance in spot_index.search(lat, lng, radius, k, rank_by):
+        golden_hour = entry.next_golden_hour(now)
+        spots.append({
+            "tile": entry.key,
+            "location": {"lat": entry.latitude, "lng": entry.longitude},
+            "distanceKm": round(distance, 2),
+            "visibility": {key: entry.visibility[key] for key in ("score", "level", "message")},
+            "haloVisibility": {key: entry.halo[key] for key in ("score", "level", "message")},
+            "nextGoldenHour": {
+                "type": golden_hour[0],
+                "start": golden_hour[1].isoformat(),
+                "end": golden_hour[2].isoformat()
+            } if golden_hour else None,
+            "updatedAt": datetime.fromtimestamp(entry.updated_at, pytz.timezone('Asia/Tokyo')).isoformat()
+        })
+    
+    return {
+        "spots": spots,
+        "count": len(spots),
+        "location": {"lat": lat, "lng": lng},
+        "radiusKm": radius,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@router.get("/api/visibility-detail")
+async def get_visibility_detail(
+    lat: float = 35.6762,
+    lng: float = 139.6503,
+    if_none_match: Optional[str] = Header(None)
+):
+    """詳細な可視性情報（デバッグ用）"""
+    try:
+        if not weather_service.api_key:
             raise HTTPException(status_code=500, detail="APIキーが設定されていません")
         
-        weather_url = "https://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "lat": lat,
-            "lon": lng,
-            "appid": api_key,
-            "units": "metric",
-            "lang": "ja"
-        }
-        
-        response = requests.get(weather_url, params=params)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="天気APIエラー")
+        try:
+            tile = await weather_cache.get(lat, lng)
+        except UpstreamBusyError as e:
+            raise upstream_busy(e, lat, lng)
+        except WeatherAPIError as e:
+            raise HTTPException(status_code=e.status_code or 502, detail="天気APIエラー")
         
-        weather_data = response.json()
-        
-        # 詳細な可視性情報を取得
-        visibility_info = get_detailed_visibility(weather_data)
-        
-        return {
-            "visibility": visibility_info,
-            "raw_weather": {
-                "description": weather_data["weather"][0]["description"],
-                "clouds": weather_data["clouds"]["all"],
-                "humidity": weather_data["main"]["humidity"],
-                "temperature": weather_data["main"]["temp"]
-            }
-        }
+        etag = make_etag("visibility-detail", tile.key, tile.fetched_at)
+        return conditional_json(if_none_match, etag, weather_max_age(tile), lambda: build_visibility_detail(tile.data))
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_visibility_detail(weather_data):
+    """/api/visibility-detail のレスポンスを組み立てる"""
+    # 詳細な可視性情報を取得
+    visibility_info = get_detailed_visibility(weather_data)
+    
+    return {
+        "visibility": visibility_info,
+        "raw_weather": {
+            "description": weather_data["weather"][0]["description"],
+            "clouds": weather_data["clouds"]["all"],
+            "humidity": weather_data["main"]["humidity"],
+            "temperature": weather_data["main"]["temp"]
+        }
+    }
+
 def get_test_forecast_for_menu(lat: float = 35.6762, lng: float = 139.6503):
     """テストデータ（APIキーがない場合）"""
     weather = {
@@ -247,16 +800,88 @@ def get_test_forecast_for_menu(lat: float = 35.6762, lng: float = 139.6503):
     }
     
 
-@app.get("/api/health")
+@router.get("/api/health")
 async def health_check():
     """ヘルスチェック"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "message": "Skyle API is running"
+        "message": "Skyle API is running",
+        "caches": {
+            "solar": solar_cache.stats(),
+            "weather": weather_cache.stats(),
+            "forecast": forecast_cache.stats()
+        },
+        "solar_backend": solar_backend.name,
+        "upstream": upstream_scheduler.stats(),
+        "resilience": weather_service.stats(),
+        "spots": spot_index.stats(),
+        "live": live_hub.stats(),
+        "observations": observation_store.stats() if observation_store is not None else None,
+        "logging": log.stats(),
+        "warmup": warmup_stats
     }
 
+def _cache_requests():
+    for name, cache in (("solar", solar_cache), ("weather", weather_cache), ("forecast", forecast_cache)):
+        stats = cache.stats()
+        yield (name, "hit"), stats["hits"]
+        yield (name, "miss"), stats["misses"]
+        if "stale_hits" in stats:
+            yield (name, "stale"), stats["stale_hits"]
+
+def _cache_gauge(field):
+    def collect():
+        for name, cache in (("solar", solar_cache), ("weather", weather_cache), ("forecast", forecast_cache)):
+            stats = cache.stats()
+            if field in stats:
+                yield (name,), stats[field]
+    return collect
+
+# キャッシュの統計は /api/metrics が呼ばれたときに読む（リクエスト処理側では何もしない）
+registry.register(CallbackMetric(
+    "skyle_cache_requests_total", "キャッシュの参照回数（hit / stale / miss）", "counter",
+    ("cache", "result"), _cache_requests
+))
+registry.register(CallbackMetric(
+    "skyle_cache_hit_ratio", "キャッシュのヒット率（古いタイルの返却を含む）", "gauge",
+    ("cache",), _cache_gauge("hit_ratio")
+))
+registry.register(CallbackMetric(
+    "skyle_cache_entries", "キャッシュの件数", "gauge",
+    ("cache",), _cache_gauge("entries")
+))
+registry.register(CallbackMetric(
+    "skyle_cache_inflight_fetches", "取得中のタイル数（同じタイルへの同時要求は1件にまとまる）", "gauge",
+    ("cache",), _cache_gauge("inflight")
+))
+registry.register(CallbackMetric(
+    "skyle_cache_degraded_total", "上流から取れず、最後に取れたタイルを返した回数", "counter",
+    ("cache",), _cache_gauge("degraded")
+))
+registry.register(CallbackMetric(
+    "skyle_cache_upstream_fetches_total", "キャッシュから上流への取得回数", "counter",
+    ("cache",), _cache_gauge("upstream_fetches")
+))
+registry.register(CallbackMetric(
+    "skyle_upstream_waiting", "上流呼び出しの許可を待っている数", "gauge",
+    ("priority",), lambda: [((priority,), count) for priority, count in upstream_scheduler.stats()["waiting"].items()]
+))
+registry.register(CallbackMetric(
+    "skyle_upstream_tokens", "上流呼び出しのトークンバケットの残り", "gauge",
+    (), lambda: [((), upstream_scheduler.stats()["tokens"])]
+))
+registry.register(CallbackMetric(
+    "skyle_live_subscribers", "ライブ配信の購読者数", "gauge",
+    (), lambda: [((), live_hub.stats()["subscribers"])]
+))
+
+@router.get("/api/metrics")
+def get_metrics():
+    """Prometheus 形式のメトリクス"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=3001)
+    uvicorn.run(create_app(), host="0.0.0.0", port=3001)
    
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 class WeatherData(BaseModel):
@@ -75,6 +75,27 @@ class SolarData(BaseModel):
     moon: MoonData
 
 
+class SolarBatchRequest(BaseModel):
+    latitudes: List[float]
+    longitudes: List[float]
+    # 1件なら全地点に適用、地点数と同じ長さなら地点ごとに適用（省略時はJSTの今日）
+    dates: Optional[List[date]] = None
+
+
+class SolarBatchResponse(BaseModel):
+    count: int
+    results: List[SolarData]
+
+
+class Coordinate(BaseModel):
+    lat: float
+    lng: float
+
+
+class ForecastBatchRequest(BaseModel):
+    locations: List[Coordinate]
+
+
 class SolarResponse(BaseModel):
     sunrise: Optional[str]
     sunset: Optional[str]
@@ -146,4 +167,52 @@ class ForecastItem(BaseModel):
 class ForecastResponse(BaseModel):
     location: str
     country: str
-    forecasts: List[ForecastItem]
\ No newline at end of file
+    forecasts: List[ForecastItem]
+
+class ConditionScore(BaseModel):
+    score: int
+    level: str
+    message: str
+    factors: Dict[str, str]
+
+
+class TodayWeather(BaseModel):
+    description: str
+    clouds: int
+    humidity: int
+    temperature: float
+    visibility: str
+
+
+class TodaySolarTimes(BaseModel):
+    sunrise: datetime
+    sunset: datetime
+    goldenHour: datetime
+    blueHour: datetime
+
+
+class TodayForecastResponse(BaseModel):
+    """/api/today-forecast（frontend の ForecastResponse と同じ形）"""
+    weather: TodayWeather
+    solarTimes: TodaySolarTimes
+    visibility: ConditionScore
+    haloVisibility: ConditionScore
+    location: Coordinate
+    timestamp: datetime
+    # 上流から取れず、最後に取れた天気（timestamp の時点）で返している
+    degraded: bool = False
+
+
+class SolarTimesResponse(BaseModel):
+    """/api/solar/times"""
+    sunrise: datetime
+    sunset: datetime
+    solar_noon: datetime
+    golden_hour_morning_start: datetime
+    golden_hour_morning_end: datetime
+    golden_hour_evening_start: datetime
+    golden_hour_evening_end: datetime
+    blue_hour_morning_start: datetime
+    blue_hour_morning_end: datetime
+    blue_hour_evening_start: datetime
+    blue_hour_evening_end: datetime
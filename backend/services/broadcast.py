@@ -0,0 +1,116 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from utils import geohash
+from utils.json_response import dumps
+from utils.log import get_logger
+
+logger = get_logger("live")
+
+
+class Subscription:
+    """1接続分の購読。最新のメッセージだけを保持する（古いものは上書き）"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=1)
+
+    def push(self, message: str) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class TileBroadcastHub:
+    """
+    タイル単位のライブ配信ハブ
+
+    購読者がいるタイルごとに1つだけ更新タスクを動かし、内容が変わったときだけ
+    同じメッセージを全購読者に配る。接続ごとの状態はサイズ1のキューだけなので、
+    待機中の接続を大量に抱えても負荷はほぼ増えない。
+    """
+
+    def __init__(
+        self,
+        load: Callable[[float, float], Awaitable[Dict[str, Any]]],
+        precision: int,
+        interval: Optional[float] = None
+    ):
+        self._load = load
+        self.precision = precision
+        self.interval = interval if interval is not None else float(os.getenv("LIVE_REFRESH_INTERVAL", "60"))
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._refreshers: Dict[str, "asyncio.Task[None]"] = {}
+        self._latest: Dict[str, tuple] = {}
+        self.broadcasts = 0
+        self.skipped = 0
+
+    def subscribe(self, latitude: float, longitude: float) -> Subscription:
+        key = geohash.encode(latitude, longitude, self.precision)
+        subscription = Subscription(key)
+        self._subscribers.setdefault(key, set()).add(subscription)
+
+        latest = self._latest.get(key)
+        if latest is not None:
+            subscription.push(latest[1])
+        if key not in self._refreshers:
+            self._refreshers[key] = asyncio.ensure_future(self._refresh_loop(key))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.key)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            # 最後の購読者が抜けたタイルは更新をやめる
+            del self._subscribers[subscription.key]
+            self._latest.pop(subscription.key, None)
+            task = self._refreshers.pop(subscription.key, None)
+            if task is not None:
+                task.cancel()
+
+    async def _refresh_loop(self, key: str) -> None:
+        latitude, longitude = geohash.decode(key)
+        while key in self._subscribers:
+            try:
+                payload = await self._load(latitude, longitude)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("ライブ配信の更新に失敗しました", extra={"fields": {"tile": key, "error": str(e)}})
+            else:
+                self._publish(key, payload)
+            await asyncio.sleep(self.interval)
+
+    def _publish(self, key: str, payload: Dict[str, Any]) -> None:
+        # timestamp 以外が前回と同じなら送らない
+        signature = dumps({k: v for k, v in payload.items() if k != "timestamp"}, sort_keys=True)
+        latest = self._latest.get(key)
+        if latest is not None and latest[0] == signature:
+            self.skipped += 1
+            return
+
+        message = f"event: conditions\ndata: {dumps(payload).decode('utf-8')}\n\n"
+        self._latest[key] = (signature, message)
+        self.broadcasts += 1
+        for subscription in self._subscribers.get(key, ()):
+            subscription.push(message)
+
+    async def close(self) -> None:
+        tasks = list(self._refreshers.values())
+        self._refreshers.clear()
+        self._subscribers.clear()
+        self._latest.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tiles": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "broadcasts": self.broadcasts,
+            "skipped_unchanged": self.skipped
+        }
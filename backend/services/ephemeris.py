@@ -0,0 +1,250 @@
+"""
+太陽イベントの事前計算テーブル（エフェメリス）
+
+緯度経度の格子 × 日付ごとに SolarService の計算結果を float32 で保存し、
+API側はファイルをメモリマップして双線形補間で答える。
+ファイルはOSのページキャッシュ経由で uvicorn の全ワーカーから共有される。
+
+誤差について:
+    ビルド時に格子内のランダムな地点・日付で厳密計算と比較し、最大誤差（秒）を
+    ヘッダーに記録する（EphemerisTable.max_error_seconds）。
+    日本周辺（北緯20〜46度）では 0.25度格子で最大約1.5秒、0.5度格子で約6秒。
+    格子の四隅のどれかでイベントが存在しない（白夜・極夜の境界）地点は補間せず、
+    呼び出し側で厳密計算に切り替える。
+
+使い方:
+    python -m services.ephemeris build --out solar_ephemeris.bin --start 2026-01-01
+    python -m services.ephemeris verify solar_ephemeris.bin
+"""
+import argparse
+import struct
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from services.solar_service import SolarService
+
+
+EPHEMERIS_EVENTS = (
+    "sunrise",
+    "sunset",
+    "solar_noon",
+    "civil_dawn",
+    "civil_dusk",
+    "nautical_dawn",
+    "nautical_dusk",
+    "astronomical_dawn",
+    "astronomical_dusk",
+    "golden_hour_morning",
+    "golden_hour_evening",
+)
+
+# 2: 日番号の切り上げ修正後の値（1 のファイルは作り直しが必要）
+_MAGIC = b"SKYLEPH2"
+# magic, start_day(UNIX日), days, nlat, nlon, nevents, lat0, dlat, lon0, dlon, max_error_seconds
+_HEADER = struct.Struct("<8siIIIIddddd")
+_HEADER_SIZE = 128
+_UNIX_EPOCH_JD = 2440587.5
+
+
+class EphemerisTable:
+    """メモリマップしたエフェメリスファイル"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+        (magic, self.start_day, self.days, self.nlat, self.nlon, nevents,
+         self.lat0, self.dlat, self.lon0, self.dlon, self.max_error_seconds) = _HEADER.unpack(header)
+        if magic != _MAGIC or nevents != len(EPHEMERIS_EVENTS):
+            raise ValueError(f"エフェメリスファイルの形式が不正です: {path}")
+
+        self.path = path
+        # (日, 緯度, 経度, イベント) の順。各値は UTC 0時のユリウス日からの差（日）
+        self._data = np.memmap(
+            path,
+            dtype="<f4",
+            mode="r",
+            offset=_HEADER_SIZE,
+            shape=(self.days, self.nlat, self.nlon, nevents)
+        )
+        self._records = self._data.reshape(-1, nevents)
+
+    def interpolate(self, lat: np.ndarray, lon: np.ndarray, day_seconds: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """
+        1次元配列の地点・日付について各イベントのユリウス日を補間する
+
+        Returns:
+            (イベント名 -> ユリウス日の配列, 補間できた地点のマスク)
+            マスクが False の地点の値は未定義なので厳密計算で埋めること
+        """
+        day_number = np.floor(day_seconds / 86400)
+        day_index = (day_number - self.start_day).astype(np.int64)
+        lat_pos = (lat - self.lat0) / self.dlat
+        lon_pos = (lon - self.lon0) / self.dlon
+
+        covered = (
+            (day_index >= 0) & (day_index < self.days) &
+            (lat_pos >= 0) & (lat_pos <= self.nlat - 1) &
+            (lon_pos >= 0) & (lon_pos <= self.nlon - 1)
+        )
+
+        if not covered.any():
+            return {key: np.full(lat.shape, np.nan) for key in EPHEMERIS_EVENTS}, covered
+
+        lat_pos, lon_pos = lat_pos[covered], lon_pos[covered]
+        i = np.minimum(lat_pos.astype(np.int64), self.nlat - 2)
+        j = np.minimum(lon_pos.astype(np.int64), self.nlon - 2)
+        fy = (lat_pos - i).astype(np.float32)
+        fx = (lon_pos - j).astype(np.float32)
+
+        # 4隅のレコードを1回のギャザーで読み、重み付きで足し合わせる
+        origin = (day_index[covered] * self.nlat + i) * self.nlon + j
+        corners = self._records[np.stack([origin, origin + 1, origin + self.nlon, origin + self.nlon + 1], axis=1)]
+        weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx], axis=1)
+        values = np.einsum("nc,nce->ne", weights, corners)
+
+        # 四隅のどれかにイベントが無い地点は補間しない
+        complete = ~np.isnan(values).any(axis=1)
+        if not complete.all():
+            covered[np.flatnonzero(covered)[~complete]] = False
+            values = values[complete]
+
+        values = values + (day_number[covered] + _UNIX_EPOCH_JD)[:, None]
+        if covered.all():
+            return {key: values[:, k] for k, key in enumerate(EPHEMERIS_EVENTS)}, covered
+
+        result = {key: np.full(lat.shape, np.nan) for key in EPHEMERIS_EVENTS}
+        for k, key in enumerate(EPHEMERIS_EVENTS):
+            result[key][covered] = values[:, k]
+
+        return result, covered
+
+    def interpolate_point(self, lat: float, lon: float, day_seconds: float) -> Optional[Dict[str, float]]:
+        """
+        1地点・1日分の interpolate（範囲外や四隅のどれかにイベントが無ければ None）
+
+        1件ごとに配列を作ると NumPy の呼び出しの固定費が計算そのものより重くなるので、
+        添字と重みは Python の float で求め、四隅の2×2ブロックだけをメモリマップから読む。
+        """
+        day_number = day_seconds // 86400
+        day_index = int(day_number - self.start_day)
+        lat_pos = (lat - self.lat0) / self.dlat
+        lon_pos = (lon - self.lon0) / self.dlon
+        if not (0 <= day_index < self.days and 0 <= lat_pos <= self.nlat - 1 and 0 <= lon_pos <= self.nlon - 1):
+            return None
+
+        i = min(int(lat_pos), self.nlat - 2)
+        j = min(int(lon_pos), self.nlon - 2)
+        fy = lat_pos - i
+        fx = lon_pos - j
+        (c00, c01), (c10, c11) = self._data[day_index, i:i + 2, j:j + 2].tolist()
+        w00, w01, w10, w11 = (1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx
+
+        base = day_number + _UNIX_EPOCH_JD
+        result = {}
+        for k, key in enumerate(EPHEMERIS_EVENTS):
+            value = w00 * c00[k] + w01 * c01[k] + w10 * c10[k] + w11 * c11[k]
+            # 四隅のどれかが NaN なら結果も NaN
+            if value != value:
+                return None
+            result[key] = base + value
+        return result
+
+
+def load_ephemeris(path: Optional[str]) -> Optional[EphemerisTable]:
+    """パスが指定されていればテーブルを開く（未指定なら None）"""
+    return EphemerisTable(path) if path else None
+
+
+def build_table(
+    path: str,
+    start: date,
+    days: int = 366,
+    lat_range: Tuple[float, float] = (20.0, 46.0),
+    lon_range: Tuple[float, float] = (122.0, 154.0),
+    step: float = 0.25,
+    verify_samples: int = 20000
+) -> EphemerisTable:
+    """格子上で SolarService の結果を事前計算してファイルに書き出す"""
+    service = SolarService()
+    lats = np.arange(lat_range[0], lat_range[1] + step / 2, step)
+    lons = np.arange(lon_range[0], lon_range[1] + step / 2, step)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+    start_day = (start - date(1970, 1, 1)).days
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(
+            _MAGIC, start_day, days, len(lats), len(lons), len(EPHEMERIS_EVENTS),
+            float(lats[0]), step, float(lons[0]), step, float("nan")
+        ).ljust(_HEADER_SIZE, b"\0"))
+
+        for day in range(days):
+            day_seconds = np.full(grid_lat.shape, (start_day + day) * 86400.0)
+            julian = service.solar_event_julian_days(grid_lat, grid_lon, day_seconds)
+            base = (start_day + day) + _UNIX_EPOCH_JD
+            block = np.stack([julian[key] - base for key in EPHEMERIS_EVENTS], axis=-1)
+            f.write(block.astype("<f4").tobytes())
+
+    max_error = measure_error(EphemerisTable(path), verify_samples)
+    with open(path, "r+b") as f:
+        f.seek(_HEADER.size - 8)
+        f.write(struct.pack("<d", max_error))
+
+    return EphemerisTable(path)
+
+
+def measure_error(table: EphemerisTable, samples: int = 20000, seed: int = 0) -> float:
+    """格子内のランダムな地点・日付で厳密計算との最大誤差（秒）を求める"""
+    rng = np.random.default_rng(seed)
+    lat = table.lat0 + rng.uniform(0, table.dlat * (table.nlat - 1), samples)
+    lon = table.lon0 + rng.uniform(0, table.dlon * (table.nlon - 1), samples)
+    day_seconds = (table.start_day + rng.integers(0, table.days, samples)) * 86400.0
+
+    interpolated, covered = table.interpolate(lat, lon, day_seconds)
+    exact = SolarService().solar_event_julian_days(lat[covered], lon[covered], day_seconds[covered])
+
+    max_error = 0.0
+    for key in EPHEMERIS_EVENTS:
+        diff = np.abs(interpolated[key][covered] - exact[key]) * 86400
+        if np.isfinite(diff).any():
+            max_error = max(max_error, float(np.nanmax(diff)))
+    return max_error
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser(description="太陽イベントのエフェメリスファイルを作成・検証する")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build")
+    build.add_argument("--out", required=True)
+    build.add_argument("--start", type=date.fromisoformat, default=date(date.today().year, 1, 1))
+    build.add_argument("--days", type=int, default=366)
+    build.add_argument("--lat-min", type=float, default=20.0)
+    build.add_argument("--lat-max", type=float, default=46.0)
+    build.add_argument("--lng-min", type=float, default=122.0)
+    build.add_argument("--lng-max", type=float, default=154.0)
+    build.add_argument("--step", type=float, default=0.25)
+
+    verify = sub.add_parser("verify")
+    verify.add_argument("path")
+    verify.add_argument("--samples", type=int, default=100000)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        table = build_table(
+            args.out,
+            args.start,
+            args.days,
+            (args.lat_min, args.lat_max),
+            (args.lng_min, args.lng_max),
+            args.step
+        )
+        print(f"{args.out}: {table.days}日 × {table.nlat}×{table.nlon}格子, 最大誤差 {table.max_error_seconds:.2f}秒")
+    else:
+        table = EphemerisTable(args.path)
+        print(f"最大誤差 {measure_error(table, args.samples):.2f}秒（ヘッダー記録値 {table.max_error_seconds:.2f}秒）")
+
+
+if __name__ == "__main__":
+    _main()
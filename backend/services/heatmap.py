@@ -0,0 +1,91 @@
+"""
+地図オーバーレイ用のグリッド
+
+中心から半径 radius_km の正方形を N×N 点に分け、各点を天気タイルに割り当てる。
+タイルの判定は格子の添字を配列で計算するので、ジオハッシュの文字列化は
+タイルごとに1回（fetch_tiles に渡す中心点）だけで済む。
+日の入は近似式でまとめて計算し、calibrate_sunsets で SOLAR_BACKEND の方式に合わせる。
+"""
+import math
+from datetime import date, datetime
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from utils import geohash
+
+_KM_PER_DEGREE = 111.32
+
+
+class HeatmapGrid:
+    """N×N の格子点（北西から行優先）と、各点が属するタイル"""
+
+    def __init__(self, latitude: float, longitude: float, size: int, radius_km: float, precision: int):
+        lat_span = radius_km / _KM_PER_DEGREE
+        lng_span = radius_km / (_KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        self.size = size
+        self.latitudes = np.linspace(latitude + lat_span, latitude - lat_span, size)
+        self.longitudes = np.linspace(longitude - lng_span, longitude + lng_span, size)
+        grid_lat, grid_lng = np.meshgrid(self.latitudes, self.longitudes, indexing="ij")
+        self.point_latitudes = np.clip(grid_lat.ravel(), -90.0, 90.0)
+        self.point_longitudes = (grid_lng.ravel() + 180) % 360 - 180
+
+        dlat, dlng = geohash.cell_size(precision)
+        cells = np.stack([
+            np.floor((self.point_latitudes + 90) / dlat),
+            np.floor((self.point_longitudes + 180) / dlng)
+        ], axis=-1).astype(np.int64)
+        unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+        # 点 i はタイル tile_index[i] に属する
+        self.tile_index = inverse.reshape(-1)
+        self.tile_centers: List[Tuple[float, float]] = [
+            (float((row + 0.5) * dlat - 90), float((col + 0.5) * dlng - 180)) for row, col in unique_cells
+        ]
+
+    @property
+    def tile_count(self) -> int:
+        return len(self.tile_centers)
+
+
+def _sunset_seconds(sun: Callable[[float, float, date], Dict[str, datetime]], latitude: float, longitude: float, day: date) -> float:
+    try:
+        return sun(latitude, longitude, day)["sunset"].timestamp()
+    except ValueError:
+        # 白夜・極夜
+        return math.nan
+
+
+def calibrate_sunsets(
+    grid: HeatmapGrid,
+    sunsets: np.ndarray,
+    sun: Callable[[float, float, date], Dict[str, datetime]],
+    day: date
+) -> np.ndarray:
+    """
+    近似式でまとめて計算した日の入（UNIX秒）を、設定された方式（sun）の値に合わせる
+
+    格子の 3×3 の代表点だけ sun() で計算し、近似式との差（大気差・式の違い。数分）を
+    格子全体に双線形補間して足す。差は数十kmの範囲ではほとんど変わらないので補間の誤差は1秒未満。
+    代表点で日の入が起きない、または差が1時間を超える（日付の解釈が違う）ときは全点を sun() で計算する。
+    """
+    size = grid.size
+    latitudes = grid.point_latitudes.reshape(size, size)
+    longitudes = grid.point_longitudes.reshape(size, size)
+    approximate = sunsets.reshape(size, size)
+    samples = sorted({0, (size - 1) // 2, size - 1})
+
+    corrections = np.array([
+        [_sunset_seconds(sun, latitudes[i, j], longitudes[i, j], day) - approximate[i, j] for j in samples]
+        for i in samples
+    ])
+    if not np.isfinite(corrections).all() or np.abs(corrections).max() > 3600:
+        return np.array([
+            _sunset_seconds(sun, latitude, longitude, day)
+            for latitude, longitude in zip(grid.point_latitudes.tolist(), grid.point_longitudes.tolist())
+        ])
+
+    # 行ごとに経度方向、次に列ごとに緯度方向へ線形補間する
+    index = np.arange(size)
+    along_rows = np.array([np.interp(index, samples, row) for row in corrections])
+    correction = np.array([np.interp(index, samples, column) for column in along_rows.T]).T
+    return (approximate + correction).ravel()
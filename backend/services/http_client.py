@@ -0,0 +1,55 @@
+import importlib.util
+import os
+from typing import Optional
+
+import httpx
+
+
+# 上流API（OpenWeatherMap）呼び出し用の共有クライアント
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _env_float(name: str, default: str) -> float:
+    return float(os.getenv(name, default))
+
+
+def _build_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=_env_float("UPSTREAM_KEEPALIVE_EXPIRY", "30")
+    )
+    timeout = httpx.Timeout(
+        connect=_env_float("UPSTREAM_CONNECT_TIMEOUT", "2.0"),
+        read=_env_float("UPSTREAM_READ_TIMEOUT", "5.0"),
+        write=_env_float("UPSTREAM_WRITE_TIMEOUT", "5.0"),
+        pool=_env_float("UPSTREAM_POOL_TIMEOUT", "2.0")
+    )
+    # HTTP/2 は h2 パッケージが入っている場合のみ有効にする
+    http2 = importlib.util.find_spec("h2") is not None
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2, transport=transport)
+
+
+async def open_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """アプリ起動時に共有クライアントを作成する（transport はテスト・ベンチマーク用）"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = _build_client(transport)
+    return _client
+
+
+async def close_http_client() -> None:
+    """アプリ終了時にコネクションプールを閉じる"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """共有クライアントを返す（lifespan外から呼ばれた場合はその場で作成）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
@@ -0,0 +1,245 @@
+"""
+Prometheus 形式のメトリクス
+
+依存を増やさないための最小実装。記録はロック1回と配列の加算だけで、
+テキストへの整形は /api/metrics が呼ばれたときにだけ行う。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# 秒単位のバケット（ローカル計算の数µsから上流の数秒まで）
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # ラベルごとに [各バケットの件数..., 合計値, 件数]
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bucket_names = self.labelnames + ("le",)
+        with self._lock:
+            series_items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_names, labels + (repr(bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_names, labels + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """収集時に関数を呼んで値を得るメトリクス（キャッシュの統計など）"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        metric_type: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Iterable[Tuple[LabelValues, float]]]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "skyle_http_request_duration_seconds",
+    "APIのレスポンス時間",
+    ("method", "route", "status")
+))
+UPSTREAM_DURATION = registry.register(Histogram(
+    "skyle_upstream_request_duration_seconds",
+    "OpenWeatherMap 呼び出しの所要時間",
+    ("endpoint", "status")
+))
+UPSTREAM_INFLIGHT = registry.register(Gauge(
+    "skyle_upstream_inflight_requests",
+    "実行中の OpenWeatherMap 呼び出し数（コネクションプールの待ち行列を含む）"
+))
+UPSTREAM_QUEUE_WAIT = registry.register(Histogram(
+    "skyle_upstream_queue_wait_seconds",
+    "上流呼び出しの許可が出るまでの待ち時間（クォータのトークンバケット）",
+    ("priority",)
+))
+UPSTREAM_REJECTED = registry.register(Counter(
+    "skyle_upstream_rejected_total",
+    "締め切りまでに上流を呼べず断った回数",
+    ("priority", "reason")
+))
+UPSTREAM_HEDGES = registry.register(Counter(
+    "skyle_upstream_hedges_total",
+    "遅い上流呼び出しに重ねて出したヘッジ（won = ヘッジが先に返った / lost / skipped = トークンがなく出さなかった）",
+    ("outcome",)
+))
+UPSTREAM_BREAKER_TRANSITIONS = registry.register(Counter(
+    "skyle_upstream_breaker_transitions_total",
+    "上流のサーキットブレーカーの状態遷移",
+    ("from_state", "to_state")
+))
+UPSTREAM_BREAKER_STATE = registry.register(Gauge(
+    "skyle_upstream_breaker_state",
+    "上流のサーキットブレーカーの現在の状態（該当する state が 1）",
+    ("state",)
+))
+COMPUTE_DURATION = registry.register(Histogram(
+    "skyle_compute_duration_seconds",
+    "太陽時刻・可視性判定などローカル計算の所要時間",
+    ("stage",)
+))
+
+
+class MetricsMiddleware:
+    """
+    ルートごとのレイテンシを記録するASGIミドルウェア
+
+    ストリーミング（SSE・NDJSON）のように接続が長く続くルートは exclude に入れる
+    """
+
+    def __init__(self, app, exclude: Sequence[str] = ()):
+        self.app = app
+        self.exclude = frozenset(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            if path not in self.exclude:
+                REQUEST_DURATION.observe(time.perf_counter() - start, scope["method"], path, status[0])
@@ -0,0 +1,291 @@
+"""
+観測データの保存
+
+上流から取得した天気データと、そこから計算した可視性・ハロのスコアを1件ずつ記録する。
+record() はキューに積むだけで、JSON化と一括INSERTは書き込みスレッドで行う。
+キューがあふれたら捨てて数えるので、DBが遅くても止まってもリクエストは待たされない。
+
+環境変数:
+    OBSERVATION_STORE           auto（既定）/ postgres / sqlite / off
+                                auto は設定したときだけ保存する（既定では保存しない）:
+                                DB_HOST があり psycopg が入っていれば Postgres、
+                                OBSERVATION_SQLITE_PATH があれば SQLite、どちらもなければ off
+    DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+                                Postgres の接続先（compose.yml と同じ既定値。
+                                DB_PORT はホストに公開しているポート 5433）
+    DB_POOL_MAX                 コネクションプールの上限（既定 4）
+    OBSERVATION_SQLITE_PATH     SQLite のファイル（OBSERVATION_STORE=sqlite で未指定なら skyle_observations.db）
+                                SQLite は1プロセス用。uvicorn --workers を2以上にすると同じファイルの
+                                ロックを取り合って書き込みが失敗（failed）するので、Postgres を使う
+    OBSERVATION_BATCH_SIZE      1回のINSERTでまとめる件数（既定 500）
+    OBSERVATION_FLUSH_INTERVAL  件数に満たなくても書き出す間隔（秒, 既定 2）
+    OBSERVATION_QUEUE_SIZE      キューの上限（既定 10000）
+
+Postgres を使う場合は psycopg を別途インストールする:
+    pip install "psycopg[binary,pool]"
+"""
+import importlib.util
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.log import get_logger
+
+logger = get_logger("observations")
+
+# (kind, tile_key, latitude, longitude, observed_at, fetched_at, payload,
+#  visibility_score, visibility_level, halo_score, halo_level)
+Row = Tuple[Any, ...]
+
+_COLUMNS = (
+    "kind, tile_key, latitude, longitude, observed_at, fetched_at, payload, "
+    "visibility_score, visibility_level, halo_score, halo_level"
+)
+
+
+class SQLiteWriter:
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def setup(self) -> None:
+        # 接続は書き込みスレッドで作る（sqlite3 の接続はスレッドをまたげない）
+        # 書き込みに失敗した後のやり直しでは前の接続を閉じてから開き直す
+        self.close()
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS weather_observations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                tile_key TEXT NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                observed_at TEXT,
+                fetched_at TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                visibility_score INTEGER,
+                visibility_level TEXT,
+                halo_score INTEGER,
+                halo_level TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS weather_observations_tile_idx "
+            "ON weather_observations (tile_key, fetched_at)"
+        )
+        self._conn.commit()
+
+    def write_many(self, rows: Sequence[Row]) -> None:
+        converted = [
+            row[:4] + (_isoformat(row[4]), _isoformat(row[5]), json.dumps(row[6], ensure_ascii=False)) + row[7:]
+            for row in rows
+        ]
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT INTO weather_observations ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                converted
+            )
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class PostgresWriter:
+    name = "postgres"
+
+    def __init__(self, conninfo: str, pool_size: int):
+        from psycopg_pool import ConnectionPool
+
+        # open=False: 接続は書き込みスレッドの setup() で開く（起動を待たせない）
+        self._pool = ConnectionPool(conninfo, min_size=1, max_size=pool_size, open=False)
+
+    def setup(self) -> None:
+        self._pool.open()
+        with self._pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS weather_observations (
+                    id BIGSERIAL PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    tile_key TEXT NOT NULL,
+                    latitude DOUBLE PRECISION NOT NULL,
+                    longitude DOUBLE PRECISION NOT NULL,
+                    observed_at TIMESTAMPTZ,
+                    fetched_at TIMESTAMPTZ NOT NULL,
+                    payload JSONB NOT NULL,
+                    visibility_score INTEGER,
+                    visibility_level TEXT,
+                    halo_score INTEGER,
+                    halo_level TEXT
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS weather_observations_tile_idx "
+                "ON weather_observations (tile_key, fetched_at)"
+            )
+
+    def write_many(self, rows: Sequence[Row]) -> None:
+        from psycopg.types.json import Jsonb
+
+        converted = [row[:6] + (Jsonb(row[6]),) + row[7:] for row in rows]
+        with self._pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    f"INSERT INTO weather_observations ({_COLUMNS}) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    converted
+                )
+
+    def close(self) -> None:
+        self._pool.close()
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _from_timestamp(value: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
+
+
+class ObservationStore:
+    """キューと書き込みスレッド1本で観測データをまとめて保存する"""
+
+    def __init__(
+        self,
+        writer,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        queue_size: Optional[int] = None
+    ):
+        self.writer = writer
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv("OBSERVATION_BATCH_SIZE", "500"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("OBSERVATION_FLUSH_INTERVAL", "2"))
+        self._queue: "queue.Queue[Optional[Row]]" = queue.Queue(
+            queue_size if queue_size is not None else int(os.getenv("OBSERVATION_QUEUE_SIZE", "10000"))
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._ready = False
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def record(self, kind: str, tile, scores: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None) -> None:
+        """タイル1件分を積む（ブロックしない）"""
+        visibility, halo = scores if scores is not None else ({}, {})
+        row = (
+            kind, tile.key, tile.latitude, tile.longitude,
+            tile.data.get("dt"), tile.fetched_at, tile.data,
+            visibility.get("score"), visibility.get("level"), halo.get("score"), halo.get("level")
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.recorded += 1
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="observation-writer", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """残りを書き出してスレッドを止める（ブロックするので to_thread などから呼ぶ）"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        batch: List[Row] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                row = ()
+            if row is None:
+                self._flush(batch)
+                self.writer.close()
+                return
+            if row:
+                batch.append(row)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch: List[Row]) -> None:
+        if not batch:
+            return
+        rows = [row[:4] + (_from_timestamp(row[4]), _from_timestamp(row[5])) + row[6:] for row in batch]
+        try:
+            if not self._ready:
+                self.writer.setup()
+                self._ready = True
+            self.writer.write_many(rows)
+        except Exception as e:
+            # 書けなかった分は捨てる（次のバッチで接続・テーブル作成からやり直す）
+            self._ready = False
+            self.failed += len(rows)
+            logger.error("観測データの書き込みに失敗しました", extra={"fields": {
+                "store": self.writer.name, "rows": len(rows), "error": str(e)
+            }})
+            return
+        self.written += len(rows)
+        self.batches += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "store": self.writer.name,
+            "queued": self._queue.qsize(),
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+
+def _postgres_conninfo() -> str:
+    return "host={} port={} user={} password={} dbname={}".format(
+        os.getenv("DB_HOST", "localhost"),
+        os.getenv("DB_PORT", "5433"),
+        os.getenv("DB_USER", "skyle_user"),
+        os.getenv("DB_PASSWORD", "skyle_password"),
+        os.getenv("DB_NAME", "skyle_db")
+    )
+
+
+def create_observation_store() -> Optional[ObservationStore]:
+    """OBSERVATION_STORE に従って保存先を選ぶ（保存しないなら None）"""
+    mode = os.getenv("OBSERVATION_STORE", "auto")
+    if mode == "off":
+        return None
+
+    sqlite_path = os.getenv("OBSERVATION_SQLITE_PATH")
+    if mode == "postgres" or (mode == "auto" and os.getenv("DB_HOST")):
+        if importlib.util.find_spec("psycopg_pool") is not None:
+            return ObservationStore(PostgresWriter(_postgres_conninfo(), int(os.getenv("DB_POOL_MAX", "4"))))
+        if not sqlite_path:
+            logger.warning("psycopg がインストールされていないため観測データを保存しません")
+            return None
+        logger.warning("psycopg がインストールされていないため SQLite に保存します")
+    elif mode == "auto" and not sqlite_path:
+        return None
+
+    return ObservationStore(SQLiteWriter(sqlite_path or "skyle_observations.db"))
@@ -0,0 +1,114 @@
+"""
+数日先のマジックアワー・ブルーモーメント予報
+3時間ごとの予報スロットを各日の時間帯（窓）に補間し、まとめてスコアリングする
+
+build_windows は天気タイルが届くたびに呼ばれるので、NumPy は rank_moments の中で読み込む
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from utils.visibility import (
+    calculate_halo_scores_batch,
+    calculate_visibility_scores_batch,
+    get_halo_level_and_message,
+    get_level_and_message,
+)
+
+
+# (種類, 基準イベント, 開始オフセット, 終了オフセット) ― /api/solar/times と同じ定義
+MOMENT_WINDOWS = (
+    ("golden_hour_morning", "sunrise", timedelta(minutes=-30), timedelta(0)),
+    ("golden_hour_evening", "sunset", timedelta(0), timedelta(minutes=30)),
+    ("blue_hour_morning", "dawn", timedelta(minutes=-20), timedelta(0)),
+    ("blue_hour_evening", "dusk", timedelta(0), timedelta(minutes=20)),
+)
+
+
+def build_windows(days: Iterable[date], get_sun: Callable[[date], Dict[str, datetime]]) -> List[Tuple[str, datetime, datetime]]:
+    """各日の太陽時刻から (種類, 開始, 終了) の窓を作る（太陽が昇らない日などは飛ばす）"""
+    windows = []
+    for day in days:
+        try:
+            s = get_sun(day)
+        except ValueError:
+            continue
+        for kind, event, start_offset, end_offset in MOMENT_WINDOWS:
+            windows.append((kind, s[event] + start_offset, s[event] + end_offset))
+    return windows
+
+
+def rank_moments(
+    forecast_data: Dict[str, Any],
+    windows: List[Tuple[str, datetime, datetime]],
+    now: datetime,
+    limit: int = 10
+) -> List[Dict[str, Any]]:
+    """
+    予報スロットを窓の中間時刻に線形補間し、スコアの高い順に返す
+
+    Args:
+        forecast_data: OpenWeatherMap /forecast のレスポンス
+        windows: build_windows の結果
+        now: これより前に終わる窓は除外する
+    """
+    import numpy as np
+
+    slots = forecast_data.get("list", [])
+    if not slots:
+        return []
+
+    slot_times = np.array([item["dt"] for item in slots], dtype=np.float64)
+    clouds = np.array([item["clouds"]["all"] for item in slots], dtype=np.float64)
+    humidity = np.array([item["main"]["humidity"] for item in slots], dtype=np.float64)
+    visibility = np.array([item.get("visibility", np.nan) for item in slots], dtype=np.float64)
+    conditions = np.array([item["weather"][0]["main"] for item in slots])
+
+    # 予報の範囲内にあり、まだ終わっていない窓だけを対象にする
+    upcoming = [
+        w for w in windows
+        if w[2] > now and slot_times[0] <= (w[1] + (w[2] - w[1]) / 2).timestamp() <= slot_times[-1]
+    ]
+    if not upcoming:
+        return []
+
+    midpoints = np.array([(start + (end - start) / 2).timestamp() for _, start, end in upcoming])
+    nearest = np.abs(midpoints[:, None] - slot_times[None, :]).argmin(axis=1)
+
+    window_clouds = np.interp(midpoints, slot_times, clouds)
+    window_humidity = np.interp(midpoints, slot_times, humidity)
+    window_visibility = np.interp(midpoints, slot_times, visibility)
+    window_conditions = conditions[nearest]
+
+    scores = calculate_visibility_scores_batch(window_clouds, window_humidity, window_visibility, window_conditions)
+    halo_scores = calculate_halo_scores_batch(window_clouds, window_humidity, window_visibility, window_conditions)
+
+    # スコアの高い順（同点なら早い順）
+    order = sorted(range(len(upcoming)), key=lambda i: (-scores[i], upcoming[i][1]))[:limit]
+
+    moments = []
+    for i in order:
+        kind, start, end = upcoming[i]
+        level, message = get_level_and_message(int(scores[i]), window_clouds[i], window_humidity[i])
+        halo_level, halo_message = get_halo_level_and_message(int(halo_scores[i]))
+        moments.append({
+            "type": kind,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "visibility": {
+                "score": int(scores[i]),
+                "level": level,
+                "message": message
+            },
+            "haloVisibility": {
+                "score": int(halo_scores[i]),
+                "level": halo_level,
+                "message": halo_message
+            },
+            "weather": {
+                "description": slots[nearest[i]]["weather"][0]["description"],
+                "clouds": round(float(window_clouds[i]), 1),
+                "humidity": round(float(window_humidity[i]), 1),
+                "visibility": None if np.isnan(window_visibility[i]) else round(float(window_visibility[i]))
+            }
+        })
+    return moments
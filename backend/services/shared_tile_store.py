@@ -0,0 +1,322 @@
+"""
+ワーカープロセス間で共有する天気タイルの置き場所
+
+uvicorn --workers N で起動すると WeatherTileCache はワーカーごとに別々になり、
+同じタイルを N 回取りに行ってしまう。メモリマップしたファイル（/dev/shm など）に
+固定長のレコードを並べ、全ワーカーから同じタイルを読めるようにする。
+
+レイアウト:
+    ヘッダー 64バイト   magic, slots, ways, record_size
+    レコード × slots    set_index = crc32(key) % (slots / ways) の ways 個のどれかに入る
+
+    レコード（record_size バイト）
+        0   seq         uint32   書き込み中は奇数（seqlock）
+        4   length      uint32   payload のバイト数（0 = データなし）
+        8   fetched_at  float64  取得時刻（UNIX秒）
+        16  lease_until float64  取得中のワーカーがいる期限（UNIX秒）
+        24  lease_pid   uint32   取得中のワーカーの pid
+        28  key         12s      ジオハッシュ（右を NUL で埋める）
+        40  payload              上流のJSON（orjson）
+
+- 読み込みはロックを取らない。seq が偶数で、コピーの前後で変わっていなければ採用する
+- 書き込みはセット単位のバイト範囲ロック（fcntl.lockf）で直列化する
+- セットが埋まっていたら、取得中でないレコードのうち一番古いものを上書きする
+- 取得のリース: タイルを上流に取りに行くワーカーは lease_until を立てる。
+  他のワーカーはその間は上流に行かず、レコードが更新されるのを待つ。
+  取りに行ったワーカーが落ちてもリースの期限が切れれば別のワーカーが取りに行く
+- スロット数やレコードの大きさが違うファイルは切り詰めずに、新しいファイルを作って差し替える
+  （入れ替え中の古いワーカーは古いファイルを使い続け、新旧のワーカーの間では共有しない）
+
+環境変数:
+    SHARED_CACHE_PATH         共有ファイル（例: /dev/shm/skyle-weather.cache）。空なら共有しない
+    SHARED_CACHE_SLOTS        レコード数（既定 WEATHER_CACHE_MAX_ENTRIES と同じ 20000）
+    SHARED_CACHE_RECORD_SIZE  1レコードのバイト数（既定 1024）。入らないタイルは共有しない
+"""
+import importlib.util
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+from utils.log import get_logger
+
+logger = get_logger("shared_cache")
+
+_MAGIC = b"SKYLETC1"
+_HEADER = struct.Struct("<8sIII")
+_HEADER_SIZE = 64
+_RECORD = struct.Struct("<IIddI12s")
+_SEQ = struct.Struct("<I")
+_KEY_SIZE = 12
+_READ_RETRIES = 8
+
+
+class SharedTileStore:
+    def __init__(self, path: str, slots: int = 20000, ways: int = 8, record_size: int = 1024):
+        import fcntl
+
+        if record_size <= _RECORD.size:
+            raise ValueError(f"record_size は {_RECORD.size} バイトより大きくしてください")
+        self._fcntl = fcntl
+        self.path = path
+        self.ways = ways
+        self.sets = max(1, slots // ways)
+        self.slots = self.sets * ways
+        self.record_size = record_size
+        self.pid = os.getpid()
+        size = _HEADER_SIZE + self.slots * record_size
+
+        self._fd = self._open(path, size, _HEADER.pack(_MAGIC, self.slots, ways, record_size))
+        self._mm = mmap.mmap(self._fd, size)
+
+        self.reads = 0
+        self.read_hits = 0
+        self.read_retries = 0
+        self.writes = 0
+        self.evictions = 0
+        self.oversize = 0
+        self.leases = 0
+        self.lease_conflicts = 0
+
+    def _open(self, path: str, size: int, expected: bytes) -> int:
+        """
+        共有ファイルを開く（なければ作る）。ヘッダーの確認と作成はヘッダーのロックの中で行う
+
+        設定の違うファイルは切り詰めない（古いワーカーがマップしていると SIGBUS になる）。
+        一時ファイルに作ってから os.replace で差し替え、古いワーカーは古いファイルを使い続ける。
+        差し替えと同時に開いたワーカーは、パスの指す先が変わっていたら開き直す。
+        """
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                ready = self._prepare(fd, path, size, expected)
+            except BaseException:
+                os.close(fd)
+                raise
+            if ready:
+                return fd
+            os.close(fd)
+
+    def _prepare(self, fd: int, path: str, size: int, expected: bytes) -> bool:
+        """開いたファイルをそのまま使えるなら True（差し替えた・差し替えられていたら False で開き直す）"""
+        fcntl = self._fcntl
+        fcntl.lockf(fd, fcntl.LOCK_EX, _HEADER_SIZE, 0, os.SEEK_SET)
+        try:
+            stat = os.fstat(fd)
+            try:
+                if os.stat(path).st_ino != stat.st_ino:
+                    return False
+            except FileNotFoundError:
+                return False
+            if os.pread(fd, _HEADER.size, 0) == expected:
+                return True
+            if stat.st_size == 0:
+                # 作ったばかりの空のファイル（ヘッダーを書くまで誰もマップしない）
+                os.ftruncate(fd, size)
+                os.pwrite(fd, expected, 0)
+                return True
+            logger.warning("共有キャッシュの設定が変わったため新しいファイルに差し替えます", extra={"fields": {"path": path}})
+            self._replace(path, size, expected)
+            return False
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, _HEADER_SIZE, 0, os.SEEK_SET)
+
+    def _replace(self, path: str, size: int, expected: bytes) -> None:
+        temp = f"{path}.{self.pid}.tmp"
+        fd = os.open(temp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            os.pwrite(fd, expected, 0)
+            os.replace(temp, path)
+        except BaseException:
+            try:
+                os.unlink(temp)
+            except FileNotFoundError:
+                pass
+            raise
+        finally:
+            os.close(fd)
+
+    # ------------------------------------------------------------------
+    # レコードの位置とロック
+
+    def _set_index(self, key: bytes) -> int:
+        # プロセスごとに変わる hash() ではなく crc32 を使う
+        return zlib.crc32(key) % self.sets
+
+    def _offset(self, set_index: int, way: int) -> int:
+        return _HEADER_SIZE + (set_index * self.ways + way) * self.record_size
+
+    def _lock(self, set_index: int) -> None:
+        # ファイルの中身とは関係なく、セット番号のバイトをロックの単位に使う
+        self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX, 1, _HEADER_SIZE + set_index, os.SEEK_SET)
+
+    def _unlock(self, set_index: int) -> None:
+        self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN, 1, _HEADER_SIZE + set_index, os.SEEK_SET)
+
+    def _find(self, set_index: int, key: bytes) -> Optional[int]:
+        for way in range(self.ways):
+            offset = self._offset(set_index, way)
+            if self._mm[offset + 28:offset + 40] == key:
+                return offset
+        return None
+
+    def _claim(self, set_index: int, key: bytes, now: float) -> int:
+        """キーのレコードを返す（なければ空き、または取得中でない一番古いレコードを空けて使う）。ロック中に呼ぶ"""
+        offset = self._find(set_index, key)
+        if offset is not None:
+            return offset
+        victim = None
+        victim_rank = None
+        for way in range(self.ways):
+            candidate = self._offset(set_index, way)
+            _, length, fetched_at, lease_until, _, stored_key = _RECORD.unpack_from(self._mm, candidate)
+            if stored_key == b"\0" * _KEY_SIZE:
+                victim = candidate
+                break
+            # 取得中のレコードはなるべく残し、その中で一番古いものを選ぶ
+            rank = (lease_until > now, fetched_at)
+            if victim_rank is None or rank < victim_rank:
+                victim, victim_rank = candidate, rank
+        else:
+            self.evictions += 1
+        self._write(victim, 0, 0.0, 0.0, 0, key, b"")
+        return victim
+
+    def _write(self, offset: int, length: int, fetched_at: float, lease_until: float, lease_pid: int, key: bytes, payload: bytes) -> None:
+        """seqlock の手順でレコードを書き換える（ロック中に呼ぶ）"""
+        seq = _SEQ.unpack_from(self._mm, offset)[0]
+        _SEQ.pack_into(self._mm, offset, (seq + 1) & 0xFFFFFFFF)
+        if payload:
+            start = offset + _RECORD.size
+            self._mm[start:start + len(payload)] = payload
+        _RECORD.pack_into(self._mm, offset, (seq + 1) & 0xFFFFFFFF, length, fetched_at, lease_until, lease_pid, key)
+        _SEQ.pack_into(self._mm, offset, (seq + 2) & 0xFFFFFFFF)
+
+    # ------------------------------------------------------------------
+    # 読み込み（ロックなし）
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """(fetched_at, data) を返す（なければ None）"""
+        encoded = key.encode("ascii")
+        self.reads += 1
+        set_index = self._set_index(encoded)
+        for way in range(self.ways):
+            offset = self._offset(set_index, way)
+            if self._mm[offset + 28:offset + 28 + len(encoded)] != encoded:
+                continue
+            for _ in range(_READ_RETRIES):
+                seq, length, fetched_at, _, _, stored_key = _RECORD.unpack_from(self._mm, offset)
+                if seq & 1 or length > self.record_size - _RECORD.size:
+                    self.read_retries += 1
+                    continue
+                payload = self._mm[offset + _RECORD.size:offset + _RECORD.size + length]
+                if _SEQ.unpack_from(self._mm, offset)[0] != seq:
+                    self.read_retries += 1
+                    continue
+                if stored_key.rstrip(b"\0") != encoded or not length:
+                    return None
+                self.read_hits += 1
+                return fetched_at, orjson.loads(payload)
+            return None
+        return None
+
+    # ------------------------------------------------------------------
+    # 書き込み（セットのロックを取る）
+
+    def acquire_lease(self, key: str, duration: float) -> bool:
+        """上流への取得を引き受ける。他のワーカーが取得中なら False"""
+        encoded = key.encode("ascii").ljust(_KEY_SIZE, b"\0")
+        set_index = self._set_index(encoded.rstrip(b"\0"))
+        now = time.time()
+        self._lock(set_index)
+        try:
+            offset = self._claim(set_index, encoded, now)
+            _, length, fetched_at, lease_until, lease_pid, _ = _RECORD.unpack_from(self._mm, offset)
+            if lease_until > now and lease_pid != self.pid:
+                self.lease_conflicts += 1
+                return False
+            self._write(offset, length, fetched_at, now + duration, self.pid, encoded, b"")
+            self.leases += 1
+            return True
+        finally:
+            self._unlock(set_index)
+
+    def release_lease(self, key: str) -> None:
+        """取得に失敗したときにリースを手放す（待っているワーカーがすぐ取りに行けるように）"""
+        encoded = key.encode("ascii").ljust(_KEY_SIZE, b"\0")
+        set_index = self._set_index(encoded.rstrip(b"\0"))
+        self._lock(set_index)
+        try:
+            offset = self._find(set_index, encoded)
+            if offset is None:
+                return
+            _, length, fetched_at, _, lease_pid, _ = _RECORD.unpack_from(self._mm, offset)
+            if lease_pid == self.pid:
+                self._write(offset, length, fetched_at, 0.0, 0, encoded, b"")
+        finally:
+            self._unlock(set_index)
+
+    def put(self, key: str, fetched_at: float, data: Dict[str, Any]) -> bool:
+        """タイルを書き込み、リースを外す。レコードに入らなければ False"""
+        payload = orjson.dumps(data)
+        encoded = key.encode("ascii").ljust(_KEY_SIZE, b"\0")
+        set_index = self._set_index(encoded.rstrip(b"\0"))
+        fits = len(payload) <= self.record_size - _RECORD.size
+        if not fits:
+            self.oversize += 1
+        self._lock(set_index)
+        try:
+            offset = self._claim(set_index, encoded, time.time())
+            if fits:
+                self._write(offset, len(payload), fetched_at, 0.0, 0, encoded, payload)
+                self.writes += 1
+            else:
+                _, length, old_fetched_at, _, _, _ = _RECORD.unpack_from(self._mm, offset)
+                self._write(offset, length, old_fetched_at, 0.0, 0, encoded, b"")
+            return fits
+        finally:
+            self._unlock(set_index)
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "pid": self.pid,
+            "slots": self.slots,
+            "record_size": self.record_size,
+            "reads": self.reads,
+            "read_hits": self.read_hits,
+            "read_retries": self.read_retries,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "oversize": self.oversize,
+            "leases": self.leases,
+            "lease_conflicts": self.lease_conflicts
+        }
+
+
+def create_shared_tile_store() -> Optional[SharedTileStore]:
+    """SHARED_CACHE_PATH があれば共有ストアを開く（使えなければ None でワーカーごとのキャッシュのまま）"""
+    path = os.getenv("SHARED_CACHE_PATH")
+    if not path:
+        return None
+    if importlib.util.find_spec("fcntl") is None:
+        logger.warning("このOSでは共有キャッシュを使えません（fcntl がありません）")
+        return None
+    try:
+        return SharedTileStore(
+            path,
+            slots=int(os.getenv("SHARED_CACHE_SLOTS", os.getenv("WEATHER_CACHE_MAX_ENTRIES", "20000"))),
+            record_size=int(os.getenv("SHARED_CACHE_RECORD_SIZE", "1024"))
+        )
+    except (OSError, ValueError) as e:
+        logger.warning("共有キャッシュを開けませんでした", extra={"fields": {"path": path, "error": str(e)}})
+        return None
@@ -0,0 +1,118 @@
+"""
+太陽時刻の計算方式（SOLAR_BACKEND で切り替える）
+
+    astral     astral.sun.sun（大気差込み。既定）
+    formula    SolarService の近似式（高度0°基準・黄道傾斜23.45°固定）
+    ephemeris  事前計算テーブルの補間（範囲外は formula と同じ厳密計算）
+
+どの方式も sun() は astral.sun.sun と同じキー（dawn, sunrise, noon, sunset, dusk）の
+dict を返し、イベントが起きない日は ValueError を送出する。
+精度と速度の比較は benchmarks/solar_accuracy.py で測る。
+"""
+import math
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+import pytz
+
+if TYPE_CHECKING:
+    from services.solar_service import SolarService
+
+_UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_UNIX_EPOCH_JD = 2440587.5
+
+# astral のキー -> SolarService のイベント名（dawn / dusk は市民薄明）
+_EVENT_KEYS = (
+    ("dawn", "civil_dawn"),
+    ("sunrise", "sunrise"),
+    ("noon", "solar_noon"),
+    ("sunset", "sunset"),
+    ("dusk", "civil_dusk"),
+)
+
+
+class SolarBackend(ABC):
+    name = ""
+
+    def __init__(self, tz_name: str = "Asia/Tokyo"):
+        self.tz = pytz.timezone(tz_name)
+
+    @abstractmethod
+    def sun(self, latitude: float, longitude: float, day: date) -> Dict[str, datetime]:
+        """1地点・1日分の dawn / sunrise / noon / sunset / dusk（起きない日は ValueError）"""
+
+    def _from_julian_days(self, events: Dict[str, Optional[float]]) -> Dict[str, datetime]:
+        result = {}
+        for key, event in _EVENT_KEYS:
+            value = events[event]
+            if value is None or value != value:
+                raise ValueError(f"この日は {key} が起きません")
+            seconds = math.floor((value - _UNIX_EPOCH_JD) * 86400)
+            result[key] = (_UNIX_EPOCH + timedelta(seconds=seconds)).astimezone(self.tz)
+        return result
+
+
+class AstralBackend(SolarBackend):
+    name = "astral"
+
+    def __init__(self, tz_name: str = "Asia/Tokyo"):
+        super().__init__(tz_name)
+        # astral は使うときだけ読み込む（formula / ephemeris では不要）
+        from astral import Observer
+        from astral.sun import sun
+
+        self._observer = Observer
+        self._sun = sun
+
+    def sun(self, latitude: float, longitude: float, day: date) -> Dict[str, datetime]:
+        return self._sun(self._observer(latitude=latitude, longitude=longitude), date=day, tzinfo=self.tz)
+
+
+class FormulaBackend(SolarBackend):
+    name = "formula"
+
+    def __init__(self, solar_service: "SolarService", tz_name: str = "Asia/Tokyo"):
+        super().__init__(tz_name)
+        self.solar_service = solar_service
+
+    def sun(self, latitude: float, longitude: float, day: date) -> Dict[str, datetime]:
+        julian_day = self.solar_service._get_julian_day(datetime(day.year, day.month, day.day))
+        return self._from_julian_days(self.solar_service._calculate_solar_day(latitude, longitude, julian_day))
+
+
+class EphemerisBackend(SolarBackend):
+    """
+    1件ずつの問い合わせは EphemerisTable.interpolate_point（四隅だけ読むスカラー版）で答え、
+    テーブルの範囲外や白夜・極夜の境界では formula と同じ厳密計算に切り替える
+    """
+    name = "ephemeris"
+
+    def __init__(self, solar_service: "SolarService", tz_name: str = "Asia/Tokyo"):
+        if solar_service.ephemeris is None:
+            raise ValueError("SOLAR_BACKEND=ephemeris には SOLAR_EPHEMERIS_PATH の指定が必要です")
+        super().__init__(tz_name)
+        self.solar_service = solar_service
+
+    def sun(self, latitude: float, longitude: float, day: date) -> Dict[str, datetime]:
+        day_seconds = (day - date(1970, 1, 1)).days * 86400.0
+        events = self.solar_service.ephemeris.interpolate_point(float(latitude), float(longitude), day_seconds)
+        if events is None:
+            julian_day = day_seconds / 86400 + _UNIX_EPOCH_JD
+            events = self.solar_service._calculate_solar_day(latitude, longitude, julian_day)
+        return self._from_julian_days(events)
+
+
+def create_solar_backend(
+    name: str,
+    solar_service: "Callable[[], SolarService]",
+    tz_name: str = "Asia/Tokyo"
+) -> SolarBackend:
+    """solar_service は SolarService を返す関数（astral では呼ばない）"""
+    if name == "astral":
+        return AstralBackend(tz_name)
+    if name == "formula":
+        return FormulaBackend(solar_service(), tz_name)
+    if name == "ephemeris":
+        return EphemerisBackend(solar_service(), tz_name)
+    raise ValueError(f"不明な SOLAR_BACKEND です: {name}（astral / formula / ephemeris）")
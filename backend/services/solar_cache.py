@@ -0,0 +1,85 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pytz
+
+
+class SolarTimesCache:
+    """
+    太陽時刻のLRUキャッシュ
+
+    キーは (丸めた緯度, 丸めた経度, 現地日付)。太陽時刻は1日1回しか変わらないため、
+    エントリは現地時刻の0時で失効する。
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, precision: Optional[int] = None, tz_name: str = "Asia/Tokyo"):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SOLAR_CACHE_MAX_ENTRIES", "4096"))
+        self.precision = precision if precision is not None else int(os.getenv("SOLAR_CACHE_PRECISION", "2"))
+        self.tz = pytz.timezone(tz_name)
+        self._entries: "OrderedDict[Tuple[float, float, date], Tuple[datetime, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize(self, latitude: float, longitude: float) -> Tuple[float, float]:
+        return round(latitude, self.precision), round(longitude, self.precision)
+
+    def get_or_compute(
+        self,
+        latitude: float,
+        longitude: float,
+        compute: Callable[[float, float, date], Any],
+        day: Optional[date] = None
+    ) -> Any:
+        """キャッシュにあれば返し、なければ丸めた座標で compute(lat, lng, day) を呼んで保存する"""
+        now = datetime.now(self.tz)
+        day = day or now.date()
+        lat, lng = self.quantize(latitude, longitude)
+        key = (lat, lng, day)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+
+        value = compute(lat, lng, day)
+        expires_at = self.next_midnight(now)
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "precision": self.precision,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+    def next_midnight(self, now: datetime) -> datetime:
+        tomorrow = now.date() + timedelta(days=1)
+        return self.tz.localize(datetime(tomorrow.year, tomorrow.month, tomorrow.day))
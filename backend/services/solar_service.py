@@ -1,12 +1,36 @@
 import math
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 import asyncio
 
+import numpy as np
+
+
+# バッチ計算で扱うイベント（太陽高度角, 朝側キー, 夕側キー）
+_BATCH_TWILIGHT_ANGLES = (
+    (-6, "civil"),
+    (-12, "nautical"),
+    (-18, "astronomical"),
+)
+_MOON_PHASE_BOUNDS = np.array([0.0625, 0.1875, 0.3125, 0.4375, 0.5625, 0.6875, 0.8125, 0.9375])
+_MOON_PHASE_NAMES = np.array([
+    "New Moon", "Waxing Crescent", "First Quarter", "Waxing Gibbous", "Full Moon",
+    "Waning Gibbous", "Last Quarter", "Waning Crescent", "New Moon",
+])
+# 単体計算で時角から求めるイベント（sin(太陽高度角), 朝側キー, 夕側キー）
+_SCALAR_EVENT_ANGLES = tuple(
+    (math.sin(math.radians(angle)), f"{name}_dawn", f"{name}_dusk") for angle, name in _BATCH_TWILIGHT_ANGLES
+) + ((math.sin(math.radians(6)), "golden_hour_morning", "golden_hour_evening"),)
+_SIN_OBLIQUITY = math.sin(math.radians(23.45))
+_UNIX_EPOCH_JD = 2440587.5
+_UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_REFERENCE_NEW_MOON = datetime(2000, 1, 6, 18, 14, tzinfo=timezone.utc)
+
 
 class SolarService:
-    def __init__(self):
-        pass
+    def __init__(self, ephemeris=None):
+        # 事前計算テーブル（services.ephemeris.EphemerisTable）。あればバッチ計算で補間に使う
+        self.ephemeris = ephemeris
     
     async def get_solar_times(self, latitude: float, longitude: float, date: datetime) -> Dict[str, Any]:
         loop = asyncio.get_event_loop()
@@ -19,44 +43,40 @@ class SolarService:
         )
     
     def _calculate_solar_times(self, latitude: float, longitude: float, date: datetime) -> Dict[str, Any]:
-        julian_day = self._get_julian_day(date)
-        
-        sunrise, sunset = self._calculate_sunrise_sunset(latitude, longitude, julian_day)
-        solar_noon = self._calculate_solar_noon(longitude, julian_day)
-        
-        dawn_civil, dusk_civil = self._calculate_twilight(latitude, longitude, julian_day, -6)
-        dawn_nautical, dusk_nautical = self._calculate_twilight(latitude, longitude, julian_day, -12)
-        dawn_astronomical, dusk_astronomical = self._calculate_twilight(latitude, longitude, julian_day, -18)
-        
-        golden_hour_morning, golden_hour_evening = self._calculate_golden_hour(latitude, longitude, julian_day)
+        events = self._calculate_solar_day(latitude, longitude, self._get_julian_day(date))
+        times = {key: self._julian_to_datetime(value) if value is not None else None for key, value in events.items()}
         
         altitude, azimuth = self._calculate_solar_position(latitude, longitude, datetime.now())
         
         moon_phase = self._calculate_moon_phase(date)
         moon_illumination = self._calculate_moon_illumination(moon_phase)
         
+        def iso(key: str) -> Optional[str]:
+            value = times[key]
+            return value.isoformat() if value else None
+        
         return {
-            "sunrise": sunrise.isoformat() if sunrise else None,
-            "sunset": sunset.isoformat() if sunset else None,
-            "solar_noon": solar_noon.isoformat() if solar_noon else None,
-            "day_length": self._calculate_day_length(sunrise, sunset),
+            "sunrise": iso("sunrise"),
+            "sunset": iso("sunset"),
+            "solar_noon": iso("solar_noon"),
+            "day_length": self._calculate_day_length(times["sunrise"], times["sunset"]),
             "twilight": {
                 "civil": {
-                    "dawn": dawn_civil.isoformat() if dawn_civil else None,
-                    "dusk": dusk_civil.isoformat() if dusk_civil else None
+                    "dawn": iso("civil_dawn"),
+                    "dusk": iso("civil_dusk")
                 },
                 "nautical": {
-                    "dawn": dawn_nautical.isoformat() if dawn_nautical else None,
-                    "dusk": dusk_nautical.isoformat() if dusk_nautical else None
+                    "dawn": iso("nautical_dawn"),
+                    "dusk": iso("nautical_dusk")
                 },
                 "astronomical": {
-                    "dawn": dawn_astronomical.isoformat() if dawn_astronomical else None,
-                    "dusk": dusk_astronomical.isoformat() if dusk_astronomical else None
+                    "dawn": iso("astronomical_dawn"),
+                    "dusk": iso("astronomical_dusk")
                 }
             },
             "golden_hour": {
-                "morning": golden_hour_morning.isoformat() if golden_hour_morning else None,
-                "evening": golden_hour_evening.isoformat() if golden_hour_evening else None
+                "morning": iso("golden_hour_morning"),
+                "evening": iso("golden_hour_evening")
             },
             "current_position": {
                 "altitude": altitude,
@@ -77,68 +97,44 @@ class SolarService:
         jdn = date.day + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
         return jdn + (date.hour - 12) / 24 + date.minute / 1440 + date.second / 86400
     
-    def _calculate_sunrise_sunset(self, lat: float, lon: float, julian_day: float) -> Tuple[Optional[datetime], Optional[datetime]]:
-        n = julian_day - 2451545.0 + 0.0008
+    def _calculate_solar_day(self, lat: float, lon: float, julian_day: float) -> Dict[str, Optional[float]]:
+        """
+        1地点・1日分の全イベントのユリウス日を返す（存在しない場合は None）
+        
+        平均近点角・黄経・南中・赤緯は一度だけ計算し、各イベントは時角だけを求める。
+        式は solar_event_julian_days（NumPy版）と同じ。
+        """
+        # 日番号は整数に切り上げる（UTC 0時を渡すとその日の南中になる）
+        n = math.ceil(julian_day - 2451545.0 + 0.0008)
         j_star = n - lon / 360
         m = math.radians((357.5291 + 0.98560028 * j_star) % 360)
-        c = 1.9148 * math.sin(m) + 0.0200 * math.sin(2 * m) + 0.0003 * math.sin(3 * m)
+        sin_m = math.sin(m)
+        c = 1.9148 * sin_m + 0.0200 * math.sin(2 * m) + 0.0003 * math.sin(3 * m)
         lambda_sun = math.radians((math.degrees(m) + c + 180 + 102.9372) % 360)
-        
-        j_transit = 2451545.0 + j_star + 0.0053 * math.sin(m) - 0.0069 * math.sin(2 * lambda_sun)
-        
-        declination = math.asin(math.sin(lambda_sun) * math.sin(math.radians(23.45)))
+        j_transit = 2451545.0 + j_star + 0.0053 * sin_m - 0.0069 * math.sin(2 * lambda_sun)
+        declination = math.asin(math.sin(lambda_sun) * _SIN_OBLIQUITY)
         
         lat_rad = math.radians(lat)
-        hour_angle_arg = -math.tan(lat_rad) * math.tan(declination)
+        sin_lat_sin_dec = math.sin(lat_rad) * math.sin(declination)
+        cos_lat_cos_dec = math.cos(lat_rad) * math.cos(declination)
         
-        if hour_angle_arg < -1 or hour_angle_arg > 1:
-            return None, None
-        
-        hour_angle = math.degrees(math.acos(hour_angle_arg))
-        
-        j_sunrise = j_transit - hour_angle / 360
-        j_sunset = j_transit + hour_angle / 360
-        
-        sunrise = self._julian_to_datetime(j_sunrise)
-        sunset = self._julian_to_datetime(j_sunset)
-        
-        return sunrise, sunset
-    
-    def _calculate_solar_noon(self, lon: float, julian_day: float) -> Optional[datetime]:
-        n = julian_day - 2451545.0 + 0.0008
-        j_star = n - lon / 360
-        m = math.radians((357.5291 + 0.98560028 * j_star) % 360)
-        lambda_sun = math.radians((math.degrees(m) + 1.9148 * math.sin(m) + 0.0200 * math.sin(2 * m) + 0.0003 * math.sin(3 * m) + 180 + 102.9372) % 360)
-        j_transit = 2451545.0 + j_star + 0.0053 * math.sin(m) - 0.0069 * math.sin(2 * lambda_sun)
+        events: Dict[str, Optional[float]] = {"solar_noon": j_transit}
         
-        return self._julian_to_datetime(j_transit)
+        # 日の出・日の入（高度0°）は tan の式で求める
+        events["sunrise"], events["sunset"] = self._events_from_hour_angle_scalar(
+            j_transit, -math.tan(lat_rad) * math.tan(declination)
+        )
+        for sin_angle, dawn_key, dusk_key in _SCALAR_EVENT_ANGLES:
+            events[dawn_key], events[dusk_key] = self._events_from_hour_angle_scalar(
+                j_transit, (sin_angle - sin_lat_sin_dec) / cos_lat_cos_dec
+            )
+        return events
     
-    def _calculate_twilight(self, lat: float, lon: float, julian_day: float, angle: float) -> Tuple[Optional[datetime], Optional[datetime]]:
-        n = julian_day - 2451545.0 + 0.0008
-        j_star = n - lon / 360
-        m = math.radians((357.5291 + 0.98560028 * j_star) % 360)
-        c = 1.9148 * math.sin(m) + 0.0200 * math.sin(2 * m) + 0.0003 * math.sin(3 * m)
-        lambda_sun = math.radians((math.degrees(m) + c + 180 + 102.9372) % 360)
-        
-        j_transit = 2451545.0 + j_star + 0.0053 * math.sin(m) - 0.0069 * math.sin(2 * lambda_sun)
-        
-        declination = math.asin(math.sin(lambda_sun) * math.sin(math.radians(23.45)))
-        
-        lat_rad = math.radians(lat)
-        hour_angle_arg = (math.sin(math.radians(angle)) - math.sin(lat_rad) * math.sin(declination)) / (math.cos(lat_rad) * math.cos(declination))
-        
+    def _events_from_hour_angle_scalar(self, j_transit: float, hour_angle_arg: float) -> Tuple[Optional[float], Optional[float]]:
         if hour_angle_arg < -1 or hour_angle_arg > 1:
             return None, None
-        
-        hour_angle = math.degrees(math.acos(hour_angle_arg))
-        
-        dawn = self._julian_to_datetime(j_transit - hour_angle / 360)
-        dusk = self._julian_to_datetime(j_transit + hour_angle / 360)
-        
-        return dawn, dusk
-    
-    def _calculate_golden_hour(self, lat: float, lon: float, julian_day: float) -> Tuple[Optional[datetime], Optional[datetime]]:
-        return self._calculate_twilight(lat, lon, julian_day, 6)
+        offset = math.degrees(math.acos(hour_angle_arg)) / 360
+        return j_transit - offset, j_transit + offset
     
     def _calculate_solar_position(self, lat: float, lon: float, date: datetime) -> Tuple[float, float]:
         julian_day = self._get_julian_day(date)
@@ -147,13 +143,12 @@ class SolarService:
         g = math.radians((357.528 + 0.9856003 * n) % 360)
         lambda_sun = l + math.radians(1.915) * math.sin(g) + math.radians(0.020) * math.sin(2 * g)
         
-        beta = 0
         epsilon = math.radians(23.439 - 0.0000004 * n)
         
         alpha = math.atan2(math.cos(epsilon) * math.sin(lambda_sun), math.cos(lambda_sun))
         delta = math.asin(math.sin(epsilon) * math.sin(lambda_sun))
         
-        h = self._calculate_hour_angle(date, lon, alpha)
+        h = self._calculate_hour_angle(julian_day, lon, alpha)
         
         lat_rad = math.radians(lat)
         altitude = math.asin(math.sin(lat_rad) * math.sin(delta) + math.cos(lat_rad) * math.cos(delta) * math.cos(h))
@@ -161,8 +156,7 @@ class SolarService:
         
         return math.degrees(altitude), (math.degrees(azimuth) + 180) % 360
     
-    def _calculate_hour_angle(self, date: datetime, lon: float, right_ascension: float) -> float:
-        julian_day = self._get_julian_day(date)
+    def _calculate_hour_angle(self, julian_day: float, lon: float, right_ascension: float) -> float:
         d = julian_day - 2451545.0
         gmst = 18.697374558 + 24.06570982441908 * d
         gmst = gmst % 24
@@ -207,32 +201,204 @@ class SolarService:
             return "New Moon"
     
     def _julian_to_datetime(self, julian_day: float) -> datetime:
-        j = julian_day + 0.5
-        z = int(j)
-        f = j - z
+        # 秒未満は切り捨て（_julian_to_datetime64 と同じ）
+        return _UNIX_EPOCH + timedelta(seconds=math.floor((julian_day - _UNIX_EPOCH_JD) * 86400))
+    
+    def _calculate_day_length(self, sunrise: Optional[datetime], sunset: Optional[datetime]) -> Optional[float]:
+        if sunrise and sunset:
+            return (sunset - sunrise).total_seconds() / 3600
+        return None
+    
+    async def get_solar_times_batch(self, latitudes: Sequence[float], longitudes: Sequence[float], dates: Sequence[Any]) -> List[Dict[str, Any]]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            self.calculate_solar_times_batch,
+            latitudes,
+            longitudes,
+            dates
+        )
+    
+    def calculate_solar_times_batch(self, latitudes: Sequence[float], longitudes: Sequence[float], dates: Sequence[Any]) -> List[Dict[str, Any]]:
+        """複数地点・複数日の太陽時刻をまとめて計算し、_calculate_solar_times と同じ形で返す"""
+        events = self._calculate_solar_times_batch(latitudes, longitudes, dates)
+        return self._format_batch_results(events)
+    
+    def _calculate_solar_times_batch(self, latitudes: Sequence[float], longitudes: Sequence[float], dates: Sequence[Any]) -> Dict[str, np.ndarray]:
+        """
+        NumPyで全イベントを一括計算する
+        
+        latitudes / longitudes / dates はブロードキャスト可能な配列。
+        時刻は UTC の datetime64[s]（存在しない場合は NaT）で返す。
+        """
+        day_seconds = self._to_epoch_seconds(dates)
+        lat, lon, day_seconds = np.broadcast_arrays(
+            np.asarray(latitudes, dtype=np.float64),
+            np.asarray(longitudes, dtype=np.float64),
+            day_seconds
+        )
         
-        if z >= 2299161:
-            alpha = int((z - 1867216.25) / 36524.25)
-            a = z + 1 + alpha - int(alpha / 4)
-        else:
-            a = z
+        events = {
+            key: self._julian_to_datetime64(values)
+            for key, values in self.lookup_event_julian_days(lat, lon, day_seconds).items()
+        }
+        
+        events["altitude"], events["azimuth"] = self._calculate_solar_position_batch(lat, lon, datetime.now())
+        
+        moon_phase = ((day_seconds - _REFERENCE_NEW_MOON.timestamp()) / 86400 % 29.53058867) / 29.53058867
+        events["moon_phase"] = moon_phase
+        events["moon_illumination"] = (1 - np.cos(2 * np.pi * moon_phase)) / 2
+        
+        return events
+    
+    def lookup_event_julian_days(self, lat: np.ndarray, lon: np.ndarray, day_seconds: np.ndarray) -> Dict[str, np.ndarray]:
+        """テーブルの範囲内は補間、範囲外や極付近は厳密計算でイベントのユリウス日を求める"""
+        if self.ephemeris is None:
+            return self.solar_event_julian_days(lat, lon, day_seconds)
+        
+        shape = lat.shape
+        lat, lon, day_seconds = lat.ravel(), lon.ravel(), day_seconds.ravel()
+        events, covered = self.ephemeris.interpolate(lat, lon, day_seconds)
+        missing = ~covered
+        if missing.any():
+            exact = self.solar_event_julian_days(lat[missing], lon[missing], day_seconds[missing])
+            for key, values in exact.items():
+                events[key][missing] = values
+        return {key: values.reshape(shape) for key, values in events.items()}
+    
+    def solar_event_julian_days(self, lat: np.ndarray, lon: np.ndarray, day_seconds: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        各イベントのユリウス日を返す（存在しない場合は NaN）
+        
+        day_seconds は日付（UTC 0時）のUNIX秒。
+        平均近点角・黄経・南中は地点×日ごとに一度だけ計算し、全イベントで共有する。
+        """
+        julian_day = day_seconds / 86400 + _UNIX_EPOCH_JD
         
-        b = a + 1524
-        c = int((b - 122.1) / 365.25)
-        d = int(365.25 * c)
-        e = int((b - d) / 30.6001)
+        n = np.ceil(julian_day - 2451545.0 + 0.0008)
+        j_star = n - lon / 360
+        m = np.radians((357.5291 + 0.98560028 * j_star) % 360)
+        c = 1.9148 * np.sin(m) + 0.0200 * np.sin(2 * m) + 0.0003 * np.sin(3 * m)
+        lambda_sun = np.radians((np.degrees(m) + c + 180 + 102.9372) % 360)
+        j_transit = 2451545.0 + j_star + 0.0053 * np.sin(m) - 0.0069 * np.sin(2 * lambda_sun)
+        declination = np.arcsin(np.sin(lambda_sun) * _SIN_OBLIQUITY)
         
-        day = b - d - int(30.6001 * e) + f
-        month = e - 1 if e < 14 else e - 13
-        year = c - 4716 if month > 2 else c - 4715
+        lat_rad = np.radians(lat)
+        sin_lat_sin_dec = np.sin(lat_rad) * np.sin(declination)
+        cos_lat_cos_dec = np.cos(lat_rad) * np.cos(declination)
         
-        hours = (day - int(day)) * 24
-        minutes = (hours - int(hours)) * 60
-        seconds = (minutes - int(minutes)) * 60
+        events = {"solar_noon": j_transit}
+        
+        # 日の出・日の入（高度0°）は元の実装と同じく tan の式で求める
+        events["sunrise"], events["sunset"] = self._events_from_hour_angle(
+            j_transit, -np.tan(lat_rad) * np.tan(declination)
+        )
+        for angle, name in _BATCH_TWILIGHT_ANGLES:
+            events[f"{name}_dawn"], events[f"{name}_dusk"] = self._events_from_hour_angle(
+                j_transit, (math.sin(math.radians(angle)) - sin_lat_sin_dec) / cos_lat_cos_dec
+            )
+        events["golden_hour_morning"], events["golden_hour_evening"] = self._events_from_hour_angle(
+            j_transit, (math.sin(math.radians(6)) - sin_lat_sin_dec) / cos_lat_cos_dec
+        )
         
-        return datetime(int(year), int(month), int(day), int(hours), int(minutes), int(seconds), tzinfo=timezone.utc)
+        return events
     
-    def _calculate_day_length(self, sunrise: Optional[datetime], sunset: Optional[datetime]) -> Optional[float]:
-        if sunrise and sunset:
-            return (sunset - sunrise).total_seconds() / 3600
-        return None
\ No newline at end of file
+    def _to_epoch_seconds(self, dates: Sequence[Any]) -> np.ndarray:
+        values = np.asarray(dates)
+        if values.dtype == object:
+            values = np.array([
+                d.astimezone(timezone.utc).replace(tzinfo=None) if isinstance(d, datetime) and d.tzinfo else d
+                for d in values.ravel()
+            ]).reshape(values.shape)
+        return values.astype("datetime64[s]").astype(np.int64).astype(np.float64)
+    
+    def _events_from_hour_angle(self, j_transit: np.ndarray, hour_angle_arg: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        with np.errstate(invalid="ignore"):
+            hour_angle = np.degrees(np.arccos(hour_angle_arg))
+        hour_angle = np.where(np.abs(hour_angle_arg) <= 1, hour_angle, np.nan)
+        return j_transit - hour_angle / 360, j_transit + hour_angle / 360
+    
+    def _julian_to_datetime64(self, julian_day: np.ndarray) -> np.ndarray:
+        # _julian_to_datetime と同じく秒未満は切り捨て
+        seconds = np.floor((julian_day - _UNIX_EPOCH_JD) * 86400)
+        result = np.full(seconds.shape, np.datetime64("NaT"), dtype="datetime64[s]")
+        valid = ~np.isnan(seconds)
+        result[valid] = seconds[valid].astype(np.int64).astype("datetime64[s]")
+        return result
+    
+    def _calculate_solar_position_batch(self, lat: np.ndarray, lon: np.ndarray, date: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        julian_day = self._get_julian_day(date)
+        n = julian_day - 2451545.0
+        l = math.radians((280.460 + 0.9856474 * n) % 360)
+        g = math.radians((357.528 + 0.9856003 * n) % 360)
+        lambda_sun = l + math.radians(1.915) * math.sin(g) + math.radians(0.020) * math.sin(2 * g)
+        epsilon = math.radians(23.439 - 0.0000004 * n)
+        
+        alpha = math.atan2(math.cos(epsilon) * math.sin(lambda_sun), math.cos(lambda_sun))
+        delta = math.asin(math.sin(epsilon) * math.sin(lambda_sun))
+        
+        gmst = (18.697374558 + 24.06570982441908 * n) % 24
+        h = ((gmst + lon / 15) * 15 - math.degrees(alpha)) % 360
+        h = np.radians(np.where(h > 180, h - 360, h))
+        
+        lat_rad = np.radians(lat)
+        altitude = np.arcsin(np.sin(lat_rad) * math.sin(delta) + np.cos(lat_rad) * math.cos(delta) * np.cos(h))
+        azimuth = np.arctan2(np.sin(h), np.cos(h) * np.sin(lat_rad) - math.tan(delta) * np.cos(lat_rad))
+        
+        return np.degrees(altitude), (np.degrees(azimuth) + 180) % 360
+    
+    def _format_batch_results(self, events: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        def iso(values: np.ndarray) -> List[Optional[str]]:
+            strings = np.datetime_as_string(values.ravel(), unit="s")
+            return [None if s == "NaT" else s + "+00:00" for s in strings.tolist()]
+        
+        sunrise = events["sunrise"].ravel()
+        sunset = events["sunset"].ravel()
+        day_length = ((sunset - sunrise).astype("timedelta64[s]").astype(np.float64) / 3600)
+        day_length[np.isnat(sunrise) | np.isnat(sunset)] = np.nan
+        
+        moon_phase = events["moon_phase"].ravel()
+        phase_names = _MOON_PHASE_NAMES[np.searchsorted(_MOON_PHASE_BOUNDS, moon_phase, side="right")]
+        
+        columns = {key: iso(events[key]) for key in (
+            "sunrise", "sunset", "solar_noon",
+            "civil_dawn", "civil_dusk", "nautical_dawn", "nautical_dusk",
+            "astronomical_dawn", "astronomical_dusk",
+            "golden_hour_morning", "golden_hour_evening",
+        )}
+        
+        results = []
+        for i, (length, altitude, azimuth, phase, illumination, phase_name) in enumerate(zip(
+            day_length.tolist(),
+            events["altitude"].ravel().tolist(),
+            events["azimuth"].ravel().tolist(),
+            moon_phase.tolist(),
+            events["moon_illumination"].ravel().tolist(),
+            phase_names.tolist()
+        )):
+            results.append({
+                "sunrise": columns["sunrise"][i],
+                "sunset": columns["sunset"][i],
+                "solar_noon": columns["solar_noon"][i],
+                "day_length": None if math.isnan(length) else length,
+                "twilight": {
+                    "civil": {"dawn": columns["civil_dawn"][i], "dusk": columns["civil_dusk"][i]},
+                    "nautical": {"dawn": columns["nautical_dawn"][i], "dusk": columns["nautical_dusk"][i]},
+                    "astronomical": {"dawn": columns["astronomical_dawn"][i], "dusk": columns["astronomical_dusk"][i]}
+                },
+                "golden_hour": {
+                    "morning": columns["golden_hour_morning"][i],
+                    "evening": columns["golden_hour_evening"][i]
+                },
+                "current_position": {
+                    "altitude": altitude,
+                    "azimuth": azimuth
+                },
+                "moon": {
+                    "phase": phase,
+                    "illumination": illumination,
+                    "phase_name": phase_name
+                }
+            })
+        
+        return results
@@ -0,0 +1,206 @@
+"""
+「近くで空がきれいな場所」検索用の空間インデックス
+
+スコア済みのタイルを、粗いジオハッシュ（bucket_precision 桁）のバケットに分けて持つ。
+検索は円を囲む矩形に重なるバケットだけを見て、距離とスコアで上位 k 件を返す。
+上流の呼び出しもスコアの再計算もしない。
+"""
+import heapq
+import math
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils import geohash
+
+_EARTH_RADIUS_KM = 6371.0
+_KM_PER_DEGREE = 111.32
+
+
+class SpotEntry:
+    __slots__ = ("key", "latitude", "longitude", "visibility", "halo", "golden_hours", "updated_at")
+
+    def __init__(
+        self,
+        key: str,
+        latitude: float,
+        longitude: float,
+        visibility: Dict[str, Any],
+        halo: Dict[str, Any],
+        golden_hours: Sequence[Tuple[str, datetime, datetime]],
+        updated_at: float
+    ):
+        self.key = key
+        self.latitude = latitude
+        self.longitude = longitude
+        self.visibility = visibility
+        self.halo = halo
+        # 今後のゴールデンアワー (種類, 開始, 終了) を開始順に
+        self.golden_hours = golden_hours
+        self.updated_at = updated_at
+
+    def next_golden_hour(self, now: datetime) -> Optional[Tuple[str, datetime, datetime]]:
+        for window in self.golden_hours:
+            if window[2] > now:
+                return window
+        return None
+
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """2点間の大円距離（km）"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * _EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _Bucket:
+    __slots__ = ("entries", "bounds")
+
+    def __init__(self):
+        self.entries: Dict[str, SpotEntry] = {}
+        # スコアの上限（visibility, halo）。下がったときは次の走査で詰め直す
+        self.bounds = [0, 0]
+
+
+def _score(entry: SpotEntry, rank_index: int) -> int:
+    return (entry.halo if rank_index else entry.visibility).get("score", 0)
+
+
+class SpotIndex:
+    def __init__(self, bucket_precision: Optional[int] = None, max_age: Optional[float] = None):
+        # 4桁 ≒ 39km × 20km のバケット
+        self.bucket_precision = bucket_precision if bucket_precision is not None else int(os.getenv("SPOT_INDEX_BUCKET_PRECISION", "4"))
+        # これより古いスコアは検索結果に出さず、見つけたときに捨てる（秒）
+        self.max_age = max_age if max_age is not None else float(os.getenv("SPOT_INDEX_MAX_AGE", "10800"))
+        self._buckets: Dict[str, _Bucket] = {}
+        self._size = 0
+        self.updates = 0
+        self.queries = 0
+        self.expired = 0
+
+    def update(self, entry: SpotEntry) -> None:
+        """タイルの最新スコアを登録（同じタイルは上書き）"""
+        bucket = self._buckets.get(entry.key[:self.bucket_precision])
+        if bucket is None:
+            bucket = self._buckets[entry.key[:self.bucket_precision]] = _Bucket()
+        if entry.key not in bucket.entries:
+            self._size += 1
+        bucket.entries[entry.key] = entry
+        bucket.bounds[0] = max(bucket.bounds[0], _score(entry, 0))
+        bucket.bounds[1] = max(bucket.bounds[1], _score(entry, 1))
+        self.updates += 1
+
+    def _bucket_keys(self, latitude: float, longitude: float, radius_km: float) -> List[str]:
+        """中心から radius_km の円を囲む矩形に重なるバケット"""
+        dlat, dlng = geohash.cell_size(self.bucket_precision)
+        lat_span = radius_km / _KM_PER_DEGREE
+        lng_span = radius_km / (_KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        lat_min = max(-90.0, latitude - lat_span)
+        lat_max = min(90.0, latitude + lat_span)
+
+        keys = set()
+        lat = math.floor((lat_min + 90) / dlat) * dlat - 90 + dlat / 2
+        while lat < lat_max + dlat / 2:
+            lng = math.floor((longitude - lng_span + 180) / dlng) * dlng - 180 + dlng / 2
+            while lng < longitude + lng_span + dlng / 2:
+                keys.add(geohash.encode(min(lat, 89.999999), (lng + 180) % 360 - 180, self.bucket_precision))
+                lng += dlng
+            lat += dlat
+        return list(keys)
+
+    def search(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        k: int = 10,
+        rank_by: str = "visibility",
+        now: Optional[float] = None
+    ) -> List[Tuple[SpotEntry, float]]:
+        """
+        半径内のタイルをスコアの高い順（同点は近い順）に k 件、(エントリ, 距離km) で返す
+
+        バケットをスコア上限の高い順に見て、k 件目のスコアが次のバケットの上限を
+        上回った時点で打ち切る（高スコアのタイルが近くにあれば数バケットで終わる）。
+        """
+        now = now if now is not None else time.time()
+        oldest = now - self.max_age
+        rank_index = 1 if rank_by == "halo" else 0
+        lat_span = radius_km / _KM_PER_DEGREE
+        lng_span = radius_km / (_KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        self.queries += 1
+
+        buckets = [
+            (bucket.bounds[rank_index], key, bucket)
+            for key, bucket in (
+                (key, self._buckets.get(key)) for key in self._bucket_keys(latitude, longitude, radius_km)
+            )
+            if bucket is not None
+        ]
+        buckets.sort(key=lambda item: item[0], reverse=True)
+
+        # (スコア, -距離, 順番, エントリ) の最小ヒープ。先頭が現在の k 件目
+        top: List[Tuple[int, float, int, SpotEntry]] = []
+        order = 0
+        for bound, bucket_key, bucket in buckets:
+            if len(top) >= k and top[0][0] > bound:
+                break
+            stale = []
+            bounds = [0, 0]
+            for entry in bucket.entries.values():
+                if entry.updated_at < oldest:
+                    stale.append(entry.key)
+                    continue
+                visibility_score = entry.visibility.get("score", 0)
+                halo_score = entry.halo.get("score", 0)
+                if visibility_score > bounds[0]:
+                    bounds[0] = visibility_score
+                if halo_score > bounds[1]:
+                    bounds[1] = halo_score
+
+                score = halo_score if rank_index else visibility_score
+                if len(top) >= k and score < top[0][0]:
+                    continue
+                # 矩形で粗く絞ってから距離を計算する
+                if abs(entry.latitude - latitude) > lat_span:
+                    continue
+                if abs((entry.longitude - longitude + 180) % 360 - 180) > lng_span:
+                    continue
+                distance = distance_km(latitude, longitude, entry.latitude, entry.longitude)
+                if distance > radius_km:
+                    continue
+                order += 1
+                item = (score, -distance, order, entry)
+                if len(top) < k:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+
+            bucket.bounds = bounds
+            for key in stale:
+                del bucket.entries[key]
+            self._size -= len(stale)
+            self.expired += len(stale)
+            if not bucket.entries:
+                del self._buckets[bucket_key]
+
+        top.sort(reverse=True)
+        return [(entry, -negative_distance) for _, negative_distance, _, entry in top]
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": self._size,
+            "buckets": len(self._buckets),
+            "bucket_precision": self.bucket_precision,
+            "max_age": self.max_age,
+            "updates": self.updates,
+            "queries": self.queries,
+            "expired": self.expired
+        }
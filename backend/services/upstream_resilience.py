@@ -0,0 +1,158 @@
+"""
+上流API（OpenWeatherMap）の遅延・障害への備え
+
+LatencyTracker   エンドポイントごとの最近の応答時間。ヘッジを出すまでの待ち時間（p95 など）を決める
+CircuitBreaker   失敗やタイムアウトが続いたら上流を呼ぶのをやめ（open）、一定時間後に1件だけ試す（half_open）
+
+ヘッジ: 1回目の応答が最近の p95 を過ぎても返ってこなければ、同じ呼び出しをもう1件出して
+先に返ってきた方を使う。遅いのは上流側の一部のサーバーや経路であることが多く、
+もう1件出すと p99・p999 が大きく縮む。呼び出し上限を食うので、スケジューラーのトークンが
+すぐ取れるときだけ、画面を待っている呼び出し（INTERACTIVE）にだけ出す。
+
+ブレーカーが open の間は上流を呼ばずにすぐ失敗させ、WeatherTileCache は手元の最後のタイルを
+劣化（degraded）として返す。
+
+環境変数:
+    UPSTREAM_HEDGE_PERCENTILE      ヘッジを出すまでの待ち時間に使うパーセンタイル（既定 0.95。0 ならヘッジしない）
+    UPSTREAM_HEDGE_MIN_DELAY       ヘッジを出すまでの最短の待ち時間（秒, 既定 0.05）
+    UPSTREAM_HEDGE_MIN_SAMPLES     この件数の応答時間が集まるまではヘッジしない（既定 20）
+    UPSTREAM_BREAKER_WINDOW        失敗率を見る直近の呼び出し数（既定 20）
+    UPSTREAM_BREAKER_MIN_CALLS     失敗率で判定する最低の呼び出し数（既定 10）
+    UPSTREAM_BREAKER_FAILURE_RATIO この割合以上が失敗したら open（既定 0.5）
+    UPSTREAM_BREAKER_COOLDOWN      open にしてから試しに呼ぶまでの秒数（既定 30）
+"""
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from services.metrics import UPSTREAM_BREAKER_STATE, UPSTREAM_BREAKER_TRANSITIONS
+from utils.log import get_logger
+
+logger = get_logger("upstream")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: Optional[int] = None):
+        self.window = window
+        self.min_samples = min_samples if min_samples is not None else int(os.getenv("UPSTREAM_HEDGE_MIN_SAMPLES", "20"))
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, endpoint: str, seconds: float) -> None:
+        samples = self._samples.get(endpoint)
+        if samples is None:
+            samples = self._samples[endpoint] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        """直近の応答時間の q 分位点（サンプルが足りなければ None）"""
+        samples = self._samples.get(endpoint)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            endpoint: {
+                "samples": len(samples),
+                "p50": self.percentile(endpoint, 0.5),
+                "p95": self.percentile(endpoint, 0.95)
+            }
+            for endpoint, samples in self._samples.items()
+        }
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        window: Optional[int] = None,
+        min_calls: Optional[int] = None,
+        failure_ratio: Optional[float] = None,
+        cooldown: Optional[float] = None
+    ):
+        self.window = window if window is not None else int(os.getenv("UPSTREAM_BREAKER_WINDOW", "20"))
+        self.min_calls = min_calls if min_calls is not None else int(os.getenv("UPSTREAM_BREAKER_MIN_CALLS", "10"))
+        self.failure_ratio = failure_ratio if failure_ratio is not None else float(os.getenv("UPSTREAM_BREAKER_FAILURE_RATIO", "0.5"))
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+        self.state = CLOSED
+        # 直近の結果（True = 失敗）
+        self._outcomes: Deque[bool] = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        # half_open で試しに出している呼び出しがあるか
+        self._probing = False
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {}
+        UPSTREAM_BREAKER_STATE.set(1, CLOSED)
+
+    def _transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        name = f"{previous}->{state}"
+        self.transitions[name] = self.transitions.get(name, 0) + 1
+        UPSTREAM_BREAKER_TRANSITIONS.inc(previous, state)
+        UPSTREAM_BREAKER_STATE.set(0, previous)
+        UPSTREAM_BREAKER_STATE.set(1, state)
+        log = logger.warning if state == OPEN else logger.info
+        log("上流のサーキットブレーカーの状態が変わりました", extra={"fields": {
+            "from": previous, "to": state, "failures": sum(self._outcomes), "calls": len(self._outcomes)
+        }})
+
+    def allow(self) -> bool:
+        """上流を呼んでよいか（half_open では1件だけ通す）"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.cooldown:
+                self.rejected += 1
+                return False
+            self._transition(HALF_OPEN)
+        if self._probing:
+            self.rejected += 1
+            return False
+        self._probing = True
+        return True
+
+    def retry_after(self) -> float:
+        """open の間、次に試すまでの秒数"""
+        if self.state != OPEN:
+            return 1.0
+        return max(1.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        self._outcomes.append(False)
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._outcomes.clear()
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self._outcomes.append(True)
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._open()
+        elif self.state == CLOSED and len(self._outcomes) >= self.min_calls:
+            if sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio:
+                self._open()
+
+    def record_neutral(self) -> None:
+        """上流の状態と関係ない結果（429 など）。half_open の試し呼び出しだけ解放する"""
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._transition(OPEN)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": sum(self._outcomes),
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else None,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions)
+        }
@@ -0,0 +1,266 @@
+"""
+上流API（OpenWeatherMap）呼び出しのスケジューラー
+
+契約プランの呼び出し上限（1分あたり）に合わせたトークンバケットで、上流への呼び出しを
+すべてここを通して出す。トークンがなければ優先度の順に待ち行列に並べる。
+
+優先度（小さいほど先）:
+    INTERACTIVE  画面の表示を待っているリクエスト（today-forecast・visibility-detail・outlook など）
+    BATCH        まとめて取得するリクエスト（batch・heatmap）
+    PREFETCH     古いタイルを返した後の裏での更新・起動時のウォームアップ
+
+同じ優先度の中では締め切りの早い順に出す。呼び出しごとに締め切り（待ってよい秒数）があり、
+並んでも間に合わない見込みならすぐに、並んでいる間に締め切りを過ぎたらその時点で
+UpstreamRejected を投げる。呼び出し側は古いタイルを返すなどして劣化運転する。
+
+優先度と締め切りは contextvars で渡す（upstream_priority）。
+タイルの取得は別タスクで走るが、タスクは作られたときのコンテキストを引き継ぐので、
+リクエストの処理中に設定しておけばそのまま届く。
+
+上流が 429 を返したら throttle() でトークンを空にし、Retry-After（なければ次の1分の頭）まで止める。
+
+環境変数:
+    UPSTREAM_RATE_PER_MINUTE         1分あたりの呼び出し上限（既定 60 = 無料プラン。ワーカーごとの値）
+    UPSTREAM_BURST                   一度に出してよい呼び出し数（既定 10）
+    UPSTREAM_QUEUE_LIMIT             待ち行列の上限（既定 1000）
+    UPSTREAM_DEADLINE_INTERACTIVE    締め切り（秒, 既定 2）
+    UPSTREAM_DEADLINE_BATCH          締め切り（秒, 既定 15）
+    UPSTREAM_DEADLINE_PREFETCH       締め切り（秒, 既定 60）
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.metrics import UPSTREAM_QUEUE_WAIT, UPSTREAM_REJECTED
+from utils.log import get_logger
+
+logger = get_logger("upstream")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+    PREFETCH = 2
+
+
+_DEFAULT_DEADLINES = {
+    Priority.INTERACTIVE: "2",
+    Priority.BATCH: "15",
+    Priority.PREFETCH: "60",
+}
+
+# (優先度, 締め切り秒 or None = 優先度ごとの既定)
+_priority_var: ContextVar[Tuple[Priority, Optional[float]]] = ContextVar(
+    "upstream_priority", default=(Priority.INTERACTIVE, None)
+)
+
+
+@contextmanager
+def upstream_priority(priority: Priority, deadline: Optional[float] = None):
+    """このブロックの中（とここで作ったタスク）からの上流呼び出しの優先度と締め切りを決める"""
+    token = _priority_var.set((priority, deadline))
+    try:
+        yield
+    finally:
+        _priority_var.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority_var.get()[0]
+
+
+def set_upstream_priority(priority: Priority, deadline: Optional[float] = None) -> None:
+    """タスクの中で、そのタスクの残りの処理に優先度を設定する（タスクごとのコンテキストなので外には漏れない）"""
+    _priority_var.set((priority, deadline))
+
+
+class UpstreamRejected(Exception):
+    """締め切りまでに上流を呼べない（reason: deadline / queue_full）"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"upstream call rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class UpstreamScheduler:
+    def __init__(
+        self,
+        rate_per_minute: Optional[float] = None,
+        burst: Optional[int] = None,
+        queue_limit: Optional[int] = None
+    ):
+        self.rate_per_minute = rate_per_minute if rate_per_minute is not None else float(os.getenv("UPSTREAM_RATE_PER_MINUTE", "60"))
+        self.burst = burst if burst is not None else int(os.getenv("UPSTREAM_BURST", "10"))
+        self.queue_limit = queue_limit if queue_limit is not None else int(os.getenv("UPSTREAM_QUEUE_LIMIT", "1000"))
+        self.deadlines = {
+            priority: float(os.getenv(f"UPSTREAM_DEADLINE_{priority.name}", default))
+            for priority, default in _DEFAULT_DEADLINES.items()
+        }
+        self._rate = self.rate_per_minute / 60
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        # 上流の 429 で止めている間はこの時刻まで出さない
+        self._paused_until = 0.0
+
+        # [優先度, 締め切り, 順番, future]。締め切りで諦めたものは future が done のまま残り、取り出すときに捨てる
+        self._queue: List[List[Any]] = []
+        self._sequence = itertools.count()
+        self._waiting = {priority: 0 for priority in Priority}
+        self._dispatcher: Optional["asyncio.Task[None]"] = None
+
+        self.granted = {priority: 0 for priority in Priority}
+        self.queued = {priority: 0 for priority in Priority}
+        self.rejected = {"deadline": 0, "queue_full": 0}
+        self.throttled = 0
+
+    # ------------------------------------------------------------------
+    # トークンバケット
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _estimated_wait(self, ahead: int, now: float) -> float:
+        """前に ahead 件並んでいるとき、自分の番が来るまでの見込み（秒）"""
+        pause = max(0.0, self._paused_until - now)
+        if not self._rate:
+            return float("inf")
+        # 止めている間はトークンが貯まらないものとして見積もる（throttle() で 0 にしてある）
+        return pause + max(0.0, (ahead + 1 - self._tokens) / self._rate)
+
+    def throttle(self, retry_after: Optional[float] = None) -> None:
+        """上流が 429 を返したとき、トークンを空にして retry_after 秒（なければ次の1分の頭まで）止める"""
+        now = time.monotonic()
+        if retry_after is None:
+            retry_after = 60 - time.time() % 60
+        self._refill(now)
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, now + retry_after)
+        self.throttled += 1
+        logger.warning("上流のレート制限に当たったため呼び出しを止めます", extra={"fields": {"seconds": round(retry_after, 1)}})
+
+    # ------------------------------------------------------------------
+    # 呼び出しの許可
+
+    async def acquire(self) -> None:
+        """現在のコンテキストの優先度・締め切りで上流を1回呼ぶ許可を待つ"""
+        priority, deadline = _priority_var.get()
+        if deadline is None:
+            deadline = self.deadlines[priority]
+        now = time.monotonic()
+        self._refill(now)
+
+        # 自分より先に出るもの（同じか高い優先度で並んでいるもの）
+        ahead = self._waiting_ahead(priority)
+        if not ahead and self._tokens >= 1 and now >= self._paused_until:
+            self._tokens -= 1
+            self.granted[priority] += 1
+            UPSTREAM_QUEUE_WAIT.observe(0.0, priority.name.lower())
+            return
+
+        wait = self._estimated_wait(ahead, now)
+        if wait > deadline:
+            self._reject(priority, "deadline", wait)
+        if sum(self._waiting.values()) >= self.queue_limit:
+            self._reject(priority, "queue_full", wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, now + deadline, next(self._sequence), future])
+        self._waiting[priority] += 1
+        self.queued[priority] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            self._abandon(future, priority)
+            # 並んでいる間に高い優先度のものが割り込んだ
+            self._reject(priority, "deadline", self._estimated_wait(self._waiting_ahead(priority), time.monotonic()))
+        except asyncio.CancelledError:
+            self._abandon(future, priority)
+            raise
+        UPSTREAM_QUEUE_WAIT.observe(time.monotonic() - now, priority.name.lower())
+
+    def try_acquire(self) -> bool:
+        """待たずに出せるときだけ許可を取る（ヘッジなど、出せなければやめてよい呼び出し用）"""
+        now = time.monotonic()
+        self._refill(now)
+        if any(self._waiting.values()) or self._tokens < 1 or now < self._paused_until:
+            return False
+        self._tokens -= 1
+        return True
+
+    def capacity(self, priority: Priority) -> int:
+        """この優先度であと何件、締め切りより前に許可を出せる見込みか（ちょうど締め切りの分は数えない）"""
+        now = time.monotonic()
+        self._refill(now)
+        window = max(0.0, self.deadlines[priority] - max(0.0, self._paused_until - now))
+        return max(0, math.ceil(self._tokens + window * self._rate) - 1 - self._waiting_ahead(priority))
+
+    def estimated_wait(self, priority: Priority, calls: int = 1) -> float:
+        """この優先度で calls 件を新たに出したとき、最後の1件に許可が出るまでの見込み（秒）"""
+        now = time.monotonic()
+        self._refill(now)
+        return self._estimated_wait(self._waiting_ahead(priority) + calls - 1, now)
+
+    def _waiting_ahead(self, priority: Priority) -> int:
+        return sum(count for waiting_priority, count in self._waiting.items() if waiting_priority <= priority)
+
+    def _abandon(self, future: "asyncio.Future[None]", priority: Priority) -> None:
+        if future.done():
+            # 許可と締め切りが同時だった。使わなかったトークンを戻す
+            if not future.cancelled():
+                self._tokens = min(float(self.burst), self._tokens + 1)
+            return
+        future.cancel()
+        self._waiting[priority] -= 1
+
+    def _reject(self, priority: Priority, reason: str, retry_after: float) -> None:
+        self.rejected[reason] += 1
+        UPSTREAM_REJECTED.inc(priority.name.lower(), reason)
+        raise UpstreamRejected(reason, retry_after if retry_after != float("inf") else 60.0)
+
+    async def _dispatch(self) -> None:
+        """トークンが貯まるたびに待ち行列の先頭に許可を出す（待ちがなくなったら終わる）"""
+        while self._queue:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate if self._rate else 1.0)
+                continue
+            priority, _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._tokens -= 1
+            self._waiting[priority] -= 1
+            self.granted[priority] += 1
+            future.set_result(None)
+            # 許可を受け取ったタスクに先に走らせる
+            await asyncio.sleep(0)
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+        return {
+            "rate_per_minute": self.rate_per_minute,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 2),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "waiting": {priority.name.lower(): count for priority, count in self._waiting.items()},
+            "granted": {priority.name.lower(): count for priority, count in self.granted.items()},
+            "queued": {priority.name.lower(): count for priority, count in self.queued.items()},
+            "rejected": dict(self.rejected),
+            "throttled": self.throttled,
+            "deadlines": {priority.name.lower(): seconds for priority, seconds in self.deadlines.items()}
+        }
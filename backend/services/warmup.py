@@ -0,0 +1,90 @@
+"""
+起動時のウォームアップ
+
+よくアクセスされる地点（WARMUP_LOCATIONS）について、ワーカーがリクエストを受け付ける前に
+太陽時刻（今日・明日）を計算し、天気タイルを取得しておく。
+lifespan の起動処理の中で待つので、終わるまで uvicorn は接続を受け付けず、
+/api/health も応答しない（= ヘルスチェックが通った時点で温まっている）。
+
+環境変数:
+    WARMUP_LOCATIONS  "緯度,経度;緯度,経度;..."（空なら何もしない）
+    WARMUP_TIMEOUT    天気タイルの取得を待つ上限（秒, 既定 10）。超えたら残りは諦めて起動する
+"""
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pytz
+
+from utils.log import get_logger
+
+logger = get_logger("warmup")
+
+Location = Tuple[float, float]
+
+
+def parse_locations(value: Optional[str]) -> List[Location]:
+    """ "35.6762,139.6503;34.6937,135.5023" を [(緯度, 経度), ...] にする"""
+    locations = []
+    for item in (value or "").split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            lat, lng = (float(part) for part in item.split(","))
+        except ValueError:
+            raise ValueError(f"WARMUP_LOCATIONS の形式が正しくありません: {item!r}（緯度,経度;緯度,経度）")
+        locations.append((lat, lng))
+    return locations
+
+
+async def warm_up(
+    locations: Sequence[Location],
+    get_sun_times: Callable[[float, float, date], Any],
+    fetch_tiles: Optional[Callable[[Sequence[Location]], AsyncIterator[Tuple[Any, List[int]]]]] = None,
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    太陽時刻と天気タイルを先に作っておき、結果の統計を返す
+
+    fetch_tiles は main.fetch_tiles と同じ形（APIキーがなければ None を渡して天気は飛ばす）。
+    """
+    timeout = timeout if timeout is not None else float(os.getenv("WARMUP_TIMEOUT", "10"))
+    started = time.perf_counter()
+    stats: Dict[str, Any] = {
+        "locations": len(locations),
+        "solar": 0,
+        "solar_failed": 0,
+        "tiles": 0,
+        "tiles_failed": 0,
+        "timed_out": False
+    }
+
+    today = datetime.now(pytz.timezone("Asia/Tokyo")).date()
+    for lat, lng in locations:
+        for day in (today, today + timedelta(days=1)):
+            try:
+                get_sun_times(lat, lng, day)
+                stats["solar"] += 1
+            except ValueError:
+                # 白夜・極夜など（リクエスト時も同じ結果になる）
+                stats["solar_failed"] += 1
+
+    if fetch_tiles is not None and locations:
+        async def fetch_all():
+            async for tile, _ in fetch_tiles(locations):
+                if isinstance(tile, Exception):
+                    stats["tiles_failed"] += 1
+                else:
+                    stats["tiles"] += 1
+
+        try:
+            await asyncio.wait_for(fetch_all(), timeout)
+        except asyncio.TimeoutError:
+            stats["timed_out"] = True
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("ウォームアップが終わりました", extra={"fields": stats})
+    return stats
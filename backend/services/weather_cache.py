@@ -0,0 +1,255 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
+
+from services.upstream_scheduler import Priority, set_upstream_priority
+from services.weather_service import WeatherAPIError
+from utils import geohash
+from utils.log import get_logger
+
+if TYPE_CHECKING:
+    from services.shared_tile_store import SharedTileStore
+
+logger = get_logger("weather_cache")
+
+
+class WeatherTile:
+    """ジオハッシュ1セル分の天気データ"""
+
+    def __init__(self, key: str, latitude: float, longitude: float, data: Dict[str, Any], fetched_at: float):
+        self.key = key
+        self.latitude = latitude
+        self.longitude = longitude
+        self.data = data
+        self.fetched_at = fetched_at
+        # data から計算した結果（スコアなど）のメモ。タイルが差し替わると一緒に捨てられる
+        self.derived: Dict[str, Any] = {}
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.time()) - self.fetched_at
+
+
+class WeatherTileCache:
+    """
+    ジオハッシュのタイル単位で天気データをキャッシュする
+
+    - 近い地点は同じタイルに丸められ、上流呼び出しを共有する
+    - 同じタイルへの同時ミスは1回の上流呼び出しにまとめる（single-flight）
+    - TTLは OpenWeatherMap の更新間隔（約10分）に合わせる
+    - TTL切れから max_stale 秒以内は古いデータを即座に返し、裏で更新する
+      （stale-while-revalidate）。それを超えたら取得完了まで待つ
+    - shared（SharedTileStore）を渡すと、取得の前に他のワーカーが取ったタイルを探し、
+      上流への取得もワーカー間で1回にまとめる（リースを持つワーカーだけが取りに行く）
+    - 裏での更新と prefetch() は PREFETCH の優先度で上流を呼ぶ
+    - 上流から取れなかったとき（呼び出し上限・サーキットブレーカー・エラー）は、max_stale を
+      過ぎていても最後に取れたタイル（手元、なければ共有ストア）を返す。劣化運転として degraded に数え、
+      is_degraded() で見分けられる
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[float, float], Awaitable[Dict[str, Any]]],
+        ttl: Optional[float] = None,
+        precision: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        max_stale: Optional[float] = None,
+        on_fetch: Optional[Callable[["WeatherTile"], None]] = None,
+        shared: Optional["SharedTileStore"] = None,
+        on_shared_load: Optional[Callable[["WeatherTile"], None]] = None
+    ):
+        self._fetch = fetch
+        # 上流から新しいタイルが届くたびに呼ぶ（観測データの保存など）
+        self._on_fetch = on_fetch
+        # ワーカー間の共有ストアと、他のワーカーが取ったタイルを読み込んだときに呼ぶもの
+        self._shared = shared
+        self._on_shared_load = on_shared_load
+        # 他のワーカーの取得を待つ上限（上流のタイムアウトより長く）と、共有ストアを見直す間隔（秒）
+        self.shared_lease = float(os.getenv("SHARED_CACHE_LEASE", "10"))
+        self.shared_poll_interval = float(os.getenv("SHARED_CACHE_POLL_INTERVAL", "0.05"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("WEATHER_CACHE_TTL", "600"))
+        self.precision = precision if precision is not None else int(os.getenv("WEATHER_TILE_PRECISION", "5"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "20000"))
+        self.max_stale = max_stale if max_stale is not None else float(os.getenv("WEATHER_CACHE_MAX_STALE", "900"))
+        self._entries: "OrderedDict[str, WeatherTile]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[WeatherTile]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.upstream_fetches = 0
+        self.background_refreshes = 0
+        self.prefetches = 0
+        self.degraded = 0
+        self.shared_hits = 0
+        self.shared_waits = 0
+
+    def tile_key(self, latitude: float, longitude: float) -> str:
+        return geohash.encode(latitude, longitude, self.precision)
+
+    async def get(self, latitude: float, longitude: float) -> WeatherTile:
+        """地点を含むタイルの天気を返す（期限切れ・未取得なら上流から取得）"""
+        key = self.tile_key(latitude, longitude)
+        tile = self._entries.get(key)
+        if tile is not None:
+            age = tile.age()
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return tile
+            if age < self.ttl + self.max_stale:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self.background_refreshes += 1
+                    self._start_fetch(key, background=True)
+                return tile
+
+        self.misses += 1
+        try:
+            return await self._load(key)
+        except WeatherAPIError:
+            fallback = tile if tile is not None else self._last_known_good(key)
+            if fallback is None:
+                raise
+            self.degraded += 1
+            return fallback
+
+    def prefetch(self, latitude: float, longitude: float) -> bool:
+        """
+        未取得・期限切れのタイルを裏で取得しておく（PREFETCH の優先度。取得を始めたら True）
+
+        結果は待たず、失敗しても次の get() で取り直す
+        """
+        key = self.tile_key(latitude, longitude)
+        tile = self._entries.get(key)
+        if key in self._inflight or (tile is not None and tile.age() < self.ttl):
+            return False
+        self.prefetches += 1
+        self._start_fetch(key, background=True)
+        return True
+
+    def is_degraded(self, tile: WeatherTile) -> bool:
+        """更新できずに古いまま返したタイルか（stale-while-revalidate の範囲を過ぎている）"""
+        return tile.age() >= self.ttl + self.max_stale
+
+    def _last_known_good(self, key: str) -> Optional[WeatherTile]:
+        """手元にないタイルを、他のワーカーが前に取った分から探す（古さは問わない）"""
+        if self._shared is None:
+            return None
+        record = self._shared.get(key)
+        if record is None:
+            return None
+        latitude, longitude = geohash.decode(key)
+        tile = WeatherTile(key, latitude, longitude, record[1], record[0])
+        self._store(tile)
+        return tile
+
+    async def _load(self, key: str) -> WeatherTile:
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._start_fetch(key)
+        else:
+            self.coalesced += 1
+        # 待っている側がキャンセルされても取得自体は続ける
+        return await asyncio.shield(task)
+
+    def _start_fetch(self, key: str, background: bool = False) -> "asyncio.Task[WeatherTile]":
+        task = asyncio.ensure_future(self._fetch_tile(key, background))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return task
+
+    async def _fetch_tile(self, key: str, background: bool = False) -> WeatherTile:
+        latitude, longitude = geohash.decode(key)
+        if background:
+            # 古いタイルはもう返してあるので、待っているリクエストより後に回す
+            set_upstream_priority(Priority.PREFETCH)
+        if self._shared is not None:
+            tile = await self._load_shared(key, latitude, longitude)
+            if tile is not None:
+                return tile
+        
+        self.upstream_fetches += 1
+        try:
+            data = await self._fetch(latitude, longitude)
+        except BaseException:
+            if self._shared is not None:
+                self._shared.release_lease(key)
+            raise
+        tile = WeatherTile(key, latitude, longitude, data, time.time())
+        self._store(tile)
+        if self._shared is not None:
+            self._shared.put(key, tile.fetched_at, data)
+        if self._on_fetch is not None:
+            try:
+                self._on_fetch(tile)
+            except Exception as e:
+                logger.warning("タイル取得後の処理に失敗しました", extra={"fields": {"tile": key, "error": str(e)}})
+        return tile
+
+    async def _load_shared(self, key: str, latitude: float, longitude: float) -> Optional[WeatherTile]:
+        """
+        共有ストアに新しいタイルがあれば返す。なければリースを取って None（自分で取得する）
+        
+        他のワーカーがリースを持っていれば、書き込まれるかリースが切れるまで待つ
+        """
+        waited = False
+        while True:
+            record = self._shared.get(key)
+            if record is not None and time.time() - record[0] < self.ttl:
+                self.shared_hits += 1
+                tile = WeatherTile(key, latitude, longitude, record[1], record[0])
+                self._store(tile)
+                if self._on_shared_load is not None:
+                    try:
+                        self._on_shared_load(tile)
+                    except Exception as e:
+                        logger.warning("共有タイルの読み込み後の処理に失敗しました", extra={"fields": {"tile": key, "error": str(e)}})
+                return tile
+            if self._shared.acquire_lease(key, self.shared_lease):
+                return None
+            if not waited:
+                waited = True
+                self.shared_waits += 1
+            await asyncio.sleep(self.shared_poll_interval)
+
+    def _store(self, tile: WeatherTile) -> None:
+        self._entries[tile.key] = tile
+        self._entries.move_to_end(tile.key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _finish(self, key: str, task: "asyncio.Task[WeatherTile]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # 待ち手がいなくなった場合でも例外を回収しておく
+            task.exception()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "precision": self.precision,
+            "ttl": self.ttl,
+            "max_stale": self.max_stale,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_fetches": self.upstream_fetches,
+            "background_refreshes": self.background_refreshes,
+            "prefetches": self.prefetches,
+            "degraded": self.degraded,
+            "inflight": len(self._inflight),
+            "hit_ratio": (self.hits + self.stale_hits) / total if total else 0.0,
+            "shared_hits": self.shared_hits,
+            "shared_waits": self.shared_waits,
+            "shared": self._shared.stats() if self._shared is not None else None
+        }
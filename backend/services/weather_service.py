@@ -1,46 +1,209 @@
+import asyncio
 import os
-import requests
 from typing import Dict, Any, Optional
 from datetime import datetime
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+
+import time
+
+import httpx
+
+from services.http_client import get_http_client
+from services.metrics import UPSTREAM_DURATION, UPSTREAM_HEDGES, UPSTREAM_INFLIGHT
+from services.upstream_resilience import CircuitBreaker, LatencyTracker
+from services.upstream_scheduler import Priority, UpstreamRejected, UpstreamScheduler, current_priority
+
+
+class WeatherAPIError(Exception):
+    """OpenWeatherMap 呼び出しの失敗（status_code はHTTPエラー時のみ）"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UpstreamBusyError(WeatherAPIError):
+    """呼び出し上限のため上流を呼べなかった（スケジューラーが断った、または上流の 429）"""
+    
+    def __init__(self, message: str, retry_after: float, status_code: Optional[int] = None):
+        super().__init__(message, status_code)
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailableError(UpstreamBusyError):
+    """サーキットブレーカーが open のため上流を呼ばなかった"""
 
 
 class WeatherService:
-    def __init__(self):
+    def __init__(self, scheduler: Optional[UpstreamScheduler] = None, breaker: Optional[CircuitBreaker] = None):
         self.api_key = os.getenv("OPENWEATHER_API_KEY")
-        self.base_url = "https://api.openweathermap.org/data/2.5"
-        self.executor = ThreadPoolExecutor(max_workers=3)
+        # 負荷試験ではローカルのスタブ（loadtest/owm_stub.py）に向ける
+        self.base_url = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+        # 呼び出し上限に合わせて上流への呼び出しを並べる（None なら制限しない）
+        self.scheduler = scheduler
+        # 失敗が続いたら上流を呼ぶのをやめる（None なら常に呼ぶ）
+        self.breaker = breaker
+        # 1回の呼び出し（ヘッジを含む）にかける上限。httpx のタイムアウトは接続・読み込みの段階ごとなので、全体でも切る
+        self.total_timeout = float(os.getenv("UPSTREAM_TOTAL_TIMEOUT", "8"))
+        # ヘッジを出すまでの待ち時間は最近の応答時間のパーセンタイルから決める
+        self.latency = LatencyTracker()
+        self.hedge_percentile = float(os.getenv("UPSTREAM_HEDGE_PERCENTILE", "0.95"))
+        self.hedge_min_delay = float(os.getenv("UPSTREAM_HEDGE_MIN_DELAY", "0.05"))
+        self.hedges = 0
+        self.hedges_won = 0
     
     async def get_weather(self, latitude: float, longitude: float) -> Dict[str, Any]:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self.executor,
-            self._fetch_weather,
-            latitude,
-            longitude
-        )
+        data = await self.fetch_current_weather(latitude, longitude)
+        return self._format_weather_data(data)
     
-    def _fetch_weather(self, latitude: float, longitude: float) -> Dict[str, Any]:
-        if not self.api_key:
-            raise ValueError("OpenWeather API key not found in environment variables")
-        
-        url = f"{self.base_url}/weather"
+    async def fetch_current_weather(self, latitude: float, longitude: float, lang: Optional[str] = None) -> Dict[str, Any]:
+        """現在の天気をOpenWeatherMapのレスポンスそのままの形で取得"""
         params = {
             "lat": latitude,
             "lon": longitude,
-            "appid": self.api_key,
             "units": "metric"
         }
+        if lang:
+            params["lang"] = lang
+        return await self._request("weather", params)
+    
+    async def _request(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.api_key:
+            raise ValueError("OpenWeather API key not found in environment variables")
+        
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            raise UpstreamUnavailableError("Weather API circuit open", breaker.retry_after())
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            if self.scheduler is not None:
+                try:
+                    await self.scheduler.acquire()
+                except UpstreamRejected as e:
+                    raise UpstreamBusyError(f"Weather API quota: {e.reason}", e.retry_after)
+            try:
+                data = await asyncio.wait_for(self._hedged(endpoint, params), self.total_timeout)
+            except asyncio.TimeoutError:
+                UPSTREAM_DURATION.observe(self.total_timeout, endpoint, "TotalTimeout")
+                raise WeatherAPIError(f"Weather API error: no response within {self.total_timeout:g}s")
+        except UpstreamBusyError:
+            # 上流の調子とは関係ない（呼び出し上限）
+            if breaker is not None:
+                breaker.record_neutral()
+            raise
+        except WeatherAPIError as e:
+            if breaker is not None:
+                # 4xx は上流が応答できている（こちらのリクエストの問題）
+                if e.status_code is not None and e.status_code < 500:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.record_neutral()
+            raise
+        
+        if breaker is not None:
+            breaker.record_success()
+        return data
+    
+    def _hedge_delay(self, endpoint: str) -> Optional[float]:
+        """ヘッジを出すまでの待ち時間（ヘッジしない呼び出しなら None）"""
+        if self.hedge_percentile <= 0 or current_priority() != Priority.INTERACTIVE:
+            return None
+        delay = self.latency.percentile(endpoint, self.hedge_percentile)
+        if delay is None:
+            return None
+        return max(self.hedge_min_delay, delay)
+    
+    async def _hedged(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        上流を呼び、最近の p95 を過ぎても返らなければ同じ呼び出しをもう1件出して先に成功した方を使う
+        
+        ヘッジも呼び出し上限を使うので、スケジューラーのトークンがすぐ取れるときだけ出す
+        """
+        delay = self._hedge_delay(endpoint)
+        primary = asyncio.ensure_future(self._send(endpoint, params))
+        pending = {primary}
+        hedge = None
+        try:
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                if self.scheduler is not None and not self.scheduler.try_acquire():
+                    UPSTREAM_HEDGES.inc("skipped")
+                    return await primary
+                hedge = asyncio.ensure_future(self._send(endpoint, params))
+                pending.add(hedge)
+                self.hedges += 1
             
-            return self._format_weather_data(data)
-        except requests.RequestException as e:
-            raise Exception(f"Weather API error: {str(e)}")
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if hedge is not None:
+                        won = task is hedge
+                        self.hedges_won += won
+                        UPSTREAM_HEDGES.inc("won" if won else "lost")
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def _send(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """上流への1回の呼び出し"""
+        start = time.perf_counter()
+        UPSTREAM_INFLIGHT.inc()
+        try:
+            response = await get_http_client().get(
+                f"{self.base_url}/{endpoint}",
+                params={**params, "appid": self.api_key}
+            )
+        except httpx.HTTPError as e:
+            UPSTREAM_DURATION.observe(time.perf_counter() - start, endpoint, type(e).__name__)
+            raise WeatherAPIError(f"Weather API error: {str(e)}")
+        finally:
+            UPSTREAM_INFLIGHT.dec()
+        
+        UPSTREAM_DURATION.observe(time.perf_counter() - start, endpoint, str(response.status_code))
+        if response.status_code == 429:
+            retry_after = self._retry_after(response)
+            if self.scheduler is not None:
+                self.scheduler.throttle(retry_after)
+            raise UpstreamBusyError("Weather API error: 429", retry_after or 60.0, 429)
+        if response.status_code != 200:
+            raise WeatherAPIError(f"Weather API error: {response.status_code}", response.status_code)
+        # 200 でも本文が壊れていれば（途中で切れた・プロキシのエラーページなど）5xx と同じ上流の失敗として扱う
+        try:
+            data = response.json()
+        except ValueError:
+            raise WeatherAPIError("Weather API error: invalid JSON in response")
+        if not isinstance(data, dict):
+            raise WeatherAPIError("Weather API error: unexpected response body")
+        self.latency.observe(endpoint, time.perf_counter() - start)
+        return data
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats() if self.breaker is not None else None,
+            "latency": self.latency.stats(),
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "total_timeout": self.total_timeout
+        }
+    
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
     
     def _format_weather_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         return {
@@ -65,36 +228,20 @@ class WeatherService:
         }
     
     async def get_forecast(self, latitude: float, longitude: float, days: int = 5) -> Dict[str, Any]:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self.executor,
-            self._fetch_forecast,
-            latitude,
-            longitude,
-            days
-        )
+        data = await self.fetch_forecast(latitude, longitude, days)
+        return self._format_forecast_data(data)
     
-    def _fetch_forecast(self, latitude: float, longitude: float, days: int) -> Dict[str, Any]:
-        if not self.api_key:
-            raise ValueError("OpenWeather API key not found in environment variables")
-        
-        url = f"{self.base_url}/forecast"
+    async def fetch_forecast(self, latitude: float, longitude: float, days: int = 5, lang: Optional[str] = None) -> Dict[str, Any]:
+        """3時間ごとの予報をOpenWeatherMapのレスポンスそのままの形で取得"""
         params = {
             "lat": latitude,
             "lon": longitude,
-            "appid": self.api_key,
             "units": "metric",
             "cnt": days * 8
         }
-        
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            return self._format_forecast_data(data)
-        except requests.RequestException as e:
-            raise Exception(f"Forecast API error: {str(e)}")
+        if lang:
+            params["lang"] = lang
+        return await self._request("forecast", params)
     
     def _format_forecast_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         forecasts = []
@@ -0,0 +1,20 @@
+"""
+テスト共通の設定
+
+backend ディレクトリで実行する:
+    python -m pytest -q                       # slow（時間を計る・複数プロセスを起動する）は飛ばす
+    python -m pytest -q -m slow               # slow だけ
+    python -m pytest -q -m "slow or not slow" # すべて
+"""
+import os
+import sys
+
+# リポジトリのルートから実行しても main や services を import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: 実時間の予算を確かめる・サブプロセスを起動するテスト（-m で指定したときだけ実行）")
+    # 負荷のかかったCIでは時間の計測が揺れるので、-m を指定しなければ slow を外す（addopts = -m "not slow" と同じ）
+    if not config.option.markexpr:
+        config.option.markexpr = "not slow"
@@ -0,0 +1,41 @@
+"""
+ストリーミングのルート（NDJSON）を gzip で圧縮しないこと
+"""
+import importlib.util
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("brotli_asgi") is not None,
+    reason="brotli-asgi が入っている環境では gzip の経路を通らない"
+)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("OBSERVATION_STORE", "off")
+    # APIキーがなければ batch はテストデータを返す（上流を呼ばない）
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "")
+    monkeypatch.setenv("COMPRESSION_MIN_SIZE", "100")
+    with TestClient(main.create_app()) as client:
+        yield client
+
+
+def test_ndjson_batch_is_not_compressed(client):
+    locations = [{"lat": 35 + i * 0.1, "lng": 139} for i in range(20)]
+    with client.stream(
+        "POST", "/api/today-forecast/batch", json={"locations": locations}, headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        lines = [line for line in response.iter_lines() if line]
+    assert len(lines) == len(locations)
+
+
+def test_json_is_still_compressed(client):
+    response = client.get("/api/solar/times", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == "gzip"
@@ -0,0 +1,51 @@
+"""
+エフェメリスの1件版の補間（interpolate_point）と ephemeris 方式の sun()
+"""
+import random
+from datetime import date
+
+import numpy as np
+import pytest
+
+from services.ephemeris import build_table
+from services.solar_backends import EphemerisBackend, FormulaBackend, SolarBackend
+from services.solar_service import SolarService
+
+START = date(2026, 6, 1)
+START_DAY = (START - date(1970, 1, 1)).days
+
+
+@pytest.fixture(scope="module")
+def table(tmp_path_factory):
+    path = tmp_path_factory.mktemp("ephemeris") / "table.bin"
+    return build_table(str(path), START, days=5, lat_range=(30.0, 40.0), lon_range=(130.0, 140.0), step=1.0, verify_samples=100)
+
+
+def test_interpolate_point_matches_interpolate(table):
+    rng = random.Random(0)
+    for _ in range(500):
+        # 範囲の少し外側まで含める
+        lat, lon = rng.uniform(29, 41), rng.uniform(129, 141)
+        day_seconds = (START_DAY + rng.randrange(-1, 6)) * 86400.0
+        point = table.interpolate_point(lat, lon, day_seconds)
+        events, covered = table.interpolate(np.array([lat]), np.array([lon]), np.array([day_seconds]))
+        assert (point is not None) == bool(covered[0]), (lat, lon, day_seconds)
+        if point is not None:
+            for key, value in point.items():
+                assert abs(value - events[key][0]) * 86400 < 0.1, key
+
+
+def test_ephemeris_backend_matches_formula(table):
+    service = SolarService(ephemeris=table)
+    ephemeris, formula = EphemerisBackend(service), FormulaBackend(service)
+    day = date(2026, 6, 3)
+    # テーブルの範囲内は補間（誤差1秒程度）、範囲外は formula と同じ厳密計算
+    inside, exact = ephemeris.sun(35.68, 139.65 - 5, day), formula.sun(35.68, 139.65 - 5, day)
+    for key in exact:
+        assert abs((inside[key] - exact[key]).total_seconds()) <= 2, key
+    assert ephemeris.sun(26.21, 127.68, day) == formula.sun(26.21, 127.68, day)
+
+
+def test_solar_backend_is_abstract():
+    with pytest.raises(TypeError):
+        SolarBackend()
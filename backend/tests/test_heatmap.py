@@ -0,0 +1,69 @@
+"""
+ヒートマップの日の入を設定された方式（SOLAR_BACKEND）に合わせる calibrate_sunsets
+"""
+import math
+from datetime import date
+
+import numpy as np
+import pytest
+
+from services.heatmap import HeatmapGrid, calibrate_sunsets
+from services.solar_backends import FormulaBackend
+from services.solar_service import SolarService
+
+
+def approximate_sunsets(grid: HeatmapGrid, day: date) -> np.ndarray:
+    day_seconds = np.full(grid.point_latitudes.shape, (day - date(1970, 1, 1)).days * 86400.0)
+    sunset = SolarService().solar_event_julian_days(grid.point_latitudes, grid.point_longitudes, day_seconds)["sunset"]
+    return (sunset - 2440587.5) * 86400
+
+
+def exact_sunsets(grid: HeatmapGrid, sun, day: date) -> np.ndarray:
+    values = []
+    for latitude, longitude in zip(grid.point_latitudes.tolist(), grid.point_longitudes.tolist()):
+        try:
+            values.append(sun(latitude, longitude, day)["sunset"].timestamp())
+        except ValueError:
+            values.append(math.nan)
+    return np.array(values)
+
+
+@pytest.fixture
+def astral_sun():
+    pytest.importorskip("astral")
+    from services.solar_backends import AstralBackend
+
+    return AstralBackend().sun
+
+
+@pytest.mark.parametrize("lat, lng, size, radius, day", [
+    (35.6762, 139.6503, 16, 20, date(2026, 6, 21)),
+    (43.0618, 141.3545, 33, 60, date(2026, 12, 22)),
+    (26.2124, 127.6809, 8, 30, date(2026, 3, 20)),
+])
+def test_calibrated_sunsets_match_backend(astral_sun, lat, lng, size, radius, day):
+    grid = HeatmapGrid(lat, lng, size, radius, 5)
+    calibrated = calibrate_sunsets(grid, approximate_sunsets(grid, day), astral_sun, day)
+    exact = exact_sunsets(grid, astral_sun, day)
+    # 近似式（高度0°）と astral（大気差込み）の差は数分あるが、補間後は1秒以内
+    assert np.abs(approximate_sunsets(grid, day) - exact).max() > 60
+    assert np.abs(calibrated - exact).max() < 1
+
+
+def test_formula_backend_needs_no_correction():
+    day = date(2026, 6, 21)
+    grid = HeatmapGrid(35.6762, 139.6503, 8, 20, 5)
+    sun = FormulaBackend(SolarService()).sun
+    calibrated = calibrate_sunsets(grid, approximate_sunsets(grid, day), sun, day)
+    assert np.abs(calibrated - exact_sunsets(grid, sun, day)).max() < 1
+
+
+def test_polar_night_boundary_falls_back_to_backend(astral_sun):
+    # 冬至の北極圏の境界: 北側の点は日の入が起きない
+    day = date(2026, 12, 22)
+    grid = HeatmapGrid(67.0, 25.0, 8, 150, 5)
+    calibrated = calibrate_sunsets(grid, approximate_sunsets(grid, day), astral_sun, day)
+    exact = exact_sunsets(grid, astral_sun, day)
+    assert np.isnan(exact).any() and not np.isnan(exact).all()
+    np.testing.assert_array_equal(np.isnan(calibrated), np.isnan(exact))
+    assert np.nanmax(np.abs(calibrated - exact)) == 0
@@ -0,0 +1,23 @@
+"""
+ETag（弱いETag）と If-None-Match の比較
+"""
+from utils.http_cache import etag_matches, make_etag
+
+
+def test_etag_is_weak():
+    etag = make_etag("today-forecast", "xn76u", 1000.0)
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == make_etag("today-forecast", "xn76u", 1000.0)
+    assert etag != make_etag("today-forecast", "xn76u", 1001.0)
+
+
+def test_if_none_match_uses_weak_comparison():
+    etag = make_etag("solar-times", 1)
+    opaque = etag[2:]
+    assert etag_matches(etag, etag)
+    # 強いETagとして送り返すクライアントや、複数の候補にも一致する
+    assert etag_matches(opaque, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(make_etag("solar-times", 2), etag)
+    assert not etag_matches(None, etag)
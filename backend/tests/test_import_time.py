@@ -0,0 +1,15 @@
+"""
+起動時間の予算（benchmarks/import_time.py と同じ確認を既定の予算で）
+"""
+import pytest
+
+from benchmarks.import_time import check, run
+
+
+@pytest.mark.slow
+def test_import_time_within_budget():
+    failures = check(run(repeat=5), import_budget=200, create_budget=100)
+    if failures:
+        # 時間は他のプロセスの負荷で揺れるので、超えたら1回だけ計り直す（遅延 import の崩れは毎回出る）
+        failures = check(run(repeat=5), import_budget=200, create_budget=100)
+    assert failures == []
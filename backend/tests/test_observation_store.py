@@ -0,0 +1,72 @@
+"""
+観測データの保存先の選び方と、書き込みスレッド（ObservationStore）の失敗からの立ち直り
+"""
+import pytest
+
+from services.observation_store import ObservationStore, SQLiteWriter, create_observation_store
+
+
+class FlakyWriter(SQLiteWriter):
+    """最初の write_many だけ失敗する"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.setups = 0
+        self.fail_next = True
+
+    def setup(self) -> None:
+        self.setups += 1
+        super().setup()
+
+    def write_many(self, rows) -> None:
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("connection lost")
+        super().write_many(rows)
+
+
+def make_row(i: int):
+    return ("current", f"tile-{i}", 35.0, 139.0, 1_700_000_000.0, 1_700_000_000.0, {"i": i}, 50, "fair", 40, "fair")
+
+
+def test_setup_is_retried_after_write_failure(tmp_path):
+    writer = FlakyWriter(str(tmp_path / "observations.db"))
+    store = ObservationStore(writer, batch_size=10, flush_interval=60, queue_size=10)
+
+    store._flush([make_row(0)])
+    assert store.stats()["failed"] == 1
+    assert not store._ready
+
+    store._flush([make_row(1), make_row(2)])
+    assert writer.setups == 2
+    assert store.stats()["written"] == 2
+    count = writer._conn.execute("SELECT COUNT(*) FROM weather_observations").fetchone()[0]
+    writer.close()
+    assert count == 2
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    for name in ("OBSERVATION_STORE", "OBSERVATION_SQLITE_PATH", "DB_HOST"):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_auto_stores_nothing_by_default(clean_env, tmp_path):
+    clean_env.chdir(tmp_path)
+    assert create_observation_store() is None
+    assert not list(tmp_path.iterdir())
+
+
+def test_auto_uses_sqlite_only_with_path(clean_env, tmp_path):
+    path = str(tmp_path / "observations.db")
+    clean_env.setenv("OBSERVATION_SQLITE_PATH", path)
+    store = create_observation_store()
+    assert store.writer.name == "sqlite"
+    assert store.writer.path == path
+
+
+def test_explicit_sqlite_without_path(clean_env, tmp_path):
+    clean_env.chdir(tmp_path)
+    clean_env.setenv("OBSERVATION_STORE", "sqlite")
+    assert create_observation_store().writer.path == "skyle_observations.db"
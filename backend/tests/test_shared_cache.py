@@ -0,0 +1,18 @@
+"""
+ワーカー間の共有キャッシュ（loadtest/shared_cache_check.py と同じ確認）
+
+uvicorn --workers 4 とスタブを起動するので slow を付けてある（python -m pytest -q -m slow で実行）。
+"""
+import asyncio
+
+import pytest
+
+from loadtest.shared_cache_check import run_check
+
+
+@pytest.mark.slow
+def test_upstream_fetched_once_per_tile():
+    tiles = 12
+    report = asyncio.run(run_check(workers=4, tiles=tiles, requests_per_tile=12, latency_ms=300, shared=True))
+    assert report["errors"] == 0
+    assert report["upstream_requests"] == tiles
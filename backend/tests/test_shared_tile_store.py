@@ -0,0 +1,40 @@
+"""
+共有タイルストアのファイルの作成と、設定が変わったときの差し替え
+"""
+import os
+
+import pytest
+
+pytest.importorskip("fcntl")
+
+from services.shared_tile_store import SharedTileStore
+
+
+def test_reopen_with_same_settings_shares_records(tmp_path):
+    path = str(tmp_path / "weather.cache")
+    first = SharedTileStore(path, slots=64, record_size=512)
+    first.put("xn76u", 1000.0, {"clouds": {"all": 40}})
+    second = SharedTileStore(path, slots=64, record_size=512)
+    assert second.get("xn76u") == (1000.0, {"clouds": {"all": 40}})
+
+
+def test_settings_change_replaces_file_without_touching_old_mapping(tmp_path):
+    path = str(tmp_path / "weather.cache")
+    old = SharedTileStore(path, slots=64, record_size=512)
+    old.put("xn76u", 1000.0, {"clouds": {"all": 40}})
+    old_inode = os.stat(path).st_ino
+
+    # レコードの大きさを変えて起動したワーカー（古いワーカーはまだ動いている）
+    new = SharedTileStore(path, slots=64, record_size=1024)
+    assert os.stat(path).st_ino != old_inode
+    assert new.get("xn76u") is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    # 古いワーカーは切り詰められていない古いファイルをそのまま読み書きできる（SIGBUS にならない）
+    assert old.get("xn76u") == (1000.0, {"clouds": {"all": 40}})
+    old.put("xn76v", 1001.0, {"clouds": {"all": 50}})
+    assert old.get("xn76v") == (1001.0, {"clouds": {"all": 50}})
+
+    # 新しい設定のワーカー同士は差し替えたファイルを共有する
+    new.put("xn76u", 1002.0, {"clouds": {"all": 60}})
+    assert SharedTileStore(path, slots=64, record_size=1024).get("xn76u") == (1002.0, {"clouds": {"all": 60}})
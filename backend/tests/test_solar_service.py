@@ -0,0 +1,82 @@
+"""
+1地点版の太陽時刻計算（_calculate_solar_times / _calculate_solar_day）を固定の時刻で押さえる
+
+期待値は日番号を切り上げる修正（UTC 0時を渡すとその日の南中になる）の後の出力。
+NumPy版（solar_event_julian_days）とは同じ入力で 1 秒以内に一致することも確かめる。
+"""
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pytest
+
+from services.solar_service import SolarService
+
+ONE_SECOND = 1 / 86400
+
+# (地点, 緯度, 経度, 日付, 日の出, 南中, 日の入, 市民薄明の終わり, 夕方のゴールデンアワー)
+EXPECTED = [
+    ("tokyo", 35.6762, 139.6503, date(2026, 6, 21), "2026-06-20T19:30:26+00:00", "2026-06-21T02:43:01+00:00", "2026-06-21T09:55:35+00:00", "2026-06-21T10:30:25+00:00", "2026-06-21T09:22:26+00:00"),
+    ("tokyo", 35.6762, 139.6503, date(2026, 12, 22), "2026-12-21T21:52:13+00:00", "2026-12-22T02:39:38+00:00", "2026-12-22T07:27:03+00:00", "2026-12-22T08:00:13+00:00", "2026-12-22T06:52:14+00:00"),
+    ("tokyo", 35.6762, 139.6503, date(2026, 3, 20), "2026-03-19T20:50:08+00:00", "2026-03-20T02:49:04+00:00", "2026-03-20T08:47:59+00:00", "2026-03-20T09:17:33+00:00", "2026-03-20T08:18:24+00:00"),
+    ("sapporo", 43.0618, 141.3545, date(2026, 6, 21), "2026-06-20T19:00:33+00:00", "2026-06-21T02:36:12+00:00", "2026-06-21T10:11:51+00:00", "2026-06-21T10:52:46+00:00", "2026-06-21T09:33:58+00:00"),
+    ("sapporo", 43.0618, 141.3545, date(2026, 12, 22), "2026-12-21T22:08:29+00:00", "2026-12-22T02:32:49+00:00", "2026-12-22T06:57:10+00:00", "2026-12-22T07:35:03+00:00", "2026-12-22T06:16:14+00:00"),
+    ("naha", 26.2124, 127.6809, date(2026, 6, 21), "2026-06-20T20:41:35+00:00", "2026-06-21T03:30:54+00:00", "2026-06-21T10:20:13+00:00", "2026-06-21T10:50:32+00:00", "2026-06-21T09:50:45+00:00"),
+    ("naha", 26.2124, 127.6809, date(2026, 12, 22), "2026-12-21T22:16:51+00:00", "2026-12-22T03:27:32+00:00", "2026-12-22T08:38:12+00:00", "2026-12-22T09:07:40+00:00", "2026-12-22T08:07:53+00:00"),
+]
+
+# 1地点版と NumPy版を比べる地点（極付近の白夜・極夜を含む）
+POINTS = [(35.6762, 139.6503), (43.0618, 141.3545), (26.2124, 127.6809), (-33.8688, 151.2093), (51.5074, -0.1278), (69.6492, 18.9553), (-77.8460, 166.6760)]
+DATES = [date(2026, 3, 20), date(2026, 6, 21), date(2026, 9, 23), date(2026, 12, 22)]
+
+
+def utc_midnight(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def to_utc(value: str) -> datetime:
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+
+def assert_within_one_second(actual: str, expected: str) -> None:
+    assert abs((to_utc(actual) - to_utc(expected)).total_seconds()) <= 1, (actual, expected)
+
+
+@pytest.mark.parametrize("name, lat, lon, day, sunrise, solar_noon, sunset, civil_dusk, golden_evening", EXPECTED)
+def test_solar_times_pinned(name, lat, lon, day, sunrise, solar_noon, sunset, civil_dusk, golden_evening):
+    times = SolarService()._calculate_solar_times(lat, lon, utc_midnight(day))
+    assert_within_one_second(times["sunrise"], sunrise)
+    assert_within_one_second(times["solar_noon"], solar_noon)
+    assert_within_one_second(times["sunset"], sunset)
+    assert_within_one_second(times["twilight"]["civil"]["dusk"], civil_dusk)
+    assert_within_one_second(times["golden_hour"]["evening"], golden_evening)
+    # 南中は日の出と日の入のちょうど中間
+    midpoint = to_utc(times["sunrise"]) + (to_utc(times["sunset"]) - to_utc(times["sunrise"])) / 2
+    assert abs((midpoint - to_utc(times["solar_noon"])).total_seconds()) <= 1
+
+
+@pytest.mark.parametrize("name, lat, lon, day, sunrise, solar_noon, sunset, civil_dusk, golden_evening", EXPECTED)
+def test_solar_noon_agrees_with_astral(name, lat, lon, day, sunrise, solar_noon, sunset, civil_dusk, golden_evening):
+    # 式そのものの検算。astral は任意の依存なので入っていなければ飛ばす
+    astral_sun = pytest.importorskip("astral.sun")
+    from astral import Observer
+
+    noon = astral_sun.noon(Observer(latitude=lat, longitude=lon), day)
+    assert abs((noon - to_utc(solar_noon)).total_seconds()) <= 60
+
+
+def test_scalar_matches_numpy():
+    service = SolarService()
+    for lat, lon in POINTS:
+        for day in DATES:
+            midnight = utc_midnight(day)
+            scalar = service._calculate_solar_day(lat, lon, service._get_julian_day(midnight))
+            vector = service.solar_event_julian_days(
+                np.array([lat]), np.array([lon]), np.array([midnight.timestamp()])
+            )
+            assert scalar.keys() == vector.keys()
+            for key, value in scalar.items():
+                expected = vector[key][0]
+                if value is None:
+                    assert np.isnan(expected), (lat, lon, day, key)
+                else:
+                    assert abs(value - expected) <= ONE_SECOND, (lat, lon, day, key)
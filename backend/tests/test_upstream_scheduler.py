@@ -0,0 +1,35 @@
+"""
+UpstreamScheduler.capacity() の見込みと acquire() が断る件数が一致すること
+"""
+import asyncio
+
+from services.upstream_scheduler import Priority, UpstreamRejected, UpstreamScheduler, upstream_priority
+
+
+def test_capacity_matches_acquire(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_DEADLINE_BATCH", "3.25")
+
+    async def run():
+        # 毎秒2件・バースト4・締め切り3.25秒 -> 4 + 2 * 3.25 = 10.5 なので10件
+        scheduler = UpstreamScheduler(rate_per_minute=120, burst=4)
+        capacity = scheduler.capacity(Priority.BATCH)
+        assert capacity == 10
+        assert scheduler.estimated_wait(Priority.BATCH, capacity) < 3.25
+
+        granted = rejected = 0
+
+        async def call():
+            nonlocal granted, rejected
+            with upstream_priority(Priority.BATCH):
+                try:
+                    await scheduler.acquire()
+                    granted += 1
+                except UpstreamRejected:
+                    rejected += 1
+
+        await asyncio.gather(*(call() for _ in range(capacity + 5)))
+        return capacity, granted, rejected
+
+    capacity, granted, rejected = asyncio.run(run())
+    assert granted == capacity
+    assert rejected == 5
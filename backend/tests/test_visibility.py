@@ -0,0 +1,223 @@
+"""
+ルール表による可視性・ハロ判定が、表にする前の if/elif の実装と同じ結果になることを確かめる
+
+_legacy_* は user-009 以前の utils/visibility.py をそのまま写したもの（比較の基準なので変更しない）。
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from utils.visibility import (
+    calculate_halo_scores_batch,
+    calculate_halo_visibility,
+    calculate_visibility_score,
+    calculate_visibility_scores_batch
+)
+
+# 境界値とその両隣
+CLOUDS = [0, 19, 20, 21, 29, 30, 31, 59, 60, 61, 74, 75, 76, 84, 85, 86, 100]
+HUMIDITY = [0, 29, 30, 31, 39, 40, 41, 69, 70, 71, 79, 80, 81, 100]
+VISIBILITY = [None, 0, 4999, 5000, 5001, 7999, 8000, 8001, 9999, 10000, 10001]
+CONDITIONS = ["Clear", "Clouds", "Rain", "Snow", "Mist", "Thunderstorm"]
+
+
+def _legacy_visibility(weather_data: dict) -> dict:
+    score = 0
+    factors = {}
+
+    cloud_cover = weather_data["clouds"]["all"]
+    factors["雲量"] = f"{cloud_cover}%"
+    if 30 <= cloud_cover <= 60:
+        score += 40
+        factors["雲量判定"] = "理想的"
+    elif 20 <= cloud_cover < 30 or 60 < cloud_cover <= 75:
+        score += 25
+        factors["雲量判定"] = "良好"
+    elif cloud_cover < 20:
+        score += 10
+        factors["雲量判定"] = "快晴すぎる"
+    else:
+        score += 5
+        factors["雲量判定"] = "曇りすぎ"
+
+    humidity = weather_data["main"]["humidity"]
+    factors["湿度"] = f"{humidity}%"
+    if 40 <= humidity <= 70:
+        score += 25
+        factors["湿度判定"] = "理想的"
+    elif 30 <= humidity < 40 or 70 < humidity <= 80:
+        score += 15
+        factors["湿度判定"] = "良好"
+    else:
+        score += 5
+        factors["湿度判定"] = "要注意"
+
+    weather_condition = weather_data["weather"][0]["main"].lower()
+    factors["天気"] = weather_data["weather"][0]["description"]
+    if weather_condition == "clear":
+        score += 15
+        factors["天気判定"] = "晴れ"
+    elif weather_condition == "clouds":
+        score += 20
+        factors["天気判定"] = "薄曇り（最適）"
+    elif weather_condition == "rain":
+        score += 10
+        factors["天気判定"] = "雨（雨上がりに期待）"
+    else:
+        score += 5
+        factors["天気判定"] = "その他"
+
+    if "visibility" in weather_data:
+        visibility_m = weather_data["visibility"]
+        factors["視程"] = f"{visibility_m}m"
+        if visibility_m >= 10000:
+            score += 15
+            factors["視程判定"] = "非常に良好"
+        elif visibility_m >= 5000:
+            score += 10
+            factors["視程判定"] = "良好"
+        else:
+            score += 5
+            factors["視程判定"] = "やや不良"
+
+    if cloud_cover > 85:
+        if score >= 60:
+            level, message = "fair", "雲が多いですが、隙間に期待"
+        else:
+            level, message = "poor", "雲が多く、見るのは難しそう..."
+    elif score >= 75:
+        if 30 <= cloud_cover <= 50 and 50 <= humidity <= 70:
+            level, message = "excellent", "絶好の撮影日和です"
+        else:
+            level, message = "excellent", "美しい時間が期待できそうです"
+    elif score >= 60:
+        level, message = "good", "綺麗な空が見られるかもしれません"
+    elif score >= 40:
+        if cloud_cover > 75:
+            level, message = "fair", "雲が多めですが、チャンスはあります"
+        else:
+            level, message = "fair", "条件は微妙ですが、可能性はあります"
+    elif cloud_cover < 20:
+        level, message = "poor", "快晴すぎて控えめな色合いかも"
+    else:
+        level, message = "poor", "今日は厳しそうです..."
+
+    return {"score": score, "level": level, "message": message, "factors": factors}
+
+
+def _legacy_halo(weather_data: dict) -> dict:
+    score = 0
+    factors = {}
+
+    clouds = weather_data.get('clouds', {}).get('all', 0)
+    humidity = weather_data.get('main', {}).get('humidity', 0)
+    visibility_m = weather_data.get('visibility', 10000)
+    weather_main = weather_data.get('weather', [{}])[0].get('main', '')
+
+    if 30 <= clouds <= 70:
+        score += 35
+        factors['雲量'] = f'{clouds}% ✓ 高層雲に期待'
+    elif clouds < 30:
+        score += 10
+        factors['雲量'] = f'{clouds}% - 雲が少ない'
+    else:
+        score += 15
+        factors['雲量'] = f'{clouds}% - やや多い'
+
+    if 40 <= humidity <= 80:
+        score += 30
+        factors['湿度'] = f'{humidity}% ✓ 氷晶形成に適した条件'
+    else:
+        score += 10
+        factors['湿度'] = f'{humidity}%'
+
+    if visibility_m >= 8000:
+        score += 25
+        factors['視程'] = f'{visibility_m/1000:.1f}km ✓ クリア'
+    elif visibility_m >= 5000:
+        score += 15
+        factors['視程'] = f'{visibility_m/1000:.1f}km'
+    else:
+        score += 5
+        factors['視程'] = f'{visibility_m/1000:.1f}km - 視界不良'
+
+    if weather_main in ['Clouds']:
+        score += 10
+        factors['天気'] = '薄曇り ✓ ハロに最適'
+    elif weather_main in ['Clear']:
+        score -= 10
+        factors['天気'] = '快晴 - 雲が必要'
+    elif weather_main in ['Rain', 'Snow']:
+        score -= 20
+        factors['天気'] = '降水中 - 難しい'
+
+    if score >= 80:
+        level, message = 'excellent', '✨ ハロが見える絶好の条件です'
+    elif score >= 60:
+        level, message = 'good', '👌 ハロが見えるかもしれません'
+    elif score >= 40:
+        level, message = 'fair', '🤔 ハロは難しいかも...'
+    else:
+        level, message = 'poor', '😔 今日のハロは期待薄です'
+
+    return {'score': score, 'level': level, 'message': message, 'factors': factors}
+
+
+def make_weather(clouds, humidity, visibility, condition) -> dict:
+    data = {
+        "clouds": {"all": clouds},
+        "main": {"humidity": humidity},
+        "weather": [{"main": condition, "description": condition.lower()}]
+    }
+    if visibility is not None:
+        data["visibility"] = visibility
+    return data
+
+
+CASES = list(itertools.product(CLOUDS, HUMIDITY, VISIBILITY, CONDITIONS))
+
+
+def test_visibility_score_matches_legacy():
+    for case in CASES:
+        data = make_weather(*case)
+        expected = _legacy_visibility(data)
+        actual = calculate_visibility_score(data)
+        assert actual == expected, case
+        # factors の並び順（画面の表示順）も同じ
+        assert list(actual["factors"]) == list(expected["factors"]), case
+
+
+def test_halo_visibility_matches_legacy():
+    for case in CASES:
+        data = make_weather(*case)
+        expected = _legacy_halo(data)
+        actual = calculate_halo_visibility(data)
+        assert actual == expected, case
+        assert list(actual["factors"]) == list(expected["factors"]), case
+
+
+def test_payload_without_visibility_key():
+    data = make_weather(45, 60, None, "Clouds")
+    assert "visibility" not in data
+    visibility = calculate_visibility_score(data)
+    assert visibility == _legacy_visibility(data)
+    assert "視程" not in visibility["factors"]
+    # ハロは 10000m として扱う
+    assert calculate_halo_visibility(data) == _legacy_halo(data)
+
+
+@pytest.mark.parametrize("batch, legacy", [
+    (calculate_visibility_scores_batch, _legacy_visibility),
+    (calculate_halo_scores_batch, _legacy_halo)
+])
+def test_batch_scores_match_legacy(batch, legacy):
+    clouds, humidity, visibility, conditions = zip(*CASES)
+    scores = batch(
+        clouds,
+        humidity,
+        [np.nan if value is None else value for value in visibility],
+        conditions
+    )
+    expected = [legacy(make_weather(*case))["score"] for case in CASES]
+    assert scores.tolist() == expected
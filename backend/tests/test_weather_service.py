@@ -0,0 +1,68 @@
+"""
+上流が 200 で壊れた本文を返したときも、5xx と同じ失敗（ブレーカー・劣化運転）として扱うこと
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from services import http_client
+from services.upstream_resilience import CircuitBreaker
+from services.weather_cache import WeatherTileCache
+from services.weather_service import WeatherAPIError, WeatherService
+
+GOOD = {"clouds": {"all": 40}, "main": {"humidity": 60}, "weather": [{"main": "Clouds", "description": "曇り"}]}
+
+
+def run_with_upstream(responses, body):
+    """responses の順に上流の応答を返すモックで body(service) を実行する"""
+    queue = list(responses)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return queue.pop(0)
+
+    async def run():
+        await http_client.open_http_client(httpx.MockTransport(handler))
+        try:
+            return await body(WeatherService(breaker=CircuitBreaker(window=10, min_calls=2, failure_ratio=0.5, cooldown=60)))
+        finally:
+            await http_client.close_http_client()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "test")
+    monkeypatch.setenv("UPSTREAM_HEDGE_PERCENTILE", "0")
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(200, text="<html>Bad gateway</html>"),
+    httpx.Response(200, text='{"clouds": {"all": 4'),
+    httpx.Response(200, json=["not", "an", "object"]),
+])
+def test_invalid_body_counts_as_upstream_failure(response):
+    async def body(service):
+        for _ in range(2):
+            with pytest.raises(WeatherAPIError):
+                await service.fetch_current_weather(35.0, 139.0)
+        return service.breaker.stats()
+
+    stats = run_with_upstream([response, response], body)
+    assert stats["recent_failures"] == 2
+    assert stats["state"] == "open"
+
+
+def test_invalid_body_falls_back_to_last_tile():
+    async def body(service):
+        cache = WeatherTileCache(lambda lat, lng: service.fetch_current_weather(lat, lng), ttl=0, max_stale=0)
+        first = await cache.get(35.0, 139.0)
+        second = await cache.get(35.0, 139.0)
+        return first, second, cache.stats()["degraded"]
+
+    first, second, degraded = run_with_upstream(
+        [httpx.Response(200, json=GOOD), httpx.Response(200, text="<html>oops</html>")], body
+    )
+    assert second is first
+    assert degraded == 1
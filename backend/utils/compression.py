@@ -0,0 +1,23 @@
+"""
+ストリーミングのルートを避けるレスポンス圧縮
+
+GZipMiddleware（starlette 0.47 系）は text/event-stream 以外のストリーミングも
+まとめて圧縮するので、NDJSON の1行ごとの送信が圧縮器の中に溜まってしまう。
+exclude に挙げたパスは圧縮を通さずにそのまま返す。
+"""
+from typing import Any, Sequence
+
+
+class ExcludePathsCompression:
+    """compressor（GZipMiddleware など）を exclude 以外のパスにだけかける"""
+
+    def __init__(self, app, compressor, exclude: Sequence[str] = (), **options: Any):
+        self.app = app
+        self.compressed = compressor(app, **options)
+        self.exclude = frozenset(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        await self.compressed(scope, receive, send)
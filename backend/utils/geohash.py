@@ -0,0 +1,90 @@
+"""
+ジオハッシュ（Geohash）ユーティリティ
+天気キャッシュのタイル分割や近傍検索に使う
+"""
+from typing import Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE_MAP = {c: i for i, c in enumerate(_BASE32)}
+
+
+def encode(latitude: float, longitude: float, precision: int = 5) -> str:
+    """
+    緯度経度をジオハッシュ文字列に変換
+
+    precision の目安: 4 ≒ 39km, 5 ≒ 4.9km, 6 ≒ 1.2km 四方
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """ジオハッシュのセル範囲を (lat_min, lat_max, lng_min, lng_max) で返す"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+
+    for char in geohash:
+        value = _DECODE_MAP[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """ジオハッシュのセル中心の (緯度, 経度) を返す"""
+    lat_lo, lat_hi, lng_lo, lng_hi = bounds(geohash)
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """指定精度のセルの (緯度方向の幅, 経度方向の幅) を度で返す"""
+    lng_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
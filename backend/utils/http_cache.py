@@ -0,0 +1,53 @@
+"""
+HTTPキャッシュ（ETag / If-None-Match / Cache-Control）
+
+ETag はレスポンスの元になったデータの版（タイルのキーと取得時刻、日付など）から作る。
+版が同じならレスポンスも同じになるようにしてあるので、本文を組み立てる前に
+If-None-Match と比べて 304 を返せる。
+
+ETag は弱いETag（W/"..."）にする。圧縮のミドルウェアが gzip / br / 無圧縮のどれで返しても
+同じ値になるので、バイト単位で同じ本文を保証する強いETagにはできない。
+"""
+import hashlib
+from typing import Any, Callable, Optional
+
+from fastapi.responses import Response
+
+from utils.json_response import FastJSONResponse
+
+
+def make_etag(*parts: Any) -> str:
+    """データの版を表す値から弱いETagを作る"""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match（カンマ区切り・W/付きも可）が etag と一致するか（弱い比較）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = _opaque_tag(etag)
+    return any(_opaque_tag(candidate.strip()) == opaque for candidate in if_none_match.split(","))
+
+
+def cache_control(max_age: float) -> str:
+    return f"public, max-age={max(0, int(max_age))}"
+
+
+def conditional_json(
+    if_none_match: Optional[str],
+    etag: str,
+    max_age: float,
+    build: Callable[[], Any]
+) -> Response:
+    """ETagが一致すれば 304、しなければ build() の結果（dict またはモデル）を返す（どちらも検証用ヘッダー付き）"""
+    headers = {"ETag": etag, "Cache-Control": cache_control(max_age)}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(build(), headers=headers)
@@ -0,0 +1,40 @@
+"""
+orjson によるJSONレスポンス
+
+FastAPI の既定の経路（jsonable_encoder で dict を作り直してから json.dumps）を通さず、
+返す値をそのままバイト列にする。
+
+- Pydantic モデルは model_dump_json（pydantic-core）で直接書き出す
+- dict / list は orjson で書き出し、中の datetime・NumPy 配列・モデルもそのまま扱う
+- datetime は isoformat() と同じ形（マイクロ秒・タイムゾーン付き）になる
+
+エンドポイントからはこのクラスのインスタンスを返す（response_model はドキュメント用に残してよい）。
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"JSONにできない型です: {type(value).__name__}")
+
+
+def dumps(content: Any, sort_keys: bool = False) -> bytes:
+    """レスポンスと同じ規則でJSONのバイト列にする（NDJSON や SSE の1件分にも使う）"""
+    if isinstance(content, BaseModel) and not sort_keys:
+        # model_dump_json と同じだが str を経由しない
+        return type(content).__pydantic_serializer__.to_json(content)
+    return orjson.dumps(content, default=_default, option=_OPTIONS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,176 @@
+"""
+構造化ログ
+
+リクエスト処理側はレコードをキューに積むだけで、JSONへの整形と書き込みは
+QueueListener のスレッドで行う。出力先が遅くてもレスポンスは待たされない。
+
+環境変数:
+    LOG_LEVEL           出力する最低レベル（既定 INFO）
+    LOG_SAMPLE_<LEVEL>  そのレベルを残す割合 0〜1（例: LOG_SAMPLE_INFO=0.1）
+    LOG_QUEUE_SIZE      キューの上限。あふれた分は捨てて数える（既定 10000）
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# ミドルウェアが設定し、ログを積む時点で各レコードに写す
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_ROOT = "skyle"
+_listener: Optional[QueueListener] = None
+_handler: Optional["_NonBlockingQueueHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行のJSON。extra={"fields": {...}} の内容はそのまま展開する"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LevelSampler(logging.Filter):
+    """レベルごとに決めた割合だけレコードを通す（キューに積む前に間引く）"""
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 標準の prepare はここで整形してしまうので、リクエストIDを写すだけにする
+        # （同じプロセス内のリスナーが読むので exc_info もそのまま渡せる）
+        record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _sample_rates() -> Dict[int, float]:
+    rates = {}
+    for name in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        value = os.getenv(f"LOG_SAMPLE_{name}")
+        if value is not None:
+            rates[logging.getLevelName(name)] = float(value)
+    return rates
+
+
+def configure_logging(stream=None) -> None:
+    """skyle.* のロガーをキュー経由の出力に切り替える（2回目以降は何もしない）"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    _handler = _NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(LevelSampler(_sample_rates()))
+
+    root = logging.getLogger(_ROOT)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(_handler)
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """キューに残ったレコードを書き出してからリスナーを止める"""
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger(_ROOT).removeHandler(_handler)
+    _listener = None
+    _handler = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{_ROOT}.{name}")
+
+
+def stats() -> Dict[str, int]:
+    if _handler is None:
+        return {"queued": 0, "dropped": 0, "sampled_out": 0}
+    sampler = next((f for f in _handler.filters if isinstance(f, LevelSampler)), None)
+    return {
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "sampled_out": sampler.sampled_out if sampler else 0
+    }
+
+
+class RequestIdMiddleware:
+    """X-Request-ID を引き継ぎ（なければ採番し）、ログとレスポンスヘッダーに載せる"""
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                request_id = value.decode("latin-1")[:128]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,15 +1,166 @@
 """
 可視性判定ロジック
 夕焼け・マジックアワー・ブルーモーメントが美しく見える条件を判定
+
+判定の閾値と点数は下のルール表にまとめてあり、
+1件ずつの判定（calculate_*）と配列の一括判定（*_batch）の両方がこの表を使う。
+NumPy は一括判定を初めて呼んだときに読み込む（1件ずつの判定だけなら読み込まない）。
 """
+import math
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# ---------------------------------------------------------------------------
+# ルール表
+#
+# 範囲ルール: (範囲のタプル, 点数, 判定)
+#   範囲は (下限, 上限, 端の扱い) で、端の扱いは "[]" "[)" "(]" のいずれか。
+#   上から順に評価して最初に当てはまったものを使う。範囲が None の行は「それ以外」。
+# 天気ルール: {OpenWeatherMap の weather[0]["main"]: (点数, 判定)} と「それ以外」の (点数, 判定)
+# ---------------------------------------------------------------------------
+
+# マジックアワー・ブルーモーメント（100点満点）
+VISIBILITY_RULES = {
+    # 雲量（最重要: 40点）
+    "clouds": (
+        (((30, 60, "[]"),), 40, "理想的"),
+        (((20, 30, "[)"), (60, 75, "(]")), 25, "良好"),
+        (((-math.inf, 20, "[)"),), 10, "快晴すぎる"),
+        (None, 5, "曇りすぎ"),
+    ),
+    # 湿度（25点）
+    "humidity": (
+        (((40, 70, "[]"),), 25, "理想的"),
+        (((30, 40, "[)"), (70, 80, "(]")), 15, "良好"),
+        (None, 5, "要注意"),
+    ),
+    # 天気状況（20点）。キーは小文字で比較する
+    "weather": (
+        {
+            "clear": (15, "晴れ"),
+            "clouds": (20, "薄曇り（最適）"),  # 薄曇りは実は良い
+            "rain": (10, "雨（雨上がりに期待）"),  # 雨上がりの可能性を考慮
+        },
+        (5, "その他"),
+    ),
+    # 視程（15点）。データがなければ加点しない
+    "visibility": (
+        (((10000, math.inf, "[]"),), 15, "非常に良好"),
+        (((5000, 10000, "[)"),), 10, "良好"),
+        (None, 5, "やや不良"),
+    ),
+}
+
+# ハロ（光環）
+HALO_RULES = {
+    # 雲量（30-70%が理想）
+    "clouds": (
+        (((30, 70, "[]"),), 35, "✓ 高層雲に期待"),
+        (((-math.inf, 30, "[)"),), 10, "- 雲が少ない"),
+        (None, 15, "- やや多い"),
+    ),
+    # 湿度（氷晶形成）
+    "humidity": (
+        (((40, 80, "[]"),), 30, "✓ 氷晶形成に適した条件"),
+        (None, 10, ""),
+    ),
+    # 視程（クリアな大気）
+    "visibility": (
+        (((8000, math.inf, "[]"),), 25, "✓ クリア"),
+        (((5000, 8000, "[)"),), 15, ""),
+        (None, 5, "- 視界不良"),
+    ),
+    # 天気条件ボーナス。キーは大文字小文字を区別する
+    "weather": (
+        {
+            "Clouds": (10, "薄曇り ✓ ハロに最適"),
+            "Clear": (-10, "快晴 - 雲が必要"),
+            "Rain": (-20, "降水中 - 難しい"),
+            "Snow": (-20, "降水中 - 難しい"),
+        },
+        (0, None),
+    ),
+}
+
+# (下限スコア, レベル, メッセージ)
+HALO_LEVELS = (
+    (80, "excellent", "✨ ハロが見える絶好の条件です"),
+    (60, "good", "👌 ハロが見えるかもしれません"),
+    (40, "fair", "🤔 ハロは難しいかも..."),
+    (-math.inf, "poor", "😔 今日のハロは期待薄です"),
+)
+
+
+def _compile_bands(rules) -> tuple:
+    """範囲ルールの端の扱いを真偽値に展開しておく（1件ずつの判定を速くするため）"""
+    return tuple(
+        (
+            None if ranges is None else tuple((low, high, edges[0] == "[", edges[1] == "]") for low, high, edges in ranges),
+            points,
+            label
+        )
+        for ranges, points, label in rules
+    )
+
+
+def _match_band(value, bands) -> tuple:
+    """展開済みの範囲ルールを上から評価し、(点数, 判定) を返す"""
+    for ranges, points, label in bands:
+        if ranges is None:
+            return points, label
+        for low, high, low_closed, high_closed in ranges:
+            if (value >= low if low_closed else value > low) and (value <= high if high_closed else value < high):
+                return points, label
+    raise ValueError(f"ルールに当てはまりません: {value}")
+
+
+_VISIBILITY_BANDS = {key: _compile_bands(VISIBILITY_RULES[key]) for key in ("clouds", "humidity", "visibility")}
+_HALO_BANDS = {key: _compile_bands(HALO_RULES[key]) for key in ("clouds", "humidity", "visibility")}
+
+
+def _band_points(values: "np.ndarray", rules) -> "np.ndarray":
+    """範囲ルールを配列に適用して点数の配列を返す"""
+    import numpy as np
+
+    conditions = []
+    choices = []
+    default = 0
+    for ranges, points, _ in rules:
+        if ranges is None:
+            default = points
+            break
+        mask = np.zeros(values.shape, dtype=bool)
+        for low, high, edges in ranges:
+            above = values >= low if edges[0] == "[" else values > low
+            below = values <= high if edges[1] == "]" else values < high
+            mask |= above & below
+        conditions.append(mask)
+        choices.append(points)
+    return np.select(conditions, choices, default)
+
+
+def _category_points(values: "np.ndarray", rules) -> "np.ndarray":
+    """天気ルールを配列に適用して点数の配列を返す"""
+    import numpy as np
+
+    table, (default, _) = rules
+    return np.select(
+        [values == key for key in table],
+        [points for points, _ in table.values()],
+        default
+    )
+
 
 def calculate_visibility_score(weather_data: dict) -> dict:
     """
     天気データから可視性スコアを計算
-    
+
     Args:
         weather_data: OpenWeatherMap APIからの天気データ
-        
+
     Returns:
         {
             "score": int (0-100),
@@ -20,74 +171,39 @@ def calculate_visibility_score(weather_data: dict) -> dict:
     """
     score = 0
     factors = {}
-    
-    # 1. 雲量チェック（最重要: 40点）
+
+    # 1. 雲量チェック
     cloud_cover = weather_data["clouds"]["all"]
+    points, label = _match_band(cloud_cover, _VISIBILITY_BANDS["clouds"])
+    score += points
     factors["雲量"] = f"{cloud_cover}%"
-    
-    if 30 <= cloud_cover <= 60:
-        score += 40
-        factors["雲量判定"] = "理想的"
-    elif 20 <= cloud_cover < 30 or 60 < cloud_cover <= 75:
-        score += 25
-        factors["雲量判定"] = "良好"
-    elif cloud_cover < 20:
-        score += 10
-        factors["雲量判定"] = "快晴すぎる"
-    else:
-        score += 5
-        factors["雲量判定"] = "曇りすぎ"
-    
-    # 2. 湿度チェック（25点）
+    factors["雲量判定"] = label
+
+    # 2. 湿度チェック
     humidity = weather_data["main"]["humidity"]
+    points, label = _match_band(humidity, _VISIBILITY_BANDS["humidity"])
+    score += points
     factors["湿度"] = f"{humidity}%"
-    
-    if 40 <= humidity <= 70:
-        score += 25
-        factors["湿度判定"] = "理想的"
-    elif 30 <= humidity < 40 or 70 < humidity <= 80:
-        score += 15
-        factors["湿度判定"] = "良好"
-    else:
-        score += 5
-        factors["湿度判定"] = "要注意"
-    
-    # 3. 天気状況（20点）
-    weather_condition = weather_data["weather"][0]["main"].lower()
+    factors["湿度判定"] = label
+
+    # 3. 天気状況
+    table, default = VISIBILITY_RULES["weather"]
+    points, label = table.get(weather_data["weather"][0]["main"].lower(), default)
+    score += points
     factors["天気"] = weather_data["weather"][0]["description"]
-    
-    if weather_condition == "clear":
-        score += 15
-        factors["天気判定"] = "晴れ"
-    elif weather_condition == "clouds":
-        score += 20  # 薄曇りは実は良い
-        factors["天気判定"] = "薄曇り（最適）"
-    elif weather_condition == "rain":
-        # 雨上がりの可能性を考慮
-        score += 10
-        factors["天気判定"] = "雨（雨上がりに期待）"
-    else:
-        score += 5
-        factors["天気判定"] = "その他"
-    
-    # 4. 視程（15点）
+    factors["天気判定"] = label
+
+    # 4. 視程
     if "visibility" in weather_data:
         visibility_m = weather_data["visibility"]
+        points, label = _match_band(visibility_m, _VISIBILITY_BANDS["visibility"])
+        score += points
         factors["視程"] = f"{visibility_m}m"
-        
-        if visibility_m >= 10000:
-            score += 15
-            factors["視程判定"] = "非常に良好"
-        elif visibility_m >= 5000:
-            score += 10
-            factors["視程判定"] = "良好"
-        else:
-            score += 5
-            factors["視程判定"] = "やや不良"
-    
+        factors["視程判定"] = label
+
     # スコアに基づいてレベルとメッセージを決定
     level, message = get_level_and_message(score, cloud_cover, humidity)
-    
+
     return {
         "score": score,
         "level": level,
@@ -99,7 +215,7 @@ def calculate_visibility_score(weather_data: dict) -> dict:
 def get_level_and_message(score: int, cloud_cover: int, humidity: int) -> tuple:
     """
     スコアから可視性レベルとメッセージを生成
-    
+
     Returns:
         (level, message) のタプル
     """
@@ -109,20 +225,20 @@ def get_level_and_message(score: int, cloud_cover: int, humidity: int) -> tuple:
             return ("fair", "雲が多いですが、隙間に期待")
         else:
             return ("poor", "雲が多く、見るのは難しそう...")
-    
+
     if score >= 75:
         if 30 <= cloud_cover <= 50 and 50 <= humidity <= 70:
             return ("excellent", "絶好の撮影日和です")
         return ("excellent", "美しい時間が期待できそうです")
-    
+
     elif score >= 60:
         return ("good", "綺麗な空が見られるかもしれません")
-    
+
     elif score >= 40:
         if cloud_cover > 75:
             return ("fair", "雲が多めですが、チャンスはあります")
         return ("fair", "条件は微妙ですが、可能性はあります")
-    
+
     else:
         if cloud_cover < 20:
             return ("poor", "快晴すぎて控えめな色合いかも")
@@ -142,10 +258,16 @@ def get_detailed_visibility(weather_data: dict) -> dict:
     詳細な可視性情報を返す（デバッグ用）
     """
     return calculate_visibility_score(weather_data)
+
+
+def _halo_factor(value: str, label: str) -> str:
+    return f"{value} {label}" if label else value
+
+
 def calculate_halo_visibility(weather_data: dict) -> dict:
     """
     ハロ（光環）現象の可視性を判定
-    
+
     条件:
     - 高層雲（巻雲・巻層雲）の存在
     - 適度な湿度（上層の氷晶）
@@ -153,71 +275,102 @@ def calculate_halo_visibility(weather_data: dict) -> dict:
     """
     score = 0
     factors = {}
-    
-    # データ構造に対応した取得方法に修正
-    clouds = weather_data.get('clouds', {}).get('all', 0)  # 修正
-    humidity = weather_data.get('main', {}).get('humidity', 0)  # 修正
+
+    clouds = weather_data.get('clouds', {}).get('all', 0)
+    humidity = weather_data.get('main', {}).get('humidity', 0)
     visibility_m = weather_data.get('visibility', 10000)
     weather_main = weather_data.get('weather', [{}])[0].get('main', '')
-    
-    # 雲量チェック（30-70%が理想）
-    if 30 <= clouds <= 70:
-        score += 35
-        factors['雲量'] = f'{clouds}% ✓ 高層雲に期待'
-    elif clouds < 30:
-        score += 10
-        factors['雲量'] = f'{clouds}% - 雲が少ない'
-    else:
-        score += 15
-        factors['雲量'] = f'{clouds}% - やや多い'
-    
-    # 湿度チェック（氷晶形成）
-    if 40 <= humidity <= 80:
-        score += 30
-        factors['湿度'] = f'{humidity}% ✓ 氷晶形成に適した条件'
-    else:
-        score += 10
-        factors['湿度'] = f'{humidity}%'
-    
-    # 視程チェック（クリアな大気）
-    if visibility_m >= 8000:
-        score += 25
-        factors['視程'] = f'{visibility_m/1000:.1f}km ✓ クリア'
-    elif visibility_m >= 5000:
-        score += 15
-        factors['視程'] = f'{visibility_m/1000:.1f}km'
-    else:
-        score += 5
-        factors['視程'] = f'{visibility_m/1000:.1f}km - 視界不良'
-    
-    # 天気条件ボーナス
-    if weather_main in ['Clouds']:
-        score += 10
-        factors['天気'] = '薄曇り ✓ ハロに最適'
-    elif weather_main in ['Clear']:
-        score -= 10
-        factors['天気'] = '快晴 - 雲が必要'
-    elif weather_main in ['Rain', 'Snow']:
-        score -= 20
-        factors['天気'] = '降水中 - 難しい'
-    
+
+    points, label = _match_band(clouds, _HALO_BANDS['clouds'])
+    score += points
+    factors['雲量'] = _halo_factor(f'{clouds}%', label)
+
+    points, label = _match_band(humidity, _HALO_BANDS['humidity'])
+    score += points
+    factors['湿度'] = _halo_factor(f'{humidity}%', label)
+
+    points, label = _match_band(visibility_m, _HALO_BANDS['visibility'])
+    score += points
+    factors['視程'] = _halo_factor(f'{visibility_m/1000:.1f}km', label)
+
+    table, default = HALO_RULES['weather']
+    points, label = table.get(weather_main, default)
+    score += points
+    if label:
+        factors['天気'] = label
+
     # 可視性レベル判定
-    if score >= 80:
-        level = 'excellent'
-        message = '✨ ハロが見える絶好の条件です'
-    elif score >= 60:
-        level = 'good'
-        message = '👌 ハロが見えるかもしれません'
-    elif score >= 40:
-        level = 'fair'
-        message = '🤔 ハロは難しいかも...'
-    else:
-        level = 'poor'
-        message = '😔 今日のハロは期待薄です'
-    
+    level, message = get_halo_level_and_message(score)
+
     return {
         'score': score,
         'level': level,
         'message': message,
         'factors': factors
-    }
\ No newline at end of file
+    }
+
+
+def get_halo_level_and_message(score: int) -> tuple:
+    """
+    ハロのスコアから可視性レベルとメッセージを生成
+
+    Returns:
+        (level, message) のタプル
+    """
+    for threshold, level, message in HALO_LEVELS:
+        if score >= threshold:
+            return (level, message)
+
+
+def calculate_visibility_scores_batch(clouds, humidity, visibility, conditions) -> "np.ndarray":
+    """
+    calculate_visibility_score のスコア部分を配列でまとめて計算
+
+    Args:
+        clouds, humidity: 雲量・湿度（%）の配列
+        visibility: 視程（m）の配列。データがない要素は NaN（加点なし）
+        conditions: OpenWeatherMap の weather[0]["main"] の配列
+
+    Returns:
+        スコア（int）の配列
+    """
+    import numpy as np
+
+    clouds = np.asarray(clouds, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    visibility = np.asarray(visibility, dtype=np.float64)
+    conditions = np.char.lower(np.asarray(conditions, dtype=str))
+
+    visibility_points = np.where(
+        np.isnan(visibility),
+        0,
+        _band_points(visibility, VISIBILITY_RULES["visibility"])
+    )
+
+    return (
+        _band_points(clouds, VISIBILITY_RULES["clouds"])
+        + _band_points(humidity, VISIBILITY_RULES["humidity"])
+        + _category_points(conditions, VISIBILITY_RULES["weather"])
+        + visibility_points
+    )
+
+
+def calculate_halo_scores_batch(clouds, humidity, visibility, conditions) -> "np.ndarray":
+    """
+    calculate_halo_visibility のスコア部分を配列でまとめて計算
+
+    visibility が NaN の要素は単体版と同じく 10000m として扱う
+    """
+    import numpy as np
+
+    clouds = np.asarray(clouds, dtype=np.float64)
+    humidity = np.asarray(humidity, dtype=np.float64)
+    visibility = np.nan_to_num(np.asarray(visibility, dtype=np.float64), nan=10000)
+    conditions = np.asarray(conditions, dtype=str)
+
+    return (
+        _band_points(clouds, HALO_RULES["clouds"])
+        + _band_points(humidity, HALO_RULES["humidity"])
+        + _band_points(visibility, HALO_RULES["visibility"])
+        + _category_points(conditions, HALO_RULES["weather"])
+    )
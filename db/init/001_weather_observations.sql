@@ -0,0 +1,18 @@
+-- 上流から取得した天気データと計算したスコア（backend/services/observation_store.py が書き込む）
+CREATE TABLE IF NOT EXISTS weather_observations (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,               -- current / forecast
+    tile_key TEXT NOT NULL,           -- ジオハッシュ
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    observed_at TIMESTAMPTZ,          -- OpenWeatherMap の dt（予報は NULL）
+    fetched_at TIMESTAMPTZ NOT NULL,
+    payload JSONB NOT NULL,
+    visibility_score INTEGER,
+    visibility_level TEXT,
+    halo_score INTEGER,
+    halo_level TEXT
+);
+
+CREATE INDEX IF NOT EXISTS weather_observations_tile_idx
+    ON weather_observations (tile_key, fetched_at);
@@ -69,6 +69,8 @@ export interface ForecastResponse {
   };
   location: { lat: number; lng: number };
   timestamp: string;
+  // 天気APIから取れず、最後に取れた天気（timestamp の時点）を返している
+  degraded?: boolean;
 }
 
 // 位置情報